@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Synthetic ngspice batch output generator.
+
+Writes files laid out like ``ngspice -b -o`` writes ``.print`` results: a
+``Circuit:`` header, a ``No. of Data Rows`` line per analysis and, for every
+group of columns that fits the output width, a table with title, analysis and
+date line, dashed headers and ``\\f`` separated pages.
+
+Usage:
+    python ngspice_output.py ROWS COLUMNS OUTPUT_FILE [ANALYSIS]
+"""
+
+from __future__ import print_function
+
+import sys
+
+import numpy
+
+SCALE_NAMES = {"Transient Analysis": "time",
+               "AC Analysis": "frequency",
+               "DC transfer characteristic": "v-sweep"}
+
+DATE = "Mon Jun  8 23:05:46  2015"
+DASHES = "-" * 80
+
+
+def _scale(analysis, start, stop, rows):
+    """Returns scale values of rows start to stop."""
+    index = numpy.arange(start, stop, dtype=numpy.float64)
+    if analysis == "AC Analysis":
+        return 10.0 ** (1.0 + 6.0 * index / max(rows - 1, 1))
+    elif analysis == "DC transfer characteristic":
+        return -5.0 + 10.0 * index / max(rows - 1, 1)
+    else:
+        return index * 1e-9
+
+
+def _signal(scale, column):
+    """Returns values of dependent column for scale values."""
+    return numpy.sin(scale * (1e6 * column)) * column + 1e-3 * numpy.cos(scale * 1e9)
+
+
+def write_output(f, rows, columns=4, analysis="Transient Analysis", title="* benchmark circuit",
+                 page_rows=50, table_columns=3, page_titles=False):
+    """Writes synthetic ngspice output of a .print statement.
+
+    Args:
+        f: File object opened in binary mode.
+        rows: Number of simulated points.
+        columns: Number of printed dependent vectors.
+        analysis: Analysis name, one of ``SCALE_NAMES`` keys.
+        title: Circuit title.
+        page_rows: Rows per page.
+        table_columns: Dependent vectors per table. ngspice splits wider
+            prints in several tables, each one starting with the scale.
+        page_titles: If True, continuation pages repeat title and an
+            indented analysis line, like some ngspice versions do.
+    """
+    def write(text):
+        f.write(text.encode("utf-8"))
+
+    write("\nCircuit: {0}\n\n".format(title))
+    write("Doing analysis at TEMP = 27.000000 and TNOM = 27.000000\n\n")
+    write("No. of Data Rows : {0}\n".format(rows))
+
+    names = ["v(n{0})".format(i) for i in range(1, columns + 1)]
+    for first in range(0, columns, table_columns):
+        table_indices = list(range(first + 1, min(first + table_columns, columns) + 1))
+        headers = "Index   " + "".join("{0:<16}".format(name)
+                                        for name in [SCALE_NAMES[analysis]] + names[first:first + table_columns])
+        table_header = "{0}\n{1}\n{0}\n".format(DASHES, headers)
+        write("{0:^80}\n{1}  {2}\n{3}".format(title, analysis, DATE, table_header))
+
+        row_format = "%d\t" + "%e\t" * (len(table_indices) + 1) + "\n"
+        for start in range(0, rows, page_rows):
+            stop = min(start + page_rows, rows)
+            if start > 0:
+                write("\f\n")
+                if page_titles:
+                    write("{0:^80}\n    {1}  {2}\n".format(title, analysis, DATE))
+                write(table_header)
+            scale = _scale(analysis, start, stop, rows)
+            block = numpy.empty((stop - start, len(table_indices) + 2))
+            block[:, 0] = numpy.arange(start, stop)
+            block[:, 1] = scale
+            for i, column in enumerate(table_indices):
+                block[:, i + 2] = _signal(scale, column)
+            write((row_format * (stop - start)) % tuple(block.ravel()))
+        write("\n")
+    write("\n")
+
+
+def generate(path, rows, columns=4, analysis="Transient Analysis", **kwargs):
+    """Writes synthetic ngspice output file.
+
+    Args:
+        path: Output file path.
+        rows: Number of simulated points.
+        columns: Number of printed dependent vectors.
+        analysis: Analysis name.
+        kwargs: Other ``write_output`` arguments.
+    """
+    with open(path, "wb") as f:
+        write_output(f, rows, columns, analysis, **kwargs)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5):
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    generate(sys.argv[3], int(sys.argv[1]), int(sys.argv[2]), *sys.argv[4:5])
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simulation output benchmarks.
+
+Times ``NgspiceOutput`` on synthetic ngspice output files and reports
+throughput and peak memory. ngspice is not needed.
+
+Phases:
+    index: ``NgspiceOutput.parse_file()``, output is mapped and every table
+        is located by ``_parse()``.
+    load: Table bodies are parsed into numpy arrays.
+    figure: ``get_figure()``.
+    draw: Figure is rendered with matplotlib Agg backend.
+    csv: ``save_csv()``.
+
+Every case runs in its own process, so peak memory of one case does not hide
+the next one. Peak memory is measured with ``tracemalloc`` in a separate run
+of each phase, because tracing slows timed code down. It is only reported on
+Python 3.
+
+Before timing anything, multi-page outputs of every analysis are parsed both
+from a mapped file and from text, and the run fails if results differ. It
+also fails if netlists of a Monte Carlo sweep do not use the parameter values
+it reports.
+
+Results are compared with a baseline file and the run fails if any time or
+peak memory is more than ``--tolerance`` worse. Baselines depend on the
+machine, so they should be saved with ``--save-baseline`` on the machine
+running the comparison. The run fails if there is no baseline.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gettext
+import json
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+import ngspice_output
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+SPICEGUI_PATH = os.path.join(os.path.dirname(BENCHMARKS_PATH), "spicegui")
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_PATH, "baseline.json")
+
+PHASES = ["index", "load", "figure", "draw", "csv"]
+# (rows, columns) of default cases
+DEFAULT_CASES = [(10 ** 3, 4), (10 ** 4, 4), (10 ** 5, 4), (10 ** 6, 4), (10 ** 5, 32)]
+# Differences below these are noise, whatever the tolerance is
+ABSOLUTE_SLACK = {"seconds": 0.005, "peak_bytes": 1048576}
+
+
+def _setup_phase(phase, path, temp_dir):
+    """Runs everything phase depends on.
+
+    Returns:
+        A function running the phase itself.
+    """
+    from ngspice_simulation import NgspiceOutput
+
+    if phase == "index":
+        return lambda: NgspiceOutput.parse_file(path)
+
+    output = NgspiceOutput.parse_file(path)
+    if phase == "load":
+        return lambda: [table.data_lines for table in output.tables]
+
+    for table in output.tables:
+        table.data_lines
+    if phase == "figure":
+        return output.get_figure
+    elif phase == "draw":
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        figure = output.get_figure()
+        return lambda: FigureCanvasAgg(figure).draw()
+    elif phase == "csv":
+        return lambda: output.save_csv(os.path.join(temp_dir, "output.csv"))
+    else:
+        raise ValueError("Unknown phase: " + phase)
+
+
+def run_case(path, phases, repeat):
+    """Benchmarks phases on an output file in this process.
+
+    Returns:
+        Dictionary mapping phase names to ``{"seconds": best time,
+        "peak_bytes": peak traced memory or None}`` or to ``{"error":
+        message}``.
+    """
+    sys.path.insert(0, SPICEGUI_PATH)
+    gettext.install("spicegui")
+
+    results = {}
+    temp_dir = tempfile.mkdtemp(prefix="spicegui-benchmark-")
+    try:
+        for phase in phases:
+            try:
+                best = None
+                for i in range(repeat):
+                    run = _setup_phase(phase, path, temp_dir)
+                    start = timeit.default_timer()
+                    run()
+                    elapsed = timeit.default_timer() - start
+                    best = elapsed if best is None else min(best, elapsed)
+
+                peak = None
+                if tracemalloc is not None:
+                    run = _setup_phase(phase, path, temp_dir)
+                    tracemalloc.start()
+                    try:
+                        run()
+                        peak = tracemalloc.get_traced_memory()[1]
+                    finally:
+                        tracemalloc.stop()
+                results[phase] = {"seconds": best, "peak_bytes": peak}
+            except Exception as e:
+                results[phase] = {"error": "{0}: {1}".format(type(e).__name__, e)}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+def check_parsers(data_dir):
+    """Parses small multi-page outputs through both parsing paths.
+
+    Continuation pages repeat the title and an indented analysis line.
+
+    Returns:
+        List of descriptions of differences between ``parse_file()`` and
+        ``NgspiceOutput(text)`` results.
+    """
+    import numpy
+
+    sys.path.insert(0, SPICEGUI_PATH)
+    gettext.install("spicegui")
+    from ngspice_simulation import NgspiceOutput
+
+    problems = []
+    for analysis in sorted(ngspice_output.SCALE_NAMES):
+        path = os.path.join(data_dir, "pages.out")
+        ngspice_output.generate(path, 7, 5, analysis, page_rows=2, page_titles=True)
+        with open(path) as f:
+            text = f.read()
+        mapped = NgspiceOutput.parse_file(path)
+        parsed = NgspiceOutput(text)
+        for mapped_line, parsed_line in zip(mapped.data_lines, parsed.data_lines):
+            if (mapped_line.name != parsed_line.name or
+                    not numpy.array_equal(mapped_line.values, parsed_line.values)):
+                problems.append("{0}: {1} differs between mapped file ({2} rows) and text ({3} rows)".format(
+                    analysis, mapped_line.name, len(mapped_line.values), len(parsed_line.values)))
+        if len(mapped.data_lines) != len(parsed.data_lines):
+            problems.append("{0}: {1} columns in mapped file, {2} in text".format(
+                analysis, len(mapped.data_lines), len(parsed.data_lines)))
+    return problems
+
+
+def check_sweep_variants(data_dir):
+    """Checks that sweep variants use the parameter values of the result.
+
+    Returns:
+        List of descriptions of runs whose ``.param`` values differ.
+    """
+    import numpy
+
+    sys.path.insert(0, SPICEGUI_PATH)
+    import parameter_sweep
+    from ngspice_simulation import Netlist
+
+    path = os.path.join(data_dir, "sweep.cir")
+    with open(path, "w") as f:
+        f.write("sweep\n.param r1=1 c1=1n\nR1 in out {r1}\nC1 out 0 {c1}\n.end\n")
+    sweep = parameter_sweep.ParameterSweep(path, {"r1": parameter_sweep.Uniform(1, 2), "c1": [1e-9, 2e-9]},
+                                           runs=3)
+    names, values = sweep.get_parameter_values()
+    problems = []
+    for run, source in sweep.get_variants(names, values):
+        parameters = Netlist(source).get_parameters()
+        used = [Netlist.parse_number(parameters[name]) for name in names]
+        if not numpy.allclose(used, values[run]):
+            problems.append("run {0}: .param values {1}, reported {2}".format(run, used, list(values[run])))
+    return problems
+
+
+def case_name(rows, columns):
+    return "{0}x{1}".format(rows, columns)
+
+
+def get_output_file(data_dir, rows, columns):
+    """Returns path of a synthetic output file, generating it if needed."""
+    path = os.path.join(data_dir, "{0}.out".format(case_name(rows, columns)))
+    if not os.path.exists(path):
+        ngspice_output.generate(path + ".tmp", rows, columns)
+        os.rename(path + ".tmp", path)
+    return path
+
+
+def compare(results, baseline, tolerance):
+    """Returns list of regression descriptions."""
+    regressions = []
+    for case, phases in sorted(results.items()):
+        for phase, result in sorted(phases.items()):
+            if "error" in result:
+                regressions.append("{0} {1}: {2}".format(case, phase, result["error"]))
+                continue
+            reference = baseline.get(case, {}).get(phase)
+            if reference is None or "error" in reference:
+                continue
+            for key, slack in ABSOLUTE_SLACK.items():
+                if result.get(key) is not None and reference.get(key) is not None:
+                    if result[key] > reference[key] * (1.0 + tolerance) + slack:
+                        regressions.append("{0} {1}: {2} {3:.4g} > {4:.4g}".format(case, phase, key, result[key],
+                                                                                     reference[key]))
+    return regressions
+
+
+def print_report(results, sizes):
+    print("{0:<14}{1:<8}{2:>12}{3:>16}{4:>14}".format("case", "phase", "time [s]", "throughput", "peak [MiB]"))
+    for case, phases in sorted(results.items(), key=lambda item: sizes[item[0]]):
+        file_size, rows = sizes[case]
+        for phase in sorted(phases, key=lambda phase: PHASES.index(phase) if phase in PHASES else len(PHASES)):
+            result = phases[phase]
+            if "error" in result:
+                print("{0:<14}{1:<8}  {2}".format(case, phase, result["error"]))
+                continue
+            seconds = result["seconds"]
+            if phase in ("index", "load"):
+                throughput = "{0:.1f} MiB/s".format(file_size / 1048576.0 / seconds) if seconds else "-"
+            else:
+                throughput = "{0:.3g} rows/s".format(rows / seconds) if seconds else "-"
+            if result["peak_bytes"] is not None:
+                peak = "{0:.1f}".format(result["peak_bytes"] / 1048576.0)
+            else:
+                peak = "-"
+            print("{0:<14}{1:<8}{2:>12.4f}{3:>16}{4:>14}".format(case, phase, seconds, throughput, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulation output parsing and export.")
+    parser.add_argument("--rows", type=int, nargs="+",
+                        help="rows of each case, from 1000 to 10000000 (default: built-in cases)")
+    parser.add_argument("--columns", type=int, default=4, help="dependent columns of --rows cases")
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=PHASES)
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each phase, best time is kept")
+    parser.add_argument("--data-dir", help="folder to keep generated output files in")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="save results as baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression (default: 0.25)")
+    parser.add_argument("--case", help=argparse.SUPPRESS)  # Output file of a child process run
+    args = parser.parse_args()
+
+    if args.case is not None:
+        json.dump(run_case(args.case, args.phases, args.repeat), sys.stdout)
+        return 0
+
+    if args.rows:
+        cases = [(rows, args.columns) for rows in args.rows]
+    else:
+        cases = DEFAULT_CASES
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="spicegui-benchmark-data-")
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    env = dict(os.environ)
+    try:
+        # get_figure() reads settings, which need a compiled schema
+        schema_dir = os.path.join(data_dir, "schemas")
+        if not os.path.isdir(schema_dir):
+            os.makedirs(schema_dir)
+        shutil.copy(os.path.join(SPICEGUI_PATH, "data", "org.rafael1193.spicegui.gschema.xml"), schema_dir)
+        try:
+            subprocess.check_call(["glib-compile-schemas", schema_dir])
+            env["GSETTINGS_SCHEMA_DIR"] = schema_dir
+        except (OSError, subprocess.CalledProcessError):
+            print("WARNING: glib-compile-schemas failed, installed schema is used", file=sys.stderr)
+        env["MPLBACKEND"] = "Agg"
+
+        problems = check_parsers(data_dir)
+        for problem in problems:
+            print("PARSER MISMATCH:", problem, file=sys.stderr)
+        if problems:
+            return 1
+        problems = check_sweep_variants(data_dir)
+        for problem in problems:
+            print("SWEEP MISMATCH:", problem, file=sys.stderr)
+        if problems:
+            return 1
+
+        results = {}
+        sizes = {}
+        for rows, columns in cases:
+            name = case_name(rows, columns)
+            path = get_output_file(data_dir, rows, columns)
+            sizes[name] = (os.path.getsize(path), rows)
+            command = [sys.executable, os.path.abspath(__file__), "--case", path, "--repeat", str(args.repeat),
+                       "--phases"] + args.phases
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, env=env)
+            stdout = process.communicate()[0]
+            if process.returncode != 0:
+                results[name] = {"process": {"error": "exit status {0}".format(process.returncode)}}
+            else:
+                results[name] = json.loads(stdout.decode("utf-8"))
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_report(results, sizes)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Baseline saved to", args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        # Nothing would ever be compared otherwise
+        print("ERROR: no baseline found in", args.baseline + ", save one with --save-baseline", file=sys.stderr)
+        return 1
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION:", regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Start-up time benchmark.
+
+Launches SpiceGUI in a new process until its first window is drawn, several
+times, and reports the median wall clock time. The application quits by
+itself thanks to ``SPICEGUI_PROFILE_STARTUP=exit``, see
+``spicegui/startup_profiler.py``. A display is needed and no other SpiceGUI
+instance may be running, or the launched one would just ask it for a window.
+
+The run fails if the median time is over ``--budget`` seconds or more than
+``--tolerance`` worse than the baseline saved with ``--save-baseline``. It
+also fails, before launching anything, if there is neither a budget nor a
+baseline.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import timeit
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+SPICEGUI_PATH = os.path.join(os.path.dirname(BENCHMARKS_PATH), "spicegui")
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_PATH, "startup_baseline.json")
+# Differences below this are noise, whatever the tolerance is
+ABSOLUTE_SLACK = 0.02
+# Seconds a launch may take before it is considered hung
+LAUNCH_TIMEOUT = 60
+
+
+def launch(files, env):
+    """Launches SpiceGUI once and waits for it to quit.
+
+    Returns:
+        (seconds, start-up report printed by the application).
+
+    Raises:
+        RuntimeError: If application failed or did not quit in time.
+    """
+    command = [sys.executable, os.path.join(SPICEGUI_PATH, "__init__.py")] + files
+    start = timeit.default_timer()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    # communicate() has no timeout on Python 2
+    watchdog = threading.Timer(LAUNCH_TIMEOUT, process.kill)
+    watchdog.start()
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        watchdog.cancel()
+    elapsed = timeit.default_timer() - start
+    stderr = stderr.decode("utf-8", "replace")
+    if elapsed >= LAUNCH_TIMEOUT:
+        raise RuntimeError("SpiceGUI did not quit in {0} seconds".format(LAUNCH_TIMEOUT))
+    if process.returncode != 0:
+        raise RuntimeError("exit status {0}\n{1}".format(process.returncode, stderr))
+    return elapsed, stderr
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SpiceGUI start-up time.")
+    parser.add_argument("files", nargs="*", metavar="FILE", help="files opened at start-up")
+    parser.add_argument("--repeat", type=int, default=5, help="launches, median time is kept")
+    parser.add_argument("--budget", type=float, help="maximum median seconds")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="save results as baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression (default: 0.25)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="print start-up breakdown of the last launch")
+    args = parser.parse_args()
+    if not args.save_baseline and args.budget is None and not os.path.exists(args.baseline):
+        # Nothing would ever be compared otherwise
+        print("ERROR: no baseline found in", args.baseline + ", save one with --save-baseline or give --budget",
+              file=sys.stderr)
+        return 1
+
+    env = dict(os.environ)
+    env["SPICEGUI_PROFILE_STARTUP"] = "exit"
+    schema_dir = tempfile.mkdtemp(prefix="spicegui-benchmark-schemas-")
+    try:
+        shutil.copy(os.path.join(SPICEGUI_PATH, "data", "org.rafael1193.spicegui.gschema.xml"), schema_dir)
+        try:
+            subprocess.check_call(["glib-compile-schemas", schema_dir])
+            env["GSETTINGS_SCHEMA_DIR"] = schema_dir
+        except (OSError, subprocess.CalledProcessError):
+            print("WARNING: glib-compile-schemas failed, installed schema is used", file=sys.stderr)
+
+        times = []
+        report = ""
+        for i in range(args.repeat):
+            try:
+                elapsed, report = launch([os.path.abspath(path) for path in args.files], env)
+            except RuntimeError as e:
+                print("ERROR:", e, file=sys.stderr)
+                return 1
+            times.append(elapsed)
+    finally:
+        shutil.rmtree(schema_dir, ignore_errors=True)
+
+    if args.verbose:
+        print(report, end="")
+    result = {"first": times[0], "median": median(times), "best": min(times)}
+    print("{0:<10}{1:>12}".format("launch", "time [s]"))
+    for key in ("first", "median", "best"):
+        print("{0:<10}{1:>12.3f}".format(key, result[key]))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print("Baseline saved to", args.baseline)
+        return 0
+
+    regressions = []
+    if args.budget is not None and result["median"] > args.budget:
+        regressions.append("median {0:.3f} s > budget {1:.3f} s".format(result["median"], args.budget))
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            reference = json.load(f)["median"]
+        if result["median"] > reference * (1.0 + args.tolerance) + ABSOLUTE_SLACK:
+            regressions.append("median {0:.3f} s > baseline {1:.3f} s".format(result["median"], reference))
+    for regression in regressions:
+        print("REGRESSION:", regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
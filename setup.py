@@ -26,6 +26,7 @@ from setuptools import find_packages
 
 from distutils.core import setup
 from distutils.command.build import build
+from distutils.command.build_py import build_py
 from distutils.command.install_data import install_data
 
 import subprocess
@@ -43,6 +44,9 @@ __license__ = "GPL3"
 
 dependencies = []
 
+# Modules using syntax of newer Python versions, as (package, module, version)
+NEWER_PYTHON_MODULES = [("spicegui", "ngspice_asyncio", (3, 5))]
+
 
 class MyBuild(build):
 
@@ -62,6 +66,16 @@ class MyBuild(build):
         build.run(self)
 
 
+class MyBuildPy(build_py):
+
+    def find_package_modules(self, package, package_dir):
+        # Left out of builds they cannot be byte-compiled by, like python2 ones
+        modules = build_py.find_package_modules(self, package, package_dir)
+        excluded = [(module_package, module) for module_package, module, version in NEWER_PYTHON_MODULES
+                    if sys.version_info < version]
+        return [item for item in modules if (item[0], item[1]) not in excluded]
+
+
 class MyInstallData(install_data):
 
     def update_icon_cache(self):
@@ -131,6 +145,7 @@ params = {
     "entry_points": {
         'console_scripts': [
             'spicegui = spicegui:start',
+            'spicegui-batch = spicegui.batch:main',
         ],
         'gui_scripts': [
             'spicegui = spicegui:start',
@@ -138,6 +153,7 @@ params = {
     },
 
     'cmdclass': {'build': MyBuild,
+                 'build_py': MyBuildPy,
                  'install_data': MyInstallData}
 }
 
@@ -14,6 +14,7 @@ Requires:       python3
 Requires:       python3-gobject
 Requires:       python3-matplotlib
 Requires:       python3-matplotlib-gtk3
+Requires:       python3-numpy
 Requires:       gtk3
 Requires:       glib2
 Requires:       gtksourceview3
@@ -44,7 +44,17 @@ def get_locale_path():
         raise IOError("Locale path not found.")
 
 def start():
-    """Starts SpiceGUI application."""
+    """Starts SpiceGUI application.
+
+    If ``SPICEGUI_PROFILE_STARTUP`` environment variable is set, a start-up
+    time breakdown is printed once the window is drawn, see
+    ``startup_profiler``.
+    """
+    import startup_profiler
+    profile = os.environ.get(startup_profiler.ENVIRONMENT_VARIABLE)
+    if profile:
+        startup_profiler.enable(exit_when_done=profile == "exit")
+
     import gettext
     import locale
 
@@ -56,9 +66,11 @@ def start():
     locale.bindtextdomain(domain, locale_path)
     locale.textdomain(domain)
     locale.setlocale(locale.LC_ALL, '')
+    startup_profiler.mark("locale")
 
     import application
     import sys
+    startup_profiler.mark("imports")
     app = application.SpiceGUI()
     app.run(sys.argv)
 
@@ -27,13 +27,14 @@ from __future__ import print_function
 
 import os
 import os.path
-import webbrowser
 
 from gi.repository import Gio, Gtk
 
 import config
 import gui
 import preferences_gui
+import run_directory
+import startup_profiler
 
 
 class SpiceGUI(Gtk.Application):
@@ -66,6 +67,12 @@ class SpiceGUI(Gtk.Application):
         """
         Gtk.Application.do_startup(self)
 
+        # Outputs of runs of crashed instances are in memory until reboot
+        try:
+            run_directory.remove_orphans()
+        except (IOError, OSError):
+            pass
+
         self.builder.add_from_file(os.path.join(os.path.dirname(__file__), "data", "menu.ui"))
 
         appmenu = self.builder.get_object('appmenu')
@@ -92,6 +99,7 @@ class SpiceGUI(Gtk.Application):
         self.add_action(quit_action)
 
         self.set_accels_for_action("win.save", ["<Primary>S"]);
+        startup_profiler.mark("application startup")
 
     def on_activate(self, app):
         """Starts SpiceGUI.
@@ -102,8 +110,11 @@ class SpiceGUI(Gtk.Application):
             app: Appliction.
         """
         window = gui.MainWindow()
+        startup_profiler.mark("main window")
+        startup_profiler.watch_window(window)
         app.add_window(window)
         window.show_all()
+        startup_profiler.mark("show")
 
     def on_open(self, app, files, hint, user_data):
         """Opens circuit file from command line.
@@ -118,8 +129,11 @@ class SpiceGUI(Gtk.Application):
         """
         for _file in files:
             window = gui.MainWindow(_file.get_path())
+            startup_profiler.mark("main window")
+            startup_profiler.watch_window(window)
             app.add_window(window)
             window.show_all()
+            startup_profiler.mark("show")
 
     def on_new_action(self, action, parameter):
         """Opens new SpiceGUI window.
@@ -152,6 +166,8 @@ class SpiceGUI(Gtk.Application):
             action: GAction.
             parameter: The parameter to the activation.
         """
+        import webbrowser
+
         webbrowser.open(config.HELP_URL)
 
     def on_about_action(self, action, parameter):
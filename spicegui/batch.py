@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Headless simulation of netlists and schematics.
+
+``spicegui-batch`` simulates every file given on the command line, writes
+results to the output folder and prints a JSON summary. GTK and matplotlib
+are never imported, so it runs without a display.
+
+Usage:
+    spicegui-batch [-o DIR] [-f FORMAT] [-j JOBS] FILE...
+
+Exit status is 0 if every simulation succeeded, 1 otherwise.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gettext
+import json
+import os
+import os.path
+import re
+import shutil
+import sys
+import timeit
+
+import config
+
+# Data formats of data_export, hdf5 and parquet need optional modules
+OUTPUT_FORMATS = ("csv", "npz", "hdf5", "parquet", "raw", "out")
+
+
+def get_parser():
+    """Returns command line parser."""
+    parser = argparse.ArgumentParser(prog="spicegui-batch",
+                                     description="Simulates spice netlists and gschem schematics with ngspice.")
+    parser.add_argument("files", nargs="+", metavar="FILE",
+                        help="netlist or schematic (.sch) file")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="folder results are written to (default: current folder)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="csv",
+                        help="results format: data of every analysis, the binary rawfile or the ngspice "
+                             "output file (default: csv)")
+    parser.add_argument("-s", "--summary", default="-",
+                        help="JSON summary file, - is standard output (default: -)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="simultaneous simulations (default: number of processors)")
+    parser.add_argument("--cpu-time", type=float, default=None, metavar="SECONDS",
+                        help="CPU time limit of each simulation")
+    parser.add_argument("--wall-time", type=float, default=None, metavar="SECONDS",
+                        help="wall clock time limit of each simulation")
+    parser.add_argument("--memory", type=int, default=None, metavar="MIB",
+                        help="memory limit of each simulation")
+    parser.add_argument("-p", "--progress", action="store_true",
+                        help="report progress of running simulations on standard error")
+    return parser
+
+
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def _print_progress(name):
+    last = [0.0]
+
+    def on_progress(progress):
+        now = timeit.default_timer()
+        if now - last[0] >= 1.0 or progress.fraction == 1.0:
+            last[0] = now
+            print("{0}: {1}".format(name, progress), file=sys.stderr)
+
+    return on_progress
+
+
+def write_results(job, name, output_dir, output_format):
+    """Writes results of a finished job.
+
+    Returns:
+        List of {"path", "analysis"} dictionaries of written files.
+    """
+    if output_format in ("raw", "out"):
+        source = job.rawfile_path if output_format == "raw" else job.output_path
+        path = os.path.join(output_dir, name + "." + output_format)
+        shutil.copyfile(source, path)
+        return [{"path": path, "analysis": None}]
+
+    import data_export
+
+    extension = data_export.get_format(output_format).extension
+    output = job.get_output()
+    analyses = output.analyses
+    written = []
+    for analysis in analyses:
+        output.select_analysis(analysis)
+        if len(analyses) == 1:
+            path = os.path.join(output_dir, name + extension)
+        else:
+            path = os.path.join(output_dir, "{0}.{1}{2}".format(name, _slug(analysis), extension))
+        data_export.export(path, output.data_lines, output_format)
+        written.append({"path": path, "analysis": analysis})
+    return written
+
+
+def run(args):
+    """Simulates files of parsed command line arguments.
+
+    Returns:
+        Summary dictionary.
+    """
+    from gnetlist_cache import SchematicConverter
+    from ngspice_process import ExecutionError
+    from process_limits import ResourceLimits
+    from run_directory import RunDirectory
+    from simulation_scheduler import SimulationScheduler
+
+    limits = ResourceLimits(args.cpu_time, args.wall_time,
+                            args.memory * 1024 * 1024 if args.memory else None)
+    scheduler = SimulationScheduler(args.jobs, binary_rawfile=args.format == "raw", limits=limits)
+    converter = None
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    runs = []
+    netlist_dirs = []
+    try:
+        # Schematics are converted in parallel first, unchanged ones come from cache
+        pending = []
+        for path in args.files:
+            name = os.path.splitext(os.path.basename(path))[0]
+            entry = {"file": os.path.abspath(path), "name": name, "state": None, "error": None, "outputs": [],
+                     "report": None}
+            runs.append((entry, None))
+            if not os.path.isfile(path):
+                entry.update(state="failed", error="No such file")
+                continue
+            netlist_path = path
+            conversion = None
+            if os.path.splitext(path)[1] == ".sch":
+                if converter is None:
+                    converter = SchematicConverter(args.jobs)
+                netlist_dir = RunDirectory(path)
+                netlist_dirs.append(netlist_dir)
+                netlist_path = os.path.join(netlist_dir.path, os.path.basename(path) + ".net")
+                conversion = converter.convert(path, netlist_path)
+            pending.append((len(runs) - 1, path, netlist_path, conversion))
+
+        for index, path, netlist_path, conversion in pending:
+            entry = runs[index][0]
+            if conversion is not None:
+                conversion.wait()
+                if conversion.error is not None:
+                    entry.update(state="failed", error=str(conversion.error))
+                    continue
+            # Relative included files are looked for next to the given file
+            job = scheduler.submit(netlist_path, cwd=os.path.dirname(os.path.abspath(path)))
+            if args.progress:
+                job.progress.add_callback(_print_progress(entry["name"]))
+            runs[index] = (entry, job)
+
+        for entry, job in runs:
+            if job is None:
+                continue
+            job.wait()
+            entry["state"] = job.state
+            entry["report"] = job.report.as_dict() if job.report is not None else None
+            error = job.exception()
+            if error is None:
+                try:
+                    entry["outputs"] = write_results(job, entry["name"], args.output_dir, args.format)
+                except (ExecutionError, ValueError, ImportError, IOError, OSError) as e:
+                    entry.update(state=job.FAILED, error=str(e))
+            else:
+                entry["error"] = str(error)
+            job.remove_outputs()
+    finally:
+        scheduler.shutdown(cancel=True)
+        if converter is not None:
+            converter.shutdown()
+        for netlist_dir in netlist_dirs:
+            netlist_dir.remove()
+
+    return {"format": args.format,
+            "succeeded": sum(1 for entry, job in runs if entry["state"] == "done"),
+            "failed": sum(1 for entry, job in runs if entry["state"] != "done"),
+            "runs": [entry for entry, job in runs]}
+
+
+def main(argv=None):
+    """Runs ``spicegui-batch`` command.
+
+    Args:
+        argv: Command line arguments. Default is ``sys.argv[1:]``.
+
+    Returns:
+        Exit status.
+    """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if args.format not in ("raw", "out"):
+        # Checked here, data_export imports numpy and would slow down --help
+        import data_export
+
+        available = [export_format.name for export_format in data_export.get_available_formats()]
+        if args.format not in available:
+            parser.error("format {0} needs {1}, which is not installed".format(
+                args.format, data_export.get_format(args.format).module))
+    # Messages of simulation modules are translated
+    gettext.install(config.DOMAIN, os.path.join(os.path.dirname(os.path.abspath(__file__)), "locale"))
+
+    try:
+        summary = run(args)
+    except KeyboardInterrupt:
+        return 130
+    text = json.dumps(summary, indent=2, sort_keys=True)
+    if args.summary == "-":
+        print(text)
+    else:
+        with open(args.summary, "w") as f:
+            f.write(text + "\n")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
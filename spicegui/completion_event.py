@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Event telling interested parties when a background task ends."""
+
+from threading import Event, Lock
+
+
+class CompletionEvent(object):
+    """``threading.Event`` that also calls callbacks when it is set.
+
+    Callbacks run in the thread calling ``set()``. GUI code should hand work
+    over to the main loop, with ``GObject.idle_add()`` for instance.
+    """
+
+    def __init__(self):
+        """Inits CompletionEvent, not set."""
+        self._event = Event()
+        self._callbacks = []
+        self._lock = Lock()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Waits for event to be set.
+
+        Returns:
+            True if it is set, False on timeout.
+        """
+        self._event.wait(timeout)
+        return self._event.is_set()
+
+    def clear(self):
+        self._event.clear()
+
+    def set(self):
+        """Sets event and calls every callback."""
+        with self._lock:
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """Calls callback() every time event is set from now on."""
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
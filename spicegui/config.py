@@ -32,6 +32,12 @@ VERSION = "1.0"
 PROGRAM_WEBSITE = "https://rafael1193.github.io/spicegui/"
 
 
+def get_cache_path():
+    """Returns SpiceGUI user cache folder path."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, PROGRAM_NAME_LOWER)
+
+
 def csd_are_supported():
     sessionType = os.environ.get('XDG_CURRENT_DESKTOP')
     if sessionType == "GNOME" or sessionType == "LXDE":
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simulation data export.
+
+Data is written in blocks of rows, so exporting large results needs little
+memory besides the results themselves. HDF5 and Parquet formats are only
+available when h5py and pyarrow packages are installed.
+"""
+
+import collections
+import os
+import tempfile
+import zipfile
+
+import numpy
+from threading import Event, Lock, Thread
+
+from completion_event import CompletionEvent
+
+CHUNK_ROWS = 65536
+
+ExportFormat = collections.namedtuple("ExportFormat", ["name", "description", "mime_type", "extension", "module"])
+
+FORMATS = [ExportFormat("csv", "Comma-separated values", "text/csv", ".csv", None),
+           ExportFormat("npz", "NumPy arrays", "application/octet-stream", ".npz", None),
+           ExportFormat("hdf5", "HDF5", "application/x-hdf5", ".h5", "h5py"),
+           ExportFormat("parquet", "Apache Parquet", "application/vnd.apache.parquet", ".parquet", "pyarrow")]
+
+
+class ExportCancelled(Exception):
+    """Export was cancelled."""
+    pass
+
+
+def get_available_formats():
+    """Returns list of ExportFormat whose required modules are installed."""
+    available = []
+    for export_format in FORMATS:
+        if export_format.module is not None:
+            try:
+                __import__(export_format.module)
+            except ImportError:
+                continue
+        available.append(export_format)
+    return available
+
+
+def get_format(name):
+    """Returns ExportFormat named name.
+
+    Raises:
+        ValueError: If there is no such format.
+    """
+    for export_format in FORMATS:
+        if export_format.name == name:
+            return export_format
+    raise ValueError("Unknown export format: " + str(name))
+
+
+def export(file_path, data_lines, format_name="csv", columns=None, xmin=None, xmax=None, progress=None,
+           cancelled=None):
+    """Exports simulation data.
+
+    If export fails or is cancelled, the partially written file is removed.
+
+    Args:
+        file_path: Output file path.
+        data_lines: List of ``NgspiceOutput.DataLine``.
+        format_name: Name of one of ``FORMATS``.
+        columns: Names of exported data lines. If it is None, every one is
+            exported.
+        xmin: Only rows whose independent value is not lower are exported.
+            None means no lower limit.
+        xmax: Only rows whose independent value is not greater are exported.
+            None means no upper limit.
+        progress: Function called with the exported fraction, from 0 to 1.
+        cancelled: ``threading.Event`` cancelling export when set.
+
+    Raises:
+        ExportCancelled: If cancelled was set.
+        ValueError: If format or columns are not valid.
+    """
+    writer = _WRITERS[get_format(format_name).name]
+
+    if columns is not None:
+        names = [data_line.name for data_line in data_lines]
+        for name in columns:
+            if name not in names:
+                raise ValueError("Unknown column: " + str(name))
+        selected = [data_line for data_line in data_lines if data_line.name in columns]
+    else:
+        selected = list(data_lines)
+
+    rows = slice(0, len(data_lines[0].values) if data_lines else 0)
+    if xmin is not None or xmax is not None:
+        for data_line in data_lines:
+            if data_line.independent:
+                rows = _select_rows(data_line.values, xmin, xmax)
+                break
+
+    def report(fraction):
+        if cancelled is not None and cancelled.is_set():
+            raise ExportCancelled()
+        if progress is not None:
+            progress(fraction)
+
+    try:
+        writer(file_path, selected, rows, report)
+    except:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+
+def _select_rows(scale, xmin, xmax):
+    """Returns rows whose scale value is inside [xmin, xmax].
+
+    Returns:
+        A slice if scale is sorted, an array of indices otherwise.
+    """
+    scale = numpy.asarray(scale)
+    if len(scale) < 2 or bool(numpy.all(scale[1:] >= scale[:-1])):
+        start = int(numpy.searchsorted(scale, xmin, "left")) if xmin is not None else 0
+        stop = int(numpy.searchsorted(scale, xmax, "right")) if xmax is not None else len(scale)
+        return slice(start, max(start, stop))
+
+    mask = numpy.ones(len(scale), dtype=bool)
+    if xmin is not None:
+        mask &= scale >= xmin
+    if xmax is not None:
+        mask &= scale <= xmax
+    return numpy.flatnonzero(mask)
+
+
+def _rows_count(rows):
+    if isinstance(rows, slice):
+        return rows.stop - rows.start
+    return len(rows)
+
+
+def _chunks(rows):
+    """Yields (exported fraction after chunk, row selector) for chunks of rows."""
+    count = _rows_count(rows)
+    if isinstance(rows, slice):
+        for start in range(rows.start, rows.stop, CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, rows.stop)
+            yield float(stop - rows.start) / count, slice(start, stop)
+    else:
+        for start in range(0, count, CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, count)
+            yield float(stop) / count, rows[start:stop]
+
+
+def _real_columns(data_lines):
+    """Returns (name, values) list with complex data lines split in real and
+    imaginary parts, named after ngspice ``real()`` and ``imag()`` functions.
+    """
+    columns = []
+    for data_line in data_lines:
+        values = numpy.asarray(data_line.values)
+        if numpy.iscomplexobj(values):
+            columns.append(("real({0})".format(data_line.name), values.real))
+            columns.append(("imag({0})".format(data_line.name), values.imag))
+        else:
+            columns.append((data_line.name, values))
+    return columns
+
+
+def _csv_field(text):
+    if any(c in text for c in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def _write_csv(file_path, data_lines, rows, report):
+    columns = _real_columns(data_lines)
+    # Python float repr is the shortest string giving back the same value
+    row_format = ",".join(["%r"] * len(columns)) + "\r\n"
+    block = numpy.empty((min(CHUNK_ROWS, _rows_count(rows)), len(columns)))
+    with open(file_path, "wb") as f:
+        f.write((",".join(_csv_field(name) for name, values in columns) + "\r\n").encode("utf-8"))
+        for fraction, selector in _chunks(rows):
+            chunk = block[:_rows_count(selector)]
+            for i, (name, values) in enumerate(columns):
+                chunk[:, i] = values[selector]
+            f.write(((row_format * len(chunk)) % tuple(chunk.ravel().tolist())).encode("ascii"))
+            report(fraction)
+
+
+def _write_npz(file_path, data_lines, rows, report):
+    # Same layout as numpy.savez, but written one array at a time
+    with zipfile.ZipFile(file_path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for i, data_line in enumerate(data_lines):
+            fd, temp_path = tempfile.mkstemp(suffix=".npy")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    numpy.lib.format.write_array(f, numpy.asarray(data_line.values)[rows])
+                archive.write(temp_path, data_line.name + ".npy")
+            finally:
+                os.remove(temp_path)
+            report(float(i + 1) / len(data_lines))
+
+
+def _write_hdf5(file_path, data_lines, rows, report):
+    import h5py
+
+    with h5py.File(file_path, "w") as f:
+        datasets = []
+        for data_line in data_lines:
+            values = numpy.asarray(data_line.values)
+            # Slashes would create groups
+            dataset = f.create_dataset(data_line.name.replace("/", "_"), (_rows_count(rows),), dtype=values.dtype)
+            dataset.attrs["name"] = data_line.name
+            dataset.attrs["independent"] = bool(data_line.independent)
+            datasets.append((dataset, values))
+
+        done = 0
+        for fraction, selector in _chunks(rows):
+            count = _rows_count(selector)
+            for dataset, values in datasets:
+                dataset[done:done + count] = values[selector]
+            done += count
+            report(fraction)
+
+
+def _write_parquet(file_path, data_lines, rows, report):
+    import pyarrow
+    import pyarrow.parquet
+
+    columns = _real_columns(data_lines)
+    schema = pyarrow.schema([(name, pyarrow.float64()) for name, values in columns])
+    writer = pyarrow.parquet.ParquetWriter(file_path, schema)
+    try:
+        for fraction, selector in _chunks(rows):
+            arrays = [pyarrow.array(numpy.ascontiguousarray(values[selector], dtype=numpy.float64))
+                      for name, values in columns]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            report(fraction)
+    finally:
+        writer.close()
+
+
+_WRITERS = {"csv": _write_csv,
+            "npz": _write_npz,
+            "hdf5": _write_hdf5,
+            "parquet": _write_parquet}
+
+
+class DataExportAsync(object):
+    """Exports simulation data in a background thread.
+
+    Attributes:
+        end_event: Set when export ends, whatever the way.
+        error: Exception raised by export or None.
+        progress: Exported fraction, from 0 to 1.
+    """
+
+    def __init__(self):
+        """Inits DataExportAsync."""
+        self.thread = None
+        self.error = None
+        self.end_event = CompletionEvent()
+        self._cancel_event = Event()
+        self._lock_progress = Lock()
+        self._progress = 0.0
+
+    @property
+    def progress(self):
+        with self._lock_progress:
+            return self._progress
+
+    def _set_progress(self, fraction):
+        with self._lock_progress:
+            self._progress = fraction
+
+    def start(self, file_path, data_lines, format_name="csv", columns=None, xmin=None, xmax=None):
+        """Starts exporting data.
+
+        Arguments are the same as ``export()`` ones.
+        """
+        self.error = None
+        self._progress = 0.0
+        self.end_event.clear()
+        self._cancel_event.clear()
+        self.thread = Thread(group=None, name="export-thread", target=self._run_export,
+                             args=(file_path, data_lines, format_name, columns, xmin, xmax))
+        self.thread.start()
+
+    def _run_export(self, file_path, data_lines, format_name, columns, xmin, xmax):
+        try:
+            export(file_path, data_lines, format_name, columns, xmin, xmax, self._set_progress, self._cancel_event)
+        except Exception as e:
+            self.error = e
+        self.end_event.set()
+
+    def cancel(self):
+        """Cancels export and removes the partially written file."""
+        self._cancel_event.set()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Trace decimation for plot display."""
+
+import numpy
+
+
+class MinMaxDecimator(object):
+    """Min/max envelope decimation of a trace.
+
+    For every bucket of consecutive points, the minimum and maximum points are
+    kept in their original order, so spikes stay visible at any zoom level.
+
+    Envelopes of fixed size buckets are precomputed as a pyramid, each level
+    merging pairs of buckets of the previous one. Decimating any x range only
+    walks the level whose buckets fit the requested width, so its cost depends
+    on the number of output points, not on the number of visible points.
+
+    Attributes:
+        x: Independent data, a numpy array.
+        y: Dependent data, a numpy array of the same length.
+        levels: List of (bucket size, minimum indices, maximum indices).
+    """
+
+    BASE_BUCKET_SIZE = 64
+
+    def __init__(self, x, y):
+        """Inits MinMaxDecimator and builds envelope pyramid.
+
+        Args:
+            x: Independent data.
+            y: Dependent data.
+        """
+        self.x = numpy.asarray(x)
+        self.y = numpy.asarray(y)
+        # x ranges can only be located on sorted data
+        self._sorted = len(self.x) < 2 or bool(numpy.all(self.x[1:] >= self.x[:-1]))
+        self.levels = []
+
+        bucket_size = self.BASE_BUCKET_SIZE
+        if len(self.y) < 2 * bucket_size:
+            return
+
+        imin, imax = self._envelope(0, len(self.y) // bucket_size * bucket_size, bucket_size)
+        self.levels.append((bucket_size, imin, imax))
+        while len(imin) >= 4:
+            pairs = len(imin) // 2 * 2
+            imin = self._merge(imin[:pairs], numpy.less)
+            imax = self._merge(imax[:pairs], numpy.greater)
+            bucket_size *= 2
+            self.levels.append((bucket_size, imin, imax))
+
+    def _merge(self, indices, compare):
+        """Merges pairs of consecutive buckets.
+
+        Args:
+            indices: Extreme indices of an even number of buckets.
+            compare: Element-wise comparison selecting the second index.
+
+        Returns:
+            Extreme indices of merged buckets.
+        """
+        first, second = indices[0::2], indices[1::2]
+        return numpy.where(compare(self.y[second], self.y[first]), second, first)
+
+    def _envelope(self, start, stop, bucket_size):
+        """Computes minimum and maximum indices of raw data buckets.
+
+        Args:
+            start: First index.
+            stop: Last index plus one. ``stop - start`` must be multiple of
+                bucket_size.
+            bucket_size: Points per bucket.
+
+        Returns:
+            (minimum indices, maximum indices)
+        """
+        blocks = self.y[start:stop].reshape(-1, bucket_size)
+        offsets = numpy.arange(start, stop, bucket_size)
+        return blocks.argmin(axis=1) + offsets, blocks.argmax(axis=1) + offsets
+
+    def _partial_envelope(self, start, stop):
+        """Returns minimum and maximum indices of a single bucket."""
+        if stop <= start:
+            return numpy.empty(0, dtype=numpy.intp), numpy.empty(0, dtype=numpy.intp)
+        chunk = self.y[start:stop]
+        return numpy.array([chunk.argmin() + start]), numpy.array([chunk.argmax() + start])
+
+    def decimate(self, xmin=None, xmax=None, width=1000):
+        """Decimates trace points inside an x range.
+
+        Args:
+            xmin: Range start. If it is None, trace start is used.
+            xmax: Range end. If it is None, trace end is used.
+            width: Range width in pixels.
+
+        Returns:
+            (x, y) numpy arrays, with about four points per pixel at most.
+            Points just outside the range are included so lines reach the
+            plot edges.
+        """
+        start, stop = 0, len(self.y)
+        if self._sorted and xmin is not None and xmax is not None:
+            if xmax < xmin:
+                xmin, xmax = xmax, xmin
+            start = max(int(numpy.searchsorted(self.x, xmin, "left")) - 1, 0)
+            stop = min(int(numpy.searchsorted(self.x, xmax, "right")) + 1, len(self.y))
+
+        width = max(int(width), 1)
+        count = stop - start
+        if count <= 4 * width:
+            return self.x[start:stop], self.y[start:stop]
+
+        needed_size = count // width
+        level = None
+        for candidate in self.levels:
+            if candidate[0] > needed_size:
+                break
+            level = candidate
+
+        if level is None:
+            # Fine zoom: a few raw points per pixel
+            bucket_size = needed_size
+            first = start
+            last = start + count // bucket_size * bucket_size
+            imin, imax = self._envelope(first, last, bucket_size)
+        else:
+            bucket_size, level_imin, level_imax = level
+            first_bucket = -(-start // bucket_size)
+            last_bucket = max(min(stop // bucket_size, len(level_imin)), first_bucket)
+            first = first_bucket * bucket_size
+            last = last_bucket * bucket_size
+            imin = level_imin[first_bucket:last_bucket]
+            imax = level_imax[first_bucket:last_bucket]
+
+        head_min, head_max = self._partial_envelope(start, min(first, stop))
+        tail_min, tail_max = self._partial_envelope(max(last, start), stop)
+        imin = numpy.concatenate((head_min, imin, tail_min))
+        imax = numpy.concatenate((head_max, imax, tail_max))
+
+        # Keep every bucket extremes in original order
+        indices = numpy.empty(2 * len(imin) + 2, dtype=numpy.intp)
+        indices[0] = start
+        indices[1:-1:2] = numpy.minimum(imin, imax)
+        indices[2:-1:2] = numpy.maximum(imin, imax)
+        indices[-1] = stop - 1
+        return self.x[indices], self.y[indices]
@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cached and parallel conversion of gschem schematics to netlists.
+
+Every gnetlist run starts Guile and loads every symbol library, which takes
+longer than most simulations. Netlists are cached on disk, keyed by the
+contents of the schematic, of its sub-schematics, of the symbols they use
+and of gEDA configuration files, so converting an unchanged schematic again
+is just a file copy.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import os.path
+import re
+import shutil
+import tempfile
+from threading import Lock, Thread
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import config
+from completion_event import CompletionEvent
+from netlist_dependencies import file_digest
+from ngspice_process import ExecutionError, Gnetlist
+
+BACKEND = "spice-sdb"
+# gEDA installation folders, holding system-gafrc and the sym folder
+SYSTEM_DATA_DIRS = ("/usr/share/gEDA", "/usr/local/share/gEDA")
+RC_FILES = ("gafrc", "gnetlistrc")
+
+# C x y selectable angle mirror basename
+COMPONENT_PATTERN = re.compile(r"^C[ \t]+-?\d+[ \t]+-?\d+[ \t]+\d+[ \t]+-?\d+[ \t]+\d+[ \t]+(\S+)[ \t]*$",
+                               flags=re.MULTILINE)
+SOURCE_PATTERN = re.compile(r"^source=(.+)$", flags=re.MULTILINE)
+# (component-library "dir") and friends in rc files
+LIBRARY_PATTERN = re.compile(r"""\((component|source)-library(-search)?[ \t]+"([^"]+)\"""")
+
+_system_symbols = None
+_system_symbols_lock = Lock()
+
+
+def _read_text(path):
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", "replace")
+
+
+def _find_symbols(directory, recursive):
+    """Returns {basename: path} of symbol files in directory."""
+    symbols = {}
+    if recursive:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".sym"):
+                    symbols.setdefault(name, os.path.join(root, name))
+    elif os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".sym"):
+                symbols[name] = os.path.join(directory, name)
+    return symbols
+
+
+def get_system_symbols():
+    """Returns {basename: path} of symbols installed with gEDA.
+
+    They are looked for once per process, they change on upgrades only.
+    """
+    global _system_symbols
+    with _system_symbols_lock:
+        if _system_symbols is None:
+            _system_symbols = {}
+            for data_dir in SYSTEM_DATA_DIRS:
+                for name, path in _find_symbols(os.path.join(data_dir, "sym"), True).items():
+                    _system_symbols.setdefault(name, path)
+        return _system_symbols
+
+
+def get_rc_files(schematic_dirs):
+    """Returns gEDA configuration files gnetlist reads for schematics in schematic_dirs.
+
+    Local files come first, then user ones and system ones.
+    """
+    dirs = list(schematic_dirs) + [os.path.join(os.path.expanduser("~"), ".gEDA")]
+    paths = [os.path.join(directory, name) for directory in dirs for name in RC_FILES]
+    paths += [os.path.join(data_dir, "system-" + name) for data_dir in SYSTEM_DATA_DIRS for name in RC_FILES]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def get_libraries(rc_path):
+    """Returns ``component`` and ``source`` library folders declared in a gEDA rc file.
+
+    Returns:
+        List of (kind, folder path, recursive).
+    """
+    libraries = []
+    base = os.path.dirname(os.path.abspath(rc_path))
+    for kind, search, directory in LIBRARY_PATTERN.findall(_read_text(rc_path)):
+        directory = os.path.expanduser(os.path.expandvars(directory))
+        libraries.append((kind, os.path.normpath(os.path.join(base, directory)), bool(search)))
+    return libraries
+
+
+def get_schematic_dependencies(schematic_path):
+    """Returns files a gschem schematic depends on.
+
+    Sub-schematics named by ``source=`` attributes, of components or of their
+    symbols, are followed recursively. Symbols are looked for in the
+    schematic folder, in libraries declared by rc files of every schematic
+    folder and in gEDA system libraries, first match wins.
+
+    Returns:
+        List of absolute paths of sub-schematics, symbols and rc files. Names
+        of symbols that were not found are included as they are, so adding
+        them changes the result too.
+    """
+    schematic_path = os.path.abspath(schematic_path)
+    top_dir = os.path.dirname(schematic_path)
+    dependencies = []
+    # Libraries are shared by the whole hierarchy, like in gnetlist
+    symbols = _find_symbols(top_dir, False)
+    source_dirs = [top_dir]
+    schematic_dirs = []
+    pending = [schematic_path]
+    scanned = set()
+    while pending:
+        path = pending.pop(0)
+        if path in scanned:
+            continue
+        scanned.add(path)
+        directory = os.path.dirname(path)
+        if path.endswith(".sch") and directory not in schematic_dirs:
+            schematic_dirs.append(directory)
+            for rc_path in get_rc_files([directory]):
+                for kind, library, recursive in get_libraries(rc_path):
+                    if kind == "component":
+                        for name, symbol_path in _find_symbols(library, recursive).items():
+                            symbols.setdefault(name, symbol_path)
+                    elif library not in source_dirs:
+                        source_dirs.append(library)
+
+        try:
+            text = _read_text(path)
+        except (IOError, OSError):
+            continue  # Missing files are part of the key anyway
+        if path.endswith(".sch"):
+            for name in COMPONENT_PATTERN.findall(text):
+                if name.startswith("EMBEDDED"):
+                    continue  # Symbol is inside the schematic
+                symbol_path = symbols.get(name) or get_system_symbols().get(name, name)
+                if symbol_path not in dependencies:
+                    dependencies.append(symbol_path)
+                    if symbol_path != name:
+                        pending.append(symbol_path)  # Symbols may have a source= attribute
+        for value in SOURCE_PATTERN.findall(text):
+            for name in value.split(","):
+                name = name.strip()
+                for source_dir in [directory] + source_dirs:
+                    source_path = os.path.join(source_dir, name)
+                    if os.path.isfile(source_path):
+                        break
+                else:
+                    source_path = os.path.join(directory, name)
+                if source_path not in dependencies:
+                    dependencies.append(source_path)
+                    pending.append(source_path)
+
+    for rc_path in get_rc_files(schematic_dirs):
+        if rc_path not in dependencies:
+            dependencies.append(rc_path)
+    return dependencies
+
+
+def _gnetlist_stamp():
+    """Returns (path, size, modification time) of gnetlist executable.
+
+    Cheaper than ``gnetlist --version``, which starts Guile.
+    """
+    for directory in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        path = os.path.join(directory, "gnetlist")
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            stat = os.stat(path)
+            return (path, stat.st_size, stat.st_mtime)
+    return None
+
+
+def key(schematic_path):
+    """Computes cache key of a schematic conversion.
+
+    Key depends on the contents of the schematic and of every file it
+    depends on, see ``get_schematic_dependencies()``, and on gnetlist
+    executable.
+
+    Returns:
+        Hexadecimal key string.
+    """
+    schematic_path = os.path.abspath(schematic_path)
+    digest = hashlib.sha256()
+    digest.update(repr((_gnetlist_stamp(), BACKEND)).encode("utf-8"))
+    for path in [schematic_path] + get_schematic_dependencies(schematic_path):
+        digest.update(b"\0" + path.encode("utf-8") + b"\0")
+        file_hash = file_digest(path) if os.path.isabs(path) else None
+        digest.update((file_hash or "missing").encode("ascii"))
+    return digest.hexdigest()
+
+
+class NetlistCache(object):
+    """Netlists converted from schematics, stored on disk.
+
+    Every entry is a ``<key>.net`` file. Entries are evicted in least
+    recently used order when there are more than ``max_entries``.
+
+    Attributes:
+        path: Cache folder path.
+        max_entries: Maximum number of cached netlists.
+    """
+
+    EXTENSION = ".net"
+
+    def __init__(self, path=None, max_entries=256):
+        """Inits NetlistCache.
+
+        Args:
+            path: Cache folder path. If it is None, ``netlists`` folder inside
+                user cache folder is used.
+            max_entries: Maximum number of cached netlists.
+        """
+        self.path = path if path is not None else os.path.join(config.get_cache_path(), "netlists")
+        self.max_entries = max_entries
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + self.EXTENSION)
+
+    def get(self, key, netlist_path):
+        """Writes cached netlist to netlist_path.
+
+        The file is left untouched if it already has the cached contents, so
+        file monitors are not triggered.
+
+        Returns:
+            True if key was cached, False otherwise.
+        """
+        entry_path = self._entry_path(key)
+        if not os.path.isfile(entry_path):
+            return False
+        try:
+            os.utime(entry_path, None)  # Mark as recently used
+            if file_digest(netlist_path) != file_digest(entry_path):
+                self._copy(entry_path, netlist_path)
+        except (IOError, OSError):
+            return False  # Evicted meanwhile
+        return True
+
+    def put(self, key, netlist_path):
+        """Stores a netlist file."""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._copy(netlist_path, self._entry_path(key))
+        self.evict()
+
+    @staticmethod
+    def _copy(source, dest):
+        """Copies source to a temporary file renamed as dest, so readers never get half a file."""
+        fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(os.path.abspath(dest)))
+        try:
+            with os.fdopen(fd, "wb") as f, open(source, "rb") as s:
+                shutil.copyfileobj(s, f)
+            os.rename(temp_path, dest)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def evict(self):
+        """Removes least recently used entries beyond max_entries."""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(self.EXTENSION) and not name.startswith("."):
+                path = os.path.join(self.path, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass  # Removed meanwhile
+        for last_use, path in sorted(entries)[:max(len(entries) - self.max_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Removes every cache entry."""
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _run_gnetlist(schematic_path, netlist_path):
+    """Runs gnetlist on a temporary file renamed as netlist_path, so readers never get half a netlist."""
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".net", dir=os.path.dirname(netlist_path))
+    os.close(fd)
+    try:
+        Gnetlist.create_netlist_file(schematic_path, temp_path)
+        os.rename(temp_path, netlist_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def create_netlist_file(schematic_path, netlist_path, cache=None):
+    """Creates a spice netlist file from a gschem file, unless it is cached.
+
+    Args:
+        schematic_path: Gschem file path.
+        netlist_path: Netlist file path.
+        cache: NetlistCache or None to always run gnetlist.
+
+    Returns:
+        True if netlist came from cache, False if gnetlist was run.
+
+    Raises:
+        ExecutionError: When gnetlist reports errors.
+    """
+    schematic_path = os.path.abspath(schematic_path)
+    netlist_path = os.path.abspath(netlist_path)
+    if cache is None:
+        _run_gnetlist(schematic_path, netlist_path)
+        return False
+    before = key(schematic_path)
+    if cache.get(before, netlist_path):
+        return True
+    _run_gnetlist(schematic_path, netlist_path)
+    # Not cached if something changed while gnetlist was reading it
+    if key(schematic_path) == before:
+        try:
+            cache.put(before, netlist_path)
+        except (IOError, OSError):
+            pass  # Netlists are cached on a best effort basis
+    return False
+
+
+class Conversion(object):
+    """Conversion of a schematic run by a SchematicConverter.
+
+    Attributes:
+        schematic_path: Absolute gschem file path.
+        netlist_path: Absolute netlist file path.
+        end_event: CompletionEvent set when conversion ends.
+        error: ``ExecutionError`` or ``EnvironmentError`` it failed with, or
+            None.
+        cached: True if netlist came from cache.
+    """
+
+    def __init__(self, schematic_path, netlist_path):
+        self.schematic_path = schematic_path
+        self.netlist_path = netlist_path
+        self.end_event = CompletionEvent()
+        self.error = None
+        self.cached = False
+
+    def __repr__(self):
+        return "<Conversion {0}>".format(self.schematic_path)
+
+    def done(self):
+        return self.end_event.is_set()
+
+    def wait(self, timeout=None):
+        """Waits for conversion to end.
+
+        Returns:
+            True if it ended, False on timeout.
+        """
+        return self.end_event.wait(timeout)
+
+
+class SchematicConverter(object):
+    """Converts schematics to netlists on a pool of worker threads.
+
+    Every worker runs one gnetlist process at a time, so many schematics
+    convert in parallel. Conversions to the same netlist run one after the
+    other: converting a netlist already being converted queues a follow-up
+    conversion, which reads the schematic again. Requests made while a
+    follow-up is still waiting share it.
+
+    Attributes:
+        workers: Maximum number of simultaneous gnetlist processes.
+        cache: NetlistCache or None.
+    """
+
+    def __init__(self, workers=None, cache=None, use_cache=True):
+        """Inits SchematicConverter and starts its workers.
+
+        Args:
+            workers: Maximum number of simultaneous gnetlist processes.
+                Default is the number of processors.
+            cache: NetlistCache. Default is one in the user cache folder.
+            use_cache: If False, gnetlist is always run.
+        """
+        if workers is None:
+            try:
+                workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                workers = 1
+        if workers < 1:
+            raise ValueError("workers must be positive")
+        self.workers = workers
+        if use_cache:
+            self.cache = cache if cache is not None else NetlistCache()
+        else:
+            self.cache = None
+        self._queue = queue.Queue()
+        self._running = {}  # Netlist path to conversion not ended yet
+        self._pending = {}  # Netlist path to conversions waiting for the running one
+        self._lock = Lock()
+        self._shutdown = False
+        self._threads = []
+        for i in range(workers):
+            thread = Thread(name="gnetlist-worker-{0}".format(i), target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            conversion = self._queue.get()
+            if conversion is None:
+                return
+            # Follow-ups run in this worker, even after shutdown
+            while conversion is not None:
+                self._run(conversion)
+                with self._lock:
+                    pending = self._pending.get(conversion.netlist_path)
+                    if pending:
+                        following = self._running[conversion.netlist_path] = pending.pop(0)
+                        if not pending:
+                            del self._pending[conversion.netlist_path]
+                    else:
+                        following = None
+                        del self._running[conversion.netlist_path]
+                conversion.end_event.set()
+                conversion = following
+
+    def _run(self, conversion):
+        try:
+            conversion.cached = create_netlist_file(conversion.schematic_path, conversion.netlist_path, self.cache)
+        except (ExecutionError, EnvironmentError) as e:
+            conversion.error = e
+        except Exception as e:
+            conversion.error = ExecutionError(str(e))
+
+    def convert(self, schematic_path, netlist_path=None):
+        """Schedules conversion of a schematic.
+
+        Args:
+            schematic_path: Gschem file path.
+            netlist_path: Netlist file path. Default is
+                ``schematic_path + ".net"``.
+
+        Returns:
+            Conversion.
+
+        Raises:
+            RuntimeError: If converter was shut down.
+        """
+        schematic_path = os.path.abspath(schematic_path)
+        netlist_path = os.path.abspath(netlist_path if netlist_path is not None else schematic_path + ".net")
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot convert schematics after shutdown")
+            if netlist_path not in self._running:
+                conversion = self._running[netlist_path] = Conversion(schematic_path, netlist_path)
+                self._queue.put(conversion)
+                return conversion
+            # Running one may have read an older schematic, or another one
+            pending = self._pending.setdefault(netlist_path, [])
+            if pending and pending[-1].schematic_path == schematic_path:
+                return pending[-1]
+            conversion = Conversion(schematic_path, netlist_path)
+            pending.append(conversion)
+        return conversion
+
+    def convert_many(self, schematic_paths):
+        """Schedules conversion of many schematics, next to each one.
+
+        Returns:
+            List of Conversion in the same order.
+        """
+        return [self.convert(path) for path in schematic_paths]
+
+    def shutdown(self, wait=True):
+        """Stops workers once queued conversions end.
+
+        Args:
+            wait: If True, waits for workers to stop.
+        """
+        with self._lock:
+            self._shutdown = True
+        for thread in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+_converter = None
+_converter_lock = Lock()
+
+
+def get_converter():
+    """Returns SchematicConverter shared by the application."""
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            _converter = SchematicConverter()
+        return _converter
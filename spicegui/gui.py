@@ -19,19 +19,28 @@
 from __future__ import print_function
 
 import os.path
+import sys
 
-from gi.repository import Gtk, Gdk, Gio, GtkSource, Pango
-from matplotlib.backends.backend_gtk3cairo import FigureCanvasGTK3Cairo as FigureCanvas
+from gi.repository import Gtk, Gdk, Gio, GObject, GtkSource, Pango
 
 import config
 import console_gui
-import ngspice_simulation
+import ngspice_process
+import ngspice_session
+import netlist_dependencies
+import process_limits
+import run_directory
 import running_dialog
-import add_simulation_gui
+import startup_profiler
+
+# matplotlib, numpy and the modules using them are imported on first use, most
+# sessions start editing a netlist. See startup_profiler for how long they take.
 
 
 class MainWindow(Gtk.ApplicationWindow):
 
+    LIVE_PLOT_INTERVAL = 250  # ms, caps plot refresh rate while simulating
+
     def __init__(self, file_path=None):
         Gtk.Window.__init__(self)
         self.set_default_size(900, 600)
@@ -40,10 +49,20 @@ class MainWindow(Gtk.ApplicationWindow):
         self.settings = Gio.Settings.new(config.GSETTINGS_BASE_KEY)
 
         self.circuit = None
+        self.simulation_output = None
         self.netlist_file_path = None
         self.file_monitor = None
-        self.raw_data_window = console_gui.ConsoleOutputWindow(_("Simulation output"))
-        self.execution_log_window = console_gui.ConsoleOutputWindow(_("Execution log"))
+        self.ngspice_session = None
+        # Schematic being converted to netlist
+        self.conversion = None
+        # Files included by the opened netlist, watched for changes
+        self.dependency_graph = netlist_dependencies.DependencyGraph(watch=True)
+        self.dependency_graph.add_callback(self.on_dependency_changed)
+        # Output folders of last simulations
+        self.run_history = run_directory.RunHistory()
+        # Created on first use
+        self.raw_data_window = None
+        self.execution_log_window = None
         self._create_menu_models()
 
         ##########
@@ -71,6 +90,8 @@ class MainWindow(Gtk.ApplicationWindow):
         ## Left side of headerbar
         self._add_arrow_buttons()
         self._add_load_button()
+        self._add_analysis_combobox()
+        startup_profiler.mark("headerbar")
 
         ########
         #Content
@@ -82,6 +103,7 @@ class MainWindow(Gtk.ApplicationWindow):
         self.overview_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
         self.source_view = None
         self._open_state("new")
+        startup_profiler.mark("overview")
 
         self.infobar = None
         self.stack.add_titled(self.overview_box, "overview", _("Circuit"))
@@ -106,6 +128,7 @@ class MainWindow(Gtk.ApplicationWindow):
 
         if file_path is not None:
             self.load_file(file_path)
+            startup_profiler.mark("load file")
 
     def _open_state(self, state="opened"):
         """
@@ -192,6 +215,10 @@ class MainWindow(Gtk.ApplicationWindow):
         simulation_log_action.connect("activate", self.simulation_output_action_cb)
         self.add_action(simulation_log_action)
 
+        save_output_files_action = Gio.SimpleAction.new("save-output-files", None)
+        save_output_files_action.connect("activate", self.save_output_files_cb)
+        self.add_action(save_output_files_action)
+
         # insert_menu_xml #
         ## Create menu model
         self.insertmenu = builder.get_object('insertmenu')
@@ -257,35 +284,135 @@ class MainWindow(Gtk.ApplicationWindow):
             dialog.destroy()
 
     def save_data_cb(self, action, parameters):
+        import data_export
+
         dialog = Gtk.FileChooserDialog(_("Save simulation data"), self, Gtk.FileChooserAction.SAVE,
                                        (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_SAVE, Gtk.ResponseType.OK))
 
-        csv_filter = Gtk.FileFilter()
-        csv_filter.set_name(_("Comma-separated values"))
-        csv_filter.add_mime_type("text/csv")
-        dialog.add_filter(csv_filter)
+        filters = {}
+        for export_format in data_export.get_available_formats():
+            file_filter = Gtk.FileFilter()
+            file_filter.set_name(_(export_format.description))
+            file_filter.add_pattern("*" + export_format.extension)
+            dialog.add_filter(file_filter)
+            filters[export_format.name] = file_filter
+
+        options_widget, get_options = self._create_export_options_widget()
+        dialog.set_extra_widget(options_widget)
 
         dialog.set_current_name(self.circuit_title + " - " + self.simulation_output.analysis)
 
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             file_name = dialog.get_filename()
+            selected_filter = dialog.get_filter()
+            try:
+                columns, xmin, xmax = get_options()
+            except ValueError:
+                dialog.destroy()
+                self.overview_view()
+                self.set_error(title=_("Simulation data could not be saved."),
+                               message=_("Time window limits must be numbers."))
+                return
             dialog.destroy()
-            if file_name.split(".")[-1] != "csv":
-                file_name += ".csv"
-            self.simulation_output.save_csv(file_name)
+
+            # Format is chosen by file extension, then by selected filter
+            for export_format in data_export.get_available_formats():
+                if file_name.endswith(export_format.extension):
+                    break
+            else:
+                for export_format in data_export.get_available_formats():
+                    if filters[export_format.name] is selected_filter:
+                        break
+                else:
+                    export_format = data_export.get_format("csv")
+                file_name += export_format.extension
+            self.export_data(file_name, export_format.name, columns, xmin, xmax)
         else:
             dialog.destroy()
 
+    def _create_export_options_widget(self):
+        """Creates data export options widget.
+
+        Returns:
+            (widget, function returning (columns, xmin, xmax)). The function
+            raises ValueError if time window limits are not numbers.
+        """
+        grid = Gtk.Grid()
+        grid.set_row_spacing(6)
+        grid.set_column_spacing(12)
+
+        grid.attach(Gtk.Label(_("From")), 0, 0, 1, 1)
+        xmin_entry = Gtk.Entry()
+        xmin_entry.set_placeholder_text(_("Start"))
+        grid.attach(xmin_entry, 1, 0, 1, 1)
+        grid.attach(Gtk.Label(_("To")), 2, 0, 1, 1)
+        xmax_entry = Gtk.Entry()
+        xmax_entry.set_placeholder_text(_("End"))
+        grid.attach(xmax_entry, 3, 0, 1, 1)
+
+        if Gtk.check_version(3, 12, 0) is None:
+            columns_box = Gtk.FlowBox()
+            columns_box.set_selection_mode(Gtk.SelectionMode.NONE)
+        else:
+            columns_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        check_buttons = []
+        for data_line in self.simulation_output.data_lines:
+            check_button = Gtk.CheckButton(label=data_line.name)
+            check_button.props.active = True
+            if data_line.independent:
+                check_button.props.sensitive = False  # Rows would be meaningless without it
+            columns_box.add(check_button)
+            check_buttons.append(check_button)
+        grid.attach(columns_box, 0, 1, 4, 1)
+        grid.show_all()
+
+        def get_options():
+            columns = [button.props.label for button in check_buttons if button.props.active]
+            xmin = float(xmin_entry.get_text()) if xmin_entry.get_text().strip() else None
+            xmax = float(xmax_entry.get_text()) if xmax_entry.get_text().strip() else None
+            return columns, xmin, xmax
+
+        return grid, get_options
+
+    def export_data(self, file_name, format_name, columns=None, xmin=None, xmax=None):
+        """Exports selected analysis data without blocking the interface.
+
+        Args are the same as ``data_export.export()`` ones.
+        """
+        import data_export
+
+        exporter = data_export.DataExportAsync()
+        dialog = running_dialog.RunningDialog(self, exporter.end_event, title=_("Save simulation data"),
+                                              text=_(u"Saving…"), progress=lambda: exporter.progress)
+        exporter.start(file_name, self.simulation_output.data_lines, format_name, columns, xmin, xmax)
+        if dialog.run() != 1:
+            exporter.cancel()
+        dialog.destroy()
+        exporter.end_event.wait()
+        if exporter.error is not None and not isinstance(exporter.error, data_export.ExportCancelled):
+            self.overview_view()
+            self.set_error(title=_("Simulation data could not be saved."), message=str(exporter.error))
+
     def simulation_output_action_cb(self, action, parameters):
-        if self.raw_data_window is None:
-            self.raw_data_window = console_gui.ConsoleOutputWindow(_("Simulation output"))
-        self.raw_data_window.show_all()
+        self.get_raw_data_window().show_all()
+
+    def save_output_files_cb(self, action, parameters):
+        run = self.run_history.last
+        if run is None:
+            self.set_error(title=_("There are no output files to save."), message_type=Gtk.MessageType.WARNING)
+            return
+        try:
+            run.persist()
+        except (IOError, OSError) as e:
+            self.set_error(title=_("Output files could not be saved."), message=str(e))
 
     def close_cb(self, action, parameters):
         self.destroy()
     
     def insert_simulation_action(self, action, parameters):
+        import add_simulation_gui
+
         dialog = add_simulation_gui.AddSimulation(self,[])
         
         response = dialog.run()
@@ -374,6 +501,13 @@ class MainWindow(Gtk.ApplicationWindow):
         self.load_button.connect("clicked", self.on_button_open_clicked)
         self.hb.pack_start(self.load_button)
 
+    def _add_analysis_combobox(self):
+        self.analysis_combobox = Gtk.ComboBoxText()
+        self.analysis_combobox.set_no_show_all(True)
+
+        self.analysis_combobox_handler = self.analysis_combobox.connect("changed", self.on_analysis_combobox_changed)
+        self.hb.pack_start(self.analysis_combobox)
+
     def _add_simulate_button(self):
         self.simulate_button = Gtk.Button()
         icon = Gio.ThemedIcon(name="media-playback-start-symbolic")
@@ -390,11 +524,19 @@ class MainWindow(Gtk.ApplicationWindow):
         self.hb_rbox.pack_start(self.simulate_button, False, False, 0)
 
     def _update_canvas(self, figure):
+        from matplotlib.backends.backend_gtk3cairo import FigureCanvasGTK3Cairo as FigureCanvas
+
         self.simulation_box.remove(self.canvas)
         self.canvas = FigureCanvas(figure)  # a Gtk.DrawingArea
+        self.canvas.mpl_connect('resize_event', self.on_canvas_resize_event)
         self.simulation_box.pack_start(self.canvas, True, True, 0)
         self.canvas.show()
 
+    def on_canvas_resize_event(self, event):
+        # Plotted traces are decimated to axes width, so they must be updated
+        for axes in event.canvas.figure.axes:
+            axes.callbacks.process('xlim_changed', axes)
+
 
     def set_error(self, title=None, message=None, message_type=Gtk.MessageType.ERROR, actions=None):
         '''set_error(self, title=None, message=None, message_type=Gtk.MessageType.ERROR, actions=None) -> None
@@ -434,6 +576,8 @@ class MainWindow(Gtk.ApplicationWindow):
 
     def simulation_view(self):
         self.stack.set_visible_child(self.simulation_box)
+        self.analysis_combobox.props.visible = (self.simulation_output is not None and
+                                                len(self.simulation_output.analyses) > 1)
         self.back_button.props.sensitive = True
         self.forward_button.props.sensitive = False
         self.load_button.props.visible = False
@@ -443,6 +587,7 @@ class MainWindow(Gtk.ApplicationWindow):
 
     def overview_view(self):
         self.stack.set_visible_child(self.overview_box)
+        self.analysis_combobox.props.visible = False
         self.back_button.props.sensitive = False
         self.forward_button.props.sensitive = True
         self.load_button.props.visible = True
@@ -451,6 +596,11 @@ class MainWindow(Gtk.ApplicationWindow):
         self.gear_button.props.menu_model = self.gearmenu_overview
 
     def _on_destroy(self, data):
+        self.conversion = None
+        if self.ngspice_session is not None:
+            self.ngspice_session.close()
+        self.dependency_graph.close()
+        self.run_history.clear()
         self.destroy()
 
     def on_back_button_clicked(self, button):
@@ -462,52 +612,228 @@ class MainWindow(Gtk.ApplicationWindow):
     def on_simulate_button_clicked(self, button):
         # Dismiss infobar messages (if they exists)
         self.dismiss_error()
-        simulator = ngspice_simulation.NgspiceAsync()
-        dialog = running_dialog.RunningDialog(self,simulator.end_event)
+        import ngspice_shared
+        import ngspice_simulation
+
+        simulator = self.get_simulator()
+        shared_library = isinstance(simulator, ngspice_shared.NgspiceShared)
+        session = isinstance(simulator, ngspice_session.NgspiceSession)
+        dialog = None
+        live_output = None
+        live_source = None
+        run = None
         try:
             # First, save changes on disk
             self.save_netlist_file()
-            # Start simulation
-            simulator.simulatefile(self.netlist_file_path)
+            binary_rawfile = self.settings.get_boolean("binary-rawfile")
+            # Look for results of an identical simulation
+            cache = self.get_result_cache()
+            if cache is not None:
+                # Only files whose modification time or size changed are read again
+                digests = self.dependency_graph.get_digests(self.netlist_file_path)
+                if cache.uses_randomness(digests):
+                    cache = None # Every run gives other results
+            if cache is not None:
+                if shared_library:
+                    cache_key = cache.key_from_digests(digests, simulator.version(), "shared-library")
+                elif session:
+                    cache_key = cache.key_from_digests(digests, ngspice_process.Ngspice.version(), "session")
+                else:
+                    cache_key = cache.key_from_digests(digests, ngspice_process.Ngspice.version(), binary_rawfile)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    simulation_output, output_file = cached
+                    self.set_simulation_output(simulation_output)
+                    self.simulation_view()
+                    self.set_output_file_content(output_file)
+                    return
+            # Start simulation, writing to a folder of its own
+            run = run_directory.RunDirectory(self.netlist_file_path)
+            if session or (binary_rawfile and not shared_library):
+                rawfile_path = run.rawfile_path
+            else:
+                rawfile_path = None
+            dialog = running_dialog.RunningDialog(self, simulator.end_event,
+                                                  simulation_progress=simulator.progress)
+            simulator.simulatefile(self.netlist_file_path, rawfile_path, run.output_path)
+            if shared_library:
+                # Plot points as the library sends them
+                live_output = simulator
+            elif rawfile_path is not None:
+                # Plot points as ngspice writes them
+                live_output = ngspice_simulation.RawfileTail(rawfile_path)
+            if live_output is not None:
+                live_source = GObject.timeout_add(self.LIVE_PLOT_INTERVAL, self.on_live_plot_timeout, live_output)
             # Show dialog
-            if dialog.run() == 1: # Not cancelled by the user
+            response = dialog.run()
+            if shared_library:
+                # Output window and cache read ngspice output from file, also
+                # after cancelling
+                with open(run.output_path, "w") as f:
+                    f.write(simulator.get_log())
+            if response == 1: # Not cancelled by the user
                 if not simulator.errors:
-                    self.simulation_output = ngspice_simulation.NgspiceOutput.parse_file(self.netlist_file_path + ".out")
-                    self.figure = self.simulation_output.get_figure()
-                    self._update_canvas(self.figure)
+                    if shared_library:
+                        simulation_output = simulator.get_output()
+                    elif rawfile_path is not None:
+                        simulation_output = ngspice_simulation.NgspiceOutput.parse_raw(rawfile_path)
+                    else:
+                        simulation_output = ngspice_simulation.NgspiceOutput.parse_file(run.output_path)
+                    self.set_simulation_output(simulation_output)
                     self.simulation_view()
+                    if cache is not None:
+                        try:
+                            cache.put(cache_key, simulation_output, run.output_path)
+                        except (IOError, OSError):
+                            pass  # Results are cached on a best effort basis
                 else:
                     errors_str = [str(x) for x in simulator.errors]
                     self.set_execution_log(self.netlist_file_path,"\n".join(errors_str))
                     self.set_error(title=_("Simulation failed."), actions=[(_("Execution log"), 1000, self.on_execution_log_clicked)])
             else:
                 simulator.terminate()
-            self.set_output_file_content(self.netlist_file_path + ".out")
+                if live_output is not None:
+                    # Keep points simulated before cancelling
+                    live_output.update()
+                    self.show_live_output(live_output)
+            self.set_output_file_content(run.output_path)
+            if self.settings.get_boolean("persist-results"):
+                run.persist()
         except Exception as e:
             self.set_error(title=_("Simulation failed."), message=str(e))
         finally:
-            dialog.destroy()
+            if live_source is not None:
+                GObject.source_remove(live_source)
+            if live_output is not None and live_output is not simulator:
+                live_output.close()
+            if dialog is not None:
+                dialog.destroy()
+            if run is not None:
+                # Older runs beyond retention are removed
+                self.run_history.keep = self.settings.get_int("kept-runs")
+                self.run_history.add(run)
+
+    def get_simulator(self):
+        """Returns simulator object chosen in settings.
+
+        The persistent session is created on first use and kept until window
+        is destroyed.
+        """
+        if self.settings.get_boolean("shared-library"):
+            import ngspice_shared
+
+            if ngspice_shared.NgspiceShared.available():
+                return ngspice_shared.NgspiceShared()
+        if self.settings.get_boolean("persistent-session"):
+            if self.ngspice_session is None:
+                self.ngspice_session = ngspice_session.NgspiceSession()
+            return self.ngspice_session
+        limits = self.get_resource_limits()
+        if sys.version_info >= (3, 5):
+            import ngspice_asyncio
+
+            # Runs on the asyncio loop shared by every window
+            return ngspice_asyncio.NgspiceAsyncio(ngspice_asyncio.AsyncSimulator(limits=limits))
+        return ngspice_process.NgspiceAsync(limits)
+
+    def get_resource_limits(self):
+        """Returns ngspice resource limits set in settings."""
+        cpu_time = self.settings.get_int("cpu-time-limit")
+        wall_time = self.settings.get_int("wall-time-limit")
+        memory = self.settings.get_int("memory-limit")
+        return process_limits.ResourceLimits(cpu_time=cpu_time or None, wall_time=wall_time or None,
+                                             memory=memory * 1024 * 1024 if memory else None)
+
+    def on_live_plot_timeout(self, live_output):
+        try:
+            if live_output.update():
+                self.show_live_output(live_output)
+        except (IOError, OSError, ValueError):
+            return False  # Results will be read once simulation ends
+        return True
+
+    def show_live_output(self, live_output):
+        """Shows points of a running simulation read so far.
+
+        Args:
+            live_output: RawfileTail of simulation rawfile or NgspiceShared
+                simulator.
+        """
+        from ngspice_simulation import NgspiceOutput
+
+        simulation_output = live_output.get_output()
+        if simulation_output.analysis in NgspiceOutput.SUPPORTED_ANALYSES:
+            self.set_simulation_output(simulation_output)
+            self.simulation_view()
+
+    def get_result_cache(self):
+        """Returns simulation result cache or None if it is disabled."""
+        cache_size = self.settings.get_int("result-cache-size")
+        if cache_size > 0:
+            import result_cache
+
+            return result_cache.ResultCache(max_size=cache_size * 1024 * 1024)
+        else:
+            return None
+
+    def set_simulation_output(self, simulation_output):
+        """Shows selected analysis of simulation_output and lists the others."""
+        self.simulation_output = simulation_output
+
+        self.analysis_combobox.handler_block(self.analysis_combobox_handler)
+        self.analysis_combobox.remove_all()
+        for analysis in simulation_output.analyses:
+            self.analysis_combobox.append(analysis, analysis)
+        self.analysis_combobox.set_active_id(simulation_output.analysis)
+        self.analysis_combobox.handler_unblock(self.analysis_combobox_handler)
+
+        self.figure = self.simulation_output.get_figure()
+        self._update_canvas(self.figure)
+
+    def on_analysis_combobox_changed(self, combobox):
+        analysis = combobox.get_active_id()
+        if analysis is not None and analysis != self.simulation_output.analysis:
+            try:
+                # Analysis tables are parsed now if they were not before
+                self.simulation_output.select_analysis(analysis)
+                self.figure = self.simulation_output.get_figure()
+                self._update_canvas(self.figure)
+            except Exception as e:
+                self.overview_view()
+                self.set_error(title=_("Simulation output could not be read."), message=str(e))
+
+    def get_raw_data_window(self):
+        """Returns simulation output window, creating it on first use."""
+        if self.raw_data_window is None:
+            self.raw_data_window = console_gui.ConsoleOutputWindow(_("Simulation output"))
+        return self.raw_data_window
+
+    def get_execution_log_window(self):
+        """Returns execution log window, creating it on first use."""
+        if self.execution_log_window is None:
+            self.execution_log_window = console_gui.ConsoleOutputWindow(_("Execution log"))
+        return self.execution_log_window
 
     def set_output_file_content(self, output_file):
-        self.raw_data_window.clear_buffer()
+        raw_data_window = self.get_raw_data_window()
+        raw_data_window.clear_buffer()
 
         with open(output_file, 'r') as f:
             lines = f.readlines()
             for line in lines:
-                self.raw_data_window.insert_text(line)
+                raw_data_window.insert_text(line)
 
-        self.raw_data_window.set_subtitle(output_file)
+        raw_data_window.set_subtitle(output_file)
 
     def on_execution_log_clicked(self, button, response_id):
-        if self.execution_log_window is None:
-            self.execution_log_window = console_gui.ConsoleOutputWindow(_("Execution log"))
-        self.execution_log_window.show_all()
+        self.get_execution_log_window().show_all()
 
     def set_execution_log(self, file_name, content):
-        self.execution_log_window.clear_buffer()
-        self.execution_log_window.insert_text(content)
+        execution_log_window = self.get_execution_log_window()
+        execution_log_window.clear_buffer()
+        execution_log_window.insert_text(content)
 
-        self.execution_log_window.set_subtitle(file_name)
+        execution_log_window.set_subtitle(file_name)
 
 
     def start_file_monitor(self):
@@ -533,6 +859,21 @@ class MainWindow(Gtk.ApplicationWindow):
         if event_type == Gio.FileMonitorEvent.CHANGED or event_type == Gio.FileMonitorEvent.CREATED:
             self.set_error(title=_("Opened file changed on disk."), message=None, message_type=Gtk.MessageType.WARNING, actions=[(_("Reload"), 1000, self.on_infobar_reload_clicked)])
 
+    def on_dependency_changed(self, path, netlists):
+        """Warns about changes of files included by the opened netlist.
+
+        Changes of the netlist itself are handled by on_file_changed().
+        """
+        if self.netlist_file_path is None or os.path.abspath(self.netlist_file_path) not in netlists:
+            return
+        if path != os.path.abspath(self.netlist_file_path):
+            self.set_error(title=_("A file used by the circuit changed on disk."), message=path,
+                           message_type=Gtk.MessageType.WARNING,
+                           actions=[(_("Simulate"), 1001, self.on_infobar_simulate_clicked)])
+
+    def on_infobar_simulate_clicked(self, button, response_id):
+        self.on_simulate_button_clicked(None)
+
     def on_infobar_reload_clicked(self, button, response_id):
         if self.schematic_file_path is not None:
             self.load_file(self.schematic_file_path)
@@ -553,22 +894,39 @@ class MainWindow(Gtk.ApplicationWindow):
         '''
         self.netlist_file_path = None
         self.schematic_file_path = None
-        file_content = None
-            #schematic to netlist conversion
+        self.conversion = None
 
         if os.path.splitext(path)[1] == ".sch":
-            # Try convert schematic to netlist
-            try:
-                ngspice_simulation.Gnetlist.create_netlist_file(path, path + ".net")
-                self.netlist_file_path = path + ".net"
-                self.schematic_file_path = path
-            except Exception as e:
-                self.set_error(title=_("Schematic could not be converted to netlist."), message=str(e))
-                self.netlist_file_path = None
-                self.schematic_file_path = None
-                return
+            import gnetlist_cache
+
+            # Converted by a worker thread, unchanged schematics come from cache
+            conversion = gnetlist_cache.get_converter().convert(path, path + ".net")
+            self.conversion = conversion
+            self.simulate_button.props.sensitive = False
+            self.hb.set_subtitle(_(u"Converting schematic…"))
+            conversion.end_event.add_callback(lambda: GObject.idle_add(self.on_schematic_converted, conversion))
+            if conversion.done():
+                # Ended before the callback was added
+                self.on_schematic_converted(conversion)
         else:
-            self.netlist_file_path = path
+            self._load_netlist(path)
+
+    def on_schematic_converted(self, conversion):
+        if conversion is not self.conversion:
+            return False  # Already handled, or another file was loaded meanwhile
+        self.conversion = None
+        if conversion.error is not None:
+            self.hb.set_subtitle("")
+            self.set_error(title=_("Schematic could not be converted to netlist."), message=str(conversion.error))
+            return False
+        self._load_netlist(conversion.netlist_path, conversion.schematic_path)
+        return False
+
+    def _load_netlist(self, netlist_path, schematic_path=None):
+        """Opens a netlist file, converted from schematic_path if it is not None."""
+        self.netlist_file_path = netlist_path
+        self.schematic_file_path = schematic_path
+        file_content = None
 
         # Read netlist file
         if self.netlist_file_path is not None:
@@ -577,10 +935,13 @@ class MainWindow(Gtk.ApplicationWindow):
 
         # Set a file monitor
         self.start_file_monitor()
+        self.dependency_graph.close()
+        if self.netlist_file_path is not None:
+            self.dependency_graph.add_netlist(self.netlist_file_path)
 
         if file_content is not None and self.netlist_file_path is not None:
             #Set window title
-            netlist = ngspice_simulation.Netlist(file_content)
+            netlist = ngspice_process.Netlist(file_content)
             self.circuit_title = netlist.get_title()
             if self.circuit_title is not None:
                 self.hb.set_title(self.circuit_title)
@@ -642,6 +1003,8 @@ class MainWindow(Gtk.ApplicationWindow):
         self.stop_file_monitor()
         with open(self.netlist_file_path, "w") as f:
             f.write(self.source_buffer.props.text)
+        # Included files may have changed too
+        self.dependency_graph.invalidate(self.netlist_file_path)
         self.start_file_monitor()
         self.source_buffer.set_modified(False)
 
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Files netlists depend on, kept up to date while they change."""
+
+import functools
+import hashlib
+import os.path
+
+from ngspice_process import Netlist
+
+
+def file_digest(path):
+    """Returns SHA-256 hexadecimal digest of a file, or None if it is missing."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(functools.partial(f.read, 1024 * 1024), b""):
+                digest.update(block)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+
+def file_stat(path):
+    """Returns (modification time, size) of a file, or None if it is missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def get_digests(netlist_path):
+    """Returns (path, digest) of a netlist file and of every file it depends on.
+
+    Files are read every time, see ``DependencyGraph.get_digests()`` for a
+    cached version.
+    """
+    netlist_path = os.path.abspath(netlist_path)
+    return [(path, file_digest(path)) for path in [netlist_path] + Netlist.get_dependencies(netlist_path)]
+
+
+class _Node(object):
+    __slots__ = ["path", "is_netlist", "digest", "stat", "includes", "model_files", "monitor"]
+
+    def __init__(self, path, is_netlist):
+        self.path = path
+        self.is_netlist = is_netlist  # Code model data files are not scanned
+        self.digest = None
+        self.stat = None  # file_stat() when digest was computed
+        self.includes = []
+        self.model_files = []
+        self.monitor = None
+
+    @property
+    def dependencies(self):
+        return self.includes + [path for path in self.model_files if path not in self.includes]
+
+
+class DependencyGraph(object):
+    """Graph of netlists, the files they include and code model data files.
+
+    Every file is a node with the digest of its contents. Included files are
+    scanned for their own dependencies, code model data files are leaves.
+    When watching is enabled, every node has a ``Gio.FileMonitor`` and is
+    updated as soon as it changes on disk. Callbacks are told which netlists
+    are affected by each change, and only when contents actually changed.
+
+    Digests are kept, so cache keys of netlists whose files did not change
+    are computed without reading them again. Monitor events arrive
+    asynchronously, so ``get_digests()`` also checks modification time and
+    size of every file and reads again those that changed.
+    """
+
+    # Gio.FileMonitorEvent names handled, see _on_file_changed()
+    WATCHED_EVENTS = ("CHANGES_DONE_HINT", "CREATED", "DELETED")
+
+    def __init__(self, watch=False):
+        """Inits DependencyGraph.
+
+        Args:
+            watch: If True, files are watched with Gio.FileMonitor. A GLib
+                main loop must be running to get notified.
+        """
+        self.watch = watch
+        self._nodes = {}
+        self._netlists = set()
+        self._callbacks = []
+
+    def add_netlist(self, netlist_path):
+        """Scans a netlist file and everything it depends on."""
+        netlist_path = os.path.abspath(netlist_path)
+        self._netlists.add(netlist_path)
+        self._update(netlist_path, True)
+
+    def remove_netlist(self, netlist_path):
+        """Stops following a netlist file and files only it depended on."""
+        self._netlists.discard(os.path.abspath(netlist_path))
+        self._collect()
+
+    def __contains__(self, netlist_path):
+        return os.path.abspath(netlist_path) in self._netlists
+
+    def get_dependencies(self, netlist_path):
+        """Returns files a netlist depends on, recursively, in netlist order."""
+        netlist_path = os.path.abspath(netlist_path)
+        dependencies = []
+        pending = [netlist_path]
+        while pending:
+            node = self._nodes.get(pending.pop(0))
+            if node is None:
+                continue
+            for path in node.dependencies:
+                if path not in dependencies and path != netlist_path:
+                    dependencies.append(path)
+                    if path in node.includes:
+                        pending.append(path)
+        return dependencies
+
+    def get_dependents(self, path):
+        """Returns followed netlists depending on path, or being it."""
+        path = os.path.abspath(path)
+        return set(netlist for netlist in self._netlists
+                   if netlist == path or path in self.get_dependencies(netlist))
+
+    def get_digest(self, path):
+        """Returns digest of a node, or None if the file is missing."""
+        node = self._nodes.get(os.path.abspath(path))
+        if node is None:
+            raise KeyError(path)
+        return node.digest
+
+    def get_digests(self, netlist_path):
+        """Returns (path, digest) of a netlist and of every file it depends on.
+
+        Same result as ``get_digests()`` function, reading only files whose
+        modification time or size changed since they were last read. Changes
+        found this way do not call callbacks, the file was already saved
+        when digests are asked for.
+        """
+        netlist_path = os.path.abspath(netlist_path)
+        if netlist_path not in self._netlists:
+            self.add_netlist(netlist_path)
+        else:
+            changed = True
+            while changed:
+                # Dependencies are listed again after a file changed, they may be different
+                changed = False
+                for path in [netlist_path] + self.get_dependencies(netlist_path):
+                    if file_stat(path) != self._nodes[path].stat:
+                        self._refresh(path)
+                        changed = True
+                        break
+        return [(path, self._nodes[path].digest) for path in [netlist_path] + self.get_dependencies(netlist_path)]
+
+    def add_callback(self, callback):
+        """Calls callback(changed path, affected netlists) on every change."""
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def invalidate(self, path):
+        """Reads a file again after it changed.
+
+        Args:
+            path: Changed file path.
+
+        Returns:
+            Set of followed netlists affected by the change. It is empty if
+            file contents did not change.
+        """
+        affected = self._refresh(path)
+        if affected:
+            for callback in list(self._callbacks):
+                callback(os.path.abspath(path), affected)
+        return affected
+
+    def _refresh(self, path):
+        """Reads a file again, like invalidate(), without calling callbacks."""
+        path = os.path.abspath(path)
+        node = self._nodes.get(path)
+        if node is None:
+            return set()
+        stat = file_stat(path)
+        digest = file_digest(path)
+        if digest == node.digest:
+            node.stat = stat
+            return set()
+        affected = self.get_dependents(path)  # Before its dependencies change
+        self._update(path, node.is_netlist, force=True)
+        affected |= self.get_dependents(path)
+        self._collect()
+        return affected
+
+    def close(self):
+        """Stops watching every file."""
+        self._netlists.clear()
+        self._collect()
+
+    def _update(self, path, is_netlist, force=False):
+        """Scans path and, recursively, files it includes not scanned yet.
+
+        Args:
+            path: Absolute file path.
+            is_netlist: If True, file is scanned for its dependencies.
+            force: If True, path is scanned again even if it was before.
+        """
+        pending = [(path, is_netlist)]
+        while pending:
+            path, is_netlist = pending.pop(0)
+            node = self._nodes.get(path)
+            if node is not None and not force and (node.is_netlist or not is_netlist):
+                continue
+            force = False
+            if node is None:
+                node = self._nodes[path] = _Node(path, is_netlist)
+                if self.watch:
+                    self._start_monitor(node)
+            node.is_netlist = node.is_netlist or is_netlist
+            # Stat first, a change while reading is found next time
+            node.stat = file_stat(path)
+            node.digest = file_digest(path)
+            node.includes, node.model_files = [], []
+            if node.is_netlist and node.digest is not None:
+                with open(path, "rb") as f:
+                    netlist = Netlist(f.read().decode("utf-8", "replace"))
+                node.includes = netlist.get_includes(os.path.dirname(path))
+                node.model_files = netlist.get_model_files(os.path.dirname(path))
+            pending.extend((include, True) for include in node.includes)
+            pending.extend((model_file, False) for model_file in node.model_files if model_file not in node.includes)
+
+    def _collect(self):
+        """Removes nodes no followed netlist depends on."""
+        reachable = set(self._netlists)
+        for netlist in self._netlists:
+            reachable.update(self.get_dependencies(netlist))
+        for path in list(self._nodes):
+            if path not in reachable:
+                node = self._nodes.pop(path)
+                if node.monitor is not None:
+                    node.monitor.cancel()
+
+    def _start_monitor(self, node):
+        from gi.repository import Gio
+
+        node.monitor = Gio.File.new_for_path(node.path).monitor_file(Gio.FileMonitorFlags.NONE, None)
+        node.monitor.connect("changed", self._on_file_changed, node.path)
+
+    def _on_file_changed(self, monitor, changed_file, other_file, event_type, path):
+        from gi.repository import Gio
+
+        if event_type in [getattr(Gio.FileMonitorEvent, name) for name in self.WATCHED_EVENTS]:
+            self.invalidate(path)
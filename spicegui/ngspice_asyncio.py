@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""asyncio interface to ngspice and gnetlist.
+
+Many simulations can be driven from a single event loop, without a thread
+per run. Every child process is started in a process group of its own, so
+timeouts and cancellation kill ngspice together with anything it started.
+
+Resource limits apply as with ``ProcessSupervisor``, but resource usage is not
+collected: asyncio reaps child processes itself, so ``wait4()`` cannot be
+used. Exceeded limits are reported as errors, CPU time and peak memory are
+not reported at all.
+
+This module needs Python 3.5 or newer.
+
+Example::
+
+    simulator = AsyncSimulator(max_concurrency=8, timeout=60)
+    results = await simulator.simulate_many(netlist_paths)
+"""
+
+import asyncio
+import os
+import signal
+import threading
+import timeit
+
+from completion_event import CompletionEvent
+from ngspice_process import ExecutionError, Ngspice, ProcessOutput
+from process_limits import ResourceLimits, make_report
+from simulation_progress import SimulationProgress
+
+
+class SimulationTimeout(ExecutionError):
+    """Process did not end in time and was killed."""
+    pass
+
+
+class AsyncSimulator(object):
+    """Runs ngspice and gnetlist as asyncio subprocesses.
+
+    Attributes:
+        max_concurrency: Maximum number of simultaneous processes or None.
+        timeout: Default maximum seconds of each run or None.
+        limits: ResourceLimits of every ngspice process.
+    """
+
+    READ_SIZE = ProcessOutput.READ_SIZE
+
+    def __init__(self, max_concurrency=None, timeout=None, limits=None):
+        """Inits AsyncSimulator.
+
+        Args:
+            max_concurrency: Maximum number of simultaneous processes. None
+                means no limit.
+            timeout: Default maximum seconds of each run. None means no
+                limit.
+            limits: ResourceLimits of every ngspice process. Its wall clock
+                time limit works as a timeout.
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.limits = limits if limits is not None else ResourceLimits()
+        self._semaphore = None
+
+    def _get_semaphore(self):
+        # Created on first use, inside the loop running coroutines
+        if self._semaphore is None and self.max_concurrency is not None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _run(self, command, cwd, timeout, error_prefix, fatal_errors=(), on_line=None, limits=None):
+        """Runs command and returns ProcessOutput once it ends.
+
+        Args:
+            limits: ResourceLimits of process or None. Process is in a
+                session of its own anyway.
+
+        Raises:
+            SimulationTimeout: If process did not end in time.
+            asyncio.CancelledError: If coroutine was cancelled.
+        """
+        if limits is None:
+            limits = ResourceLimits()
+        semaphore = self._get_semaphore()
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            process = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.DEVNULL,
+                                                           stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE,
+                                                           cwd=cwd, **limits.popen_kwargs())
+            output = ProcessOutput(process, error_prefix, fatal_errors, on_line=on_line,
+                                   on_fatal=lambda: self._kill(process))
+            try:
+                await asyncio.wait_for(self._read(process, output), timeout)
+            except asyncio.TimeoutError:
+                self._kill(process)
+                await process.wait()
+                raise SimulationTimeout("{0} did not end in {1} seconds".format(command[0], timeout))
+            except BaseException:
+                # Cancelled, children are killed too
+                self._kill(process)
+                await process.wait()
+                raise
+            return output
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    async def _read(self, process, output):
+        async def read_stream(name, stream):
+            while True:
+                data = await stream.read(self.READ_SIZE)
+                output.feed(name, data)
+                if not data:
+                    return
+
+        await asyncio.gather(read_stream("stdout", process.stdout), read_stream("stderr", process.stderr))
+        await process.wait()
+
+    @staticmethod
+    def _kill(process):
+        """Kills process group of process."""
+        if process.returncode is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass  # Already gone
+
+    async def simulate(self, netlist_path, rawfile_path=None, output_path=None, cwd=None, timeout=None,
+                       progress=None):
+        """Simulates netlist_path file with ngspice.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: If not None, binary rawfile is also written there.
+            output_path: Output file path. Default is
+                ``netlist_path + ".out"``.
+            cwd: Folder ngspice runs in. Default is netlist folder.
+            timeout: Maximum seconds. Default is ``self.timeout``.
+            progress: SimulationProgress to update or None.
+
+        Returns:
+            (stdout, stderr) text of ngspice.
+
+        Raises:
+            ExecutionError: If ngspice reported errors.
+            SimulationTimeout: If ngspice did not end in time.
+        """
+        netlist_path = os.path.abspath(netlist_path)
+        if cwd is None:
+            cwd = os.path.dirname(netlist_path)
+        if timeout is None:
+            timeout = self.timeout
+        if self.limits.wall_time is not None:
+            timeout = min(timeout, self.limits.wall_time) if timeout is not None else self.limits.wall_time
+        Ngspice._remove_outputs(netlist_path, rawfile_path, output_path)
+        on_line = None
+        if progress is not None:
+            progress.reset(Ngspice._transient_stop(netlist_path))
+            on_line = lambda stream, line: progress.feed_line(line)
+
+        start = timeit.default_timer()
+        output = await self._run(Ngspice._command(netlist_path, rawfile_path, output_path), cwd, timeout,
+                                 "Error:", Ngspice.FATAL_ERRORS, on_line, self.limits)
+        # Without resource usage, only tells whether a limit was exceeded
+        report = make_report(output.process.returncode, timeit.default_timer() - start, self.limits,
+                             fatal_error=output.fatal_error, errors=output.errors)
+        if report.limit_exceeded:
+            raise ExecutionError(report.describe(self.limits))
+        if output.errors:
+            raise ExecutionError("\n".join(output.errors))
+        return output.get_text()
+
+    async def simulate_many(self, netlist_paths, **kwargs):
+        """Simulates many netlist files, at most max_concurrency at a time.
+
+        Keyword arguments are passed to ``simulate()``.
+
+        Returns:
+            List with the result or the exception of each simulation, in the
+            same order.
+        """
+        return await asyncio.gather(*[self.simulate(path, **kwargs) for path in netlist_paths],
+                                    return_exceptions=True)
+
+    async def create_netlist_file(self, schematic_path, netlist_path, timeout=None):
+        """Creates a spice netlist file from a gschem file with gnetlist.
+
+        Raises:
+            ExecutionError: When gnetlist reports errors.
+            SimulationTimeout: If gnetlist did not end in time.
+        """
+        command = ["gnetlist", "-g", "spice-sdb", "-o", str(netlist_path), "--", str(schematic_path)]
+        output = await self._run(command, os.path.dirname(os.path.abspath(netlist_path)),
+                                 timeout if timeout is not None else self.timeout, "ERROR:")
+        if output.errors:
+            raise ExecutionError("\n".join(output.errors))
+
+
+class GLibAsyncioBridge(object):
+    """Runs an asyncio event loop next to the GLib main loop.
+
+    The asyncio loop runs in a thread of its own. Coroutines are submitted
+    from GLib code, and their results are delivered back in the GLib main
+    loop.
+    """
+
+    def __init__(self):
+        """Inits GLibAsyncioBridge and starts its loop."""
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(started.set)
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(name="asyncio-loop", target=run)
+        self.thread.daemon = True
+        self.thread.start()
+        started.wait()
+
+    def submit(self, coroutine, callback=None):
+        """Schedules coroutine on the asyncio loop.
+
+        Args:
+            coroutine: Coroutine object.
+            callback: Function called with the finished
+                ``concurrent.futures.Future`` in the GLib main loop.
+
+        Returns:
+            ``concurrent.futures.Future``. Its ``cancel()`` cancels the
+            coroutine.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        if callback is not None:
+            # AsyncSimulator alone does not need PyGObject
+            from gi.repository import GObject
+
+            future.add_done_callback(lambda future: GObject.idle_add(self._call, callback, future))
+        return future
+
+    @staticmethod
+    def _call(callback, future):
+        callback(future)
+        return False
+
+    def close(self):
+        """Stops asyncio loop."""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        self.loop.close()
+
+
+_bridge = None
+_bridge_lock = threading.Lock()
+
+
+def get_bridge():
+    """Returns GLibAsyncioBridge shared by the application."""
+    global _bridge
+    with _bridge_lock:
+        if _bridge is None:
+            _bridge = GLibAsyncioBridge()
+        return _bridge
+
+
+class NgspiceAsyncio(object):
+    """NgspiceAsync interface on top of AsyncSimulator.
+
+    Simulations run on the shared GLibAsyncioBridge loop and ``terminate()``
+    kills ngspice process group. Unlike NgspiceAsync, it has no ``report``,
+    resource usage is unknown.
+
+    Attributes:
+        end_event: Set when simulation ends.
+        errors: List of ``ExecutionError`` or None.
+        result: (stdout, stderr) once simulation ends.
+        progress: SimulationProgress of running simulation.
+    """
+
+    def __init__(self, simulator=None, bridge=None):
+        """Inits NgspiceAsyncio.
+
+        Args:
+            simulator: AsyncSimulator. Default is one without limits.
+            bridge: GLibAsyncioBridge. Default is the shared one.
+        """
+        self.simulator = simulator if simulator is not None else AsyncSimulator()
+        self.bridge = bridge if bridge is not None else get_bridge()
+        self.result = None
+        self.errors = None
+        self.end_event = CompletionEvent()
+        self.progress = SimulationProgress()
+        self._future = None
+
+    def simulatefile(self, netlist_path, rawfile_path=None, output_path=None):
+        """Simulates asynchronously netlist_path file.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: If not None, binary rawfile is also written there.
+            output_path: Output file path. Default is
+                ``netlist_path + ".out"``.
+        """
+        self.result = None
+        self.errors = None
+        self.end_event.clear()
+        # Removed before returning, so callers never follow a stale output file
+        Ngspice._remove_outputs(netlist_path, rawfile_path, output_path)
+        self._future = self.bridge.submit(self.simulator.simulate(netlist_path, rawfile_path, output_path,
+                                                                  progress=self.progress))
+        self._future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        if future.cancelled():
+            self.result = ("", "")
+            self.errors = [ExecutionError("Simulation cancelled")]
+        elif future.exception() is not None:
+            error = future.exception()
+            self.result = ("", str(error))
+            self.errors = [ExecutionError(line) for line in str(error).splitlines() if line]
+        else:
+            self.result = future.result()
+        self.end_event.set()
+
+    def terminate(self):
+        """Cancels running simulation, killing ngspice process group."""
+        if self._future is not None:
+            self._future.cancel()
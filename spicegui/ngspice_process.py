@@ -0,0 +1,625 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""ngspice and gnetlist processes and netlist files.
+
+Only the standard library is needed here, so batch tools running ngspice
+start fast. Results are parsed by ``ngspice_simulation``, which re-exports
+everything in this module.
+"""
+
+from __future__ import print_function
+
+import codecs
+import collections
+import errno
+import locale
+import os
+import os.path
+import re
+import select
+import subprocess
+from threading import Lock, Thread
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from completion_event import CompletionEvent
+from process_limits import ProcessSupervisor
+from simulation_progress import SimulationProgress
+
+
+class ProcessOutput(object):
+    """Reader of the standard output and error of a running process.
+
+    Both pipes are read as data arrives, on non-blocking file descriptors,
+    and decoded incrementally. Error lines are reported as soon as they are
+    written and a fatal one terminates the process at once. Only the first
+    and last ``max_chars`` halves of each stream are kept, so processes
+    writing a lot of warnings do not fill memory.
+
+    Data read some other way, like from asyncio streams, can be handed over
+    with ``feed()``.
+
+    Attributes:
+        errors: Error lines written to standard error so far.
+        fatal_error: Fatal error line the process was terminated for, or
+            None.
+    """
+
+    MAX_CHARS = 1048576
+    MAX_ERRORS = 1000
+    READ_SIZE = 65536
+    # Progress reports end with a carriage return alone
+    LINE_BREAK_PATTERN = re.compile("\r\n|\r|\n")
+
+    def __init__(self, process, error_prefix="Error", fatal_errors=(), on_error=None, on_line=None,
+                 max_chars=MAX_CHARS, on_fatal=None, wait=None):
+        """Inits ProcessOutput.
+
+        Args:
+            process: ``subprocess.Popen`` object with stdout and stderr pipes.
+            error_prefix: Standard error lines starting with it are errors.
+            fatal_errors: Lower case texts marking an error as fatal.
+            on_error: Function called with every error line as it is read.
+            on_line: Function called with (stream name, line) for every
+                line read, stream name is "stdout" or "stderr". Lines end
+                with new lines or carriage returns. If it returns True, line
+                is not kept.
+            max_chars: Maximum characters kept of each stream.
+            on_fatal: Function called on the first fatal error. Default
+                terminates process.
+            wait: Function reaping process once pipes are closed. Default
+                is ``process.wait``.
+        """
+        self.process = process
+        self.error_prefix = error_prefix
+        self.fatal_errors = fatal_errors
+        self.on_error = on_error
+        self.on_line = on_line
+        self.on_fatal = on_fatal
+        self.wait = wait if wait is not None else process.wait
+        self.errors = []
+        self.fatal_error = None
+        encoding = locale.getdefaultlocale()[1] or "utf-8"
+        self._streams = {}
+        for name in ("stdout", "stderr"):
+            self._streams[name] = (codecs.getincrementaldecoder(encoding)("replace"), _BoundedText(max_chars), [""])
+
+    def read(self):
+        """Reads both pipes until the process closes them.
+
+        Returns:
+            (stdout, stderr) text, with the middle of long streams left out.
+        """
+        pipes = dict((name, pipe) for name, pipe in (("stdout", self.process.stdout), ("stderr", self.process.stderr))
+                     if pipe is not None)
+        if fcntl is None:
+            # No non-blocking pipes, output is only seen at the end
+            stdout_b, stderr_b = self.process.communicate()
+            for name, data in (("stdout", stdout_b), ("stderr", stderr_b)):
+                if name in pipes:
+                    self.feed(name, data)
+                    self.feed(name, b"")
+        else:
+            names = dict((pipe.fileno(), name) for name, pipe in pipes.items())
+            pending = list(names)
+            for fd in pending:
+                fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            while pending:
+                readable = select.select(pending, [], [])[0]
+                for fd in readable:
+                    try:
+                        data = os.read(fd, self.READ_SIZE)
+                    except OSError as e:
+                        if e.errno in (errno.EAGAIN, errno.EINTR):
+                            continue
+                        raise
+                    self.feed(names[fd], data)
+                    if not data:
+                        pending.remove(fd)
+            self.wait()
+
+        for pipe in pipes.values():
+            pipe.close()
+        return self.get_text()
+
+    def get_text(self):
+        """Returns (stdout, stderr) text read so far."""
+        return self._streams["stdout"][1].get_text(), self._streams["stderr"][1].get_text()
+
+    def feed(self, name, data):
+        """Decodes data of a stream.
+
+        Args:
+            name: "stdout" or "stderr".
+            data: Bytes read, an empty string means end of stream.
+        """
+        decoder, text, partial = self._streams[name]
+        chunk = partial[0] + decoder.decode(data, not data)
+        held = ""
+        if data and chunk.endswith("\r"):
+            chunk, held = chunk[:-1], "\r"  # It may be followed by "\n"
+        lines = self.LINE_BREAK_PATTERN.split(chunk)
+        partial[0] = lines.pop() + held if data else ""
+        if not data and lines[-1] == "":
+            lines.pop()
+        for line in lines:
+            if self.on_line is not None and self.on_line(name, line):
+                continue
+            text.append(line)
+            if name == "stderr" and line.startswith(self.error_prefix):
+                self._error(line)
+
+    def _error(self, line):
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(line)
+        if self.on_error is not None:
+            self.on_error(line)
+        if self.fatal_error is None and any(fatal in line.lower() for fatal in self.fatal_errors):
+            self.fatal_error = line
+            if self.on_fatal is not None:
+                self.on_fatal()
+            elif self.process.poll() is None:
+                self.process.terminate()
+
+
+class _BoundedText(object):
+    """Lines of text keeping at most the first and last max_chars / 2."""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.head = []
+        self.head_chars = 0
+        self.tail = collections.deque()
+        self.tail_chars = 0
+        self.omitted = 0
+
+    def append(self, line):
+        if self.head_chars + len(line) <= self.max_chars // 2 and not self.tail:
+            self.head.append(line)
+            self.head_chars += len(line) + 1
+            return
+        self.tail.append(line)
+        self.tail_chars += len(line) + 1
+        while self.tail_chars > self.max_chars // 2 and len(self.tail) > 1:
+            self.tail_chars -= len(self.tail.popleft()) + 1
+            self.omitted += 1
+
+    def get_text(self):
+        lines = list(self.head)
+        if self.omitted:
+            lines.append("[{0} lines omitted]".format(self.omitted))
+        lines.extend(self.tail)
+        return "\n".join(lines)
+
+
+class Ngspice():
+    # Errors after which ngspice is stopped instead of waited for
+    FATAL_ERRORS = ("fatal", "circuit not parsed", "no circuit loaded")
+
+    _version = None
+
+    @classmethod
+    def version(cls):
+        """Returns ngspice version information.
+
+        ``ngspice --version`` is only run the first time.
+        """
+        if cls._version is None:
+            process = subprocess.Popen(["ngspice", "--version"], shell=False,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout_b, stderr_b = process.communicate()
+            cls._version = stdout_b.decode("utf-8", "replace").strip()
+        return cls._version
+
+    @staticmethod
+    def _command(netlist_path, rawfile_path=None, output_path=None):
+        """Returns ngspice batch mode command line.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: If not None, binary rawfile is also written there.
+            output_path: Output file path. Default is
+                ``netlist_path + ".out"``.
+        """
+        if output_path is None:
+            output_path = str(netlist_path) + ".out"
+        command = ["ngspice", "-b", "-o", str(output_path)]
+        if rawfile_path is not None:
+            command.extend(["-r", str(rawfile_path)])
+        command.append(str(netlist_path))
+        return command
+
+    @staticmethod
+    def _transient_stop(netlist_path):
+        """Returns stop time of netlist file transient analysis or None."""
+        try:
+            with open(netlist_path) as f:
+                return Netlist(f.read()).get_transient_stop()
+        except (IOError, OSError):
+            return None
+
+    @staticmethod
+    def _remove_outputs(netlist_path, rawfile_path=None, output_path=None):
+        """Removes output files of a previous simulation.
+
+        Files are unlinked instead of being overwritten by ngspice, so outputs
+        of previous simulations that are still open or mapped remain valid.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: Binary rawfile path or None.
+            output_path: Output file path. Default is
+                ``netlist_path + ".out"``.
+        """
+        if output_path is None:
+            output_path = str(netlist_path) + ".out"
+        for path in (output_path, rawfile_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    @classmethod
+    def simulatefile(cls, netlist_path, rawfile_path=None, output_path=None, progress=None, limits=None):
+        """Launches ngspice simulation o netlist file.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: If not None, binary rawfile is also written there.
+            output_path: Output file path. Default is
+                ``netlist_path + ".out"``.
+            progress: SimulationProgress to update or None.
+            limits: ResourceLimits of ngspice or None.
+
+        Returns:
+            RunReport telling how ngspice ended and resources it used.
+
+        Raises:
+            ExecutionError: If ngspice was stopped by a resource limit.
+        """
+        cls._remove_outputs(netlist_path, rawfile_path, output_path)
+        supervisor = ProcessSupervisor(limits)
+        process = supervisor.popen(cls._command(netlist_path, rawfile_path, output_path), shell=False,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        on_line = None
+        if progress is not None:
+            progress.reset(cls._transient_stop(netlist_path))
+            on_line = lambda stream, line: progress.feed_line(line)
+        output = ProcessOutput(process, "Error:", cls.FATAL_ERRORS, on_line=on_line, wait=supervisor.wait)
+        output.read()
+        report = supervisor.finish(output.fatal_error, output.errors)
+        if report.limit_exceeded:
+            raise ExecutionError(report.describe(supervisor.limits))
+        if output.errors:
+            raise Exception("\n".join(output.errors))
+        return report
+
+
+class NgspiceAsync():
+    def __init__(self, limits=None):
+        """Inits NgspiceAsync.
+
+        Args:
+            limits: ResourceLimits of ngspice or None.
+        """
+        self.limits = limits
+        self.thread = None
+        self.process = None
+        self.supervisor = None
+        self.report = None
+        self.result = None
+        self.errors = None
+        self.end_event = CompletionEvent()
+        self.progress = SimulationProgress()
+        self._lock_result = Lock()
+        self._lock_errors = Lock()
+
+    def simulatefile(self, netlist_path, rawfile_path=None, output_path=None):
+        """
+        Simulate asyncrhonously netlist_path file with ngspice.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: If not None, binary rawfile is also written there.
+            output_path: Output file path. Default is
+                ``netlist_path + ".out"``.
+
+        Returns:
+            None.
+
+            Sets self.result with (``stout``, ``stderr``).
+            Sets self.errors with a list of ``ExecutionError`` if ``stderr`` is not void.
+            Updates self.progress while ngspice runs.
+            Sets self.report with a ``RunReport`` once ngspice ends.
+        """
+        self.result = None
+        self.errors = None
+        self.report = None
+        self.end_event.clear()
+        self.progress.reset(Ngspice._transient_stop(netlist_path))
+        # Removed before returning, so callers never follow a stale output file
+        Ngspice._remove_outputs(netlist_path, rawfile_path, output_path)
+        self.thread = Thread(group=None, name="ngspice-thread",
+                             target=self._run_simulation, args=(netlist_path, rawfile_path, output_path))
+        self.thread.start()
+
+    def _run_simulation(self, netlist_path, rawfile_path, output_path):
+        self.supervisor = ProcessSupervisor(self.limits)
+        self.process = self.supervisor.popen(Ngspice._command(netlist_path, rawfile_path, output_path),
+                                             shell=False,
+                                             stdout=subprocess.PIPE,
+                                             stderr=subprocess.PIPE)
+
+        output = ProcessOutput(self.process, "Error:", Ngspice.FATAL_ERRORS, on_error=self._on_error,
+                               on_line=self._on_line, wait=self.supervisor.wait)
+        stdout, stderr = output.read()
+        self.report = self.supervisor.finish(output.fatal_error, output.errors)
+        with self._lock_result:
+            self.result = (stdout, stderr)
+        errors = []
+        if output.errors:
+            # Warnings around errors are kept for the execution log
+            errors = [ExecutionError(err) for err in stderr.splitlines() if err]
+        if self.report.limit_exceeded:
+            errors.append(ExecutionError(self.report.describe(self.limits)))
+        if errors:
+            with self._lock_errors:
+                self.errors = errors
+        self.end_event.set()
+
+    def _on_line(self, stream, line):
+        return self.progress.feed_line(line)
+
+    def _on_error(self, line):
+        # Errors are published while ngspice is still running
+        with self._lock_errors:
+            if self.errors is None:
+                self.errors = []
+            self.errors.append(ExecutionError(line))
+
+    def terminate(self):
+        """Kills executing ngspice process and its process group."""
+        if self.supervisor is not None:
+            self.supervisor.cancel()
+
+
+class ExecutionError(Exception):
+    """Execution of process failed."""
+    pass
+
+
+class Gnetlist():
+    @classmethod
+    def create_netlist_file(cls, schematic_path, netlist_path):
+        """Creates a spice netlist file from a gschem file with spice-sdb backend.
+
+        Args:
+            schematic_path: Gschem file path.
+            netlist_path: Netlist file path.
+
+        Raises:
+            ExecutionError: When gnetlist process writes on stderr.
+        """
+        process = subprocess.Popen(["gnetlist", "-g", "spice-sdb", "-o", str(netlist_path), "--", str(schematic_path)],
+                                   shell=False, cwd=os.path.dirname(netlist_path), stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+
+        output = ProcessOutput(process, "ERROR:")
+        output.read()
+        if output.errors:
+            raise ExecutionError("\n".join(output.errors))
+
+
+class Netlist(object):
+    # .include file, .inc file and .lib file section statements
+    INCLUDE_PATTERN = re.compile(r"""^[ \t]*\.(?:include|inc)[ \t]+(?:"([^"]+)"|'([^']+)'|(\S+))""",
+                                 flags=re.MULTILINE | re.IGNORECASE)
+    LIB_PATTERN = re.compile(r"""^[ \t]*\.lib[ \t]+(?:"([^"]+)"|'([^']+)'|(\S+))[ \t]+\S+""",
+                             flags=re.MULTILINE | re.IGNORECASE)
+    # Data files of code models, like filesource and d_source
+    MODEL_FILE_PATTERN = re.compile(r"""\b(?:file|input_file|state_file)[ \t]*=[ \t]*(?:"([^"]+)"|'([^']+)'|([^\s)]+))""",
+                                    flags=re.IGNORECASE)
+
+    # .param statement and each of its assignments
+    PARAM_PATTERN = re.compile(r"^([ \t]*\.param\b)(.*)$", flags=re.MULTILINE | re.IGNORECASE)
+    ASSIGNMENT_PATTERN = re.compile(r"""([A-Za-z_]\w*)(\s*=\s*)(\{[^}]*\}|'[^']*'|"[^"]*"|[^\s=,]+)""")
+
+    # .tran tstep tstop statement
+    TRAN_PATTERN = re.compile(r"^[ \t]*\.tran[ \t]+(\S+)[ \t]+(\S+)", flags=re.MULTILINE | re.IGNORECASE)
+    # Number with an optional scale factor, any other letters are units
+    NUMBER_PATTERN = re.compile(r"^([-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)(meg|mil|[fpnumkgt])?[a-z]*$",
+                                flags=re.IGNORECASE)
+    SCALE_FACTORS = {"f": 1e-15, "p": 1e-12, "n": 1e-9, "u": 1e-6, "m": 1e-3, "k": 1e3, "meg": 1e6, "g": 1e9,
+                     "t": 1e12, "mil": 25.4e-6}
+
+    def __init__(self, source):
+        self.source = source
+
+    def get_parameters(self):
+        """Returns parameters defined with ``.param`` statements.
+
+        Returns:
+            Dictionary mapping lowercase parameter names to their value
+            expressions, as written in netlist.
+        """
+        parameters = {}
+        for statement in self.PARAM_PATTERN.finditer(self.source):
+            for assignment in self.ASSIGNMENT_PATTERN.finditer(statement.group(2)):
+                parameters[assignment.group(1).lower()] = assignment.group(3)
+        return parameters
+
+    def set_parameters(self, values):
+        """Returns netlist source with new parameter values.
+
+        Args:
+            values: Dictionary mapping parameter names to numbers.
+
+        Raises:
+            ValueError: If a parameter is not defined in netlist.
+        """
+        values = dict((name.lower(), value) for name, value in values.items())
+        undefined = set(values) - set(self.get_parameters())
+        if undefined:
+            raise ValueError("Parameters not defined in netlist: " + ", ".join(sorted(undefined)))
+
+        def replace_assignment(assignment):
+            name = assignment.group(1).lower()
+            if name not in values:
+                return assignment.group(0)
+            return assignment.group(1) + assignment.group(2) + repr(float(values[name]))
+
+        def replace_statement(statement):
+            return statement.group(1) + self.ASSIGNMENT_PATTERN.sub(replace_assignment, statement.group(2))
+
+        return self.PARAM_PATTERN.sub(replace_statement, self.source)
+
+    @classmethod
+    def parse_number(cls, text):
+        """Returns value of a spice number, like ``10u`` or ``2.2Meg``.
+
+        Raises:
+            ValueError: If text is not a number.
+        """
+        match = cls.NUMBER_PATTERN.match(text.strip())
+        if match is None:
+            raise ValueError("Not a number: " + text)
+        value = float(match.group(1))
+        if match.group(2):
+            value *= cls.SCALE_FACTORS[match.group(2).lower()]
+        return value
+
+    def get_transient_stop(self):
+        """Returns stop time of the first ``.tran`` statement.
+
+        Returns:
+            Stop time in seconds, or None if there is no transient analysis or
+            its stop time is an expression.
+        """
+        match = self.TRAN_PATTERN.search(self.source)
+        if match is None:
+            return None
+        try:
+            return self.parse_number(match.group(2))
+        except ValueError:
+            return None
+
+    def get_includes(self, base_dir):
+        """Returns paths of files included by netlist.
+
+        ``.include`` and ``.lib`` statements are considered.
+
+        Args:
+            base_dir: Directory relative paths are resolved from.
+
+        Returns:
+            List of absolute paths, in netlist order and without duplicates.
+        """
+        includes = []
+        matches = sorted(list(self.INCLUDE_PATTERN.finditer(self.source)) +
+                         list(self.LIB_PATTERN.finditer(self.source)), key=lambda m: m.start())
+        for match in matches:
+            path = [group for group in match.groups() if group][0]
+            path = os.path.abspath(os.path.join(base_dir, os.path.expanduser(path)))
+            if path not in includes:
+                includes.append(path)
+        return includes
+
+    def get_model_files(self, base_dir):
+        """Returns paths of data files read by code models.
+
+        Args:
+            base_dir: Directory relative paths are resolved from.
+
+        Returns:
+            List of absolute paths, in netlist order and without duplicates.
+        """
+        model_files = []
+        for match in self.MODEL_FILE_PATTERN.finditer(self.source):
+            path = [group for group in match.groups() if group][0]
+            path = os.path.abspath(os.path.join(base_dir, os.path.expanduser(path)))
+            if path not in model_files:
+                model_files.append(path)
+        return model_files
+
+    def with_absolute_includes(self, base_dir):
+        """Returns netlist source with included paths made absolute.
+
+        Args:
+            base_dir: Directory relative paths are resolved from.
+        """
+        def replace(match):
+            for group in (1, 2, 3):
+                if match.group(group):
+                    path = os.path.abspath(os.path.join(base_dir, os.path.expanduser(match.group(group))))
+                    start, end = match.span(group)
+                    text = match.group(0)
+                    offset = match.start(0)
+                    if group == 3:
+                        path = '"' + path + '"'  # Paths may have spaces now
+                    return text[:start - offset] + path + text[end - offset:]
+            return match.group(0)
+
+        source = self.INCLUDE_PATTERN.sub(replace, self.source)
+        return self.LIB_PATTERN.sub(replace, source)
+
+    @classmethod
+    def get_dependencies(cls, netlist_path):
+        """Returns files a netlist file depends on, recursively.
+
+        Included files are scanned for their own dependencies, code model
+        data files are not.
+
+        Args:
+            netlist_path: Netlist file path.
+
+        Returns:
+            List of absolute paths. Missing files are included too.
+        """
+        dependencies = []
+        pending = [os.path.abspath(netlist_path)]
+        while pending:
+            path = pending.pop(0)
+            try:
+                with open(path) as f:
+                    source = f.read()
+            except (IOError, OSError):
+                continue  # Missing file, it has no dependencies
+            netlist = cls(source)
+            for include in netlist.get_includes(os.path.dirname(path)):
+                if include not in dependencies and include != os.path.abspath(netlist_path):
+                    dependencies.append(include)
+                    pending.append(include)
+            for model_file in netlist.get_model_files(os.path.dirname(path)):
+                if model_file not in dependencies:
+                    dependencies.append(model_file)
+        return dependencies
+
+    def get_title(self):
+        match = re.search("^\.title (?P<title>.*)$", self.source, flags=re.MULTILINE | re.IGNORECASE)
+        if match:
+            return match.group("title").strip()
+        else:
+            title = str(self.source[0:self.source.find("\n")])
+            if len(title) > 0:
+                if title.startswith("*"):
+                    return title[1:].strip()
+                else:
+                    return title.strip()
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simulation in a long-lived ngspice process.
+
+Starting ngspice and loading its code models takes most of the time of small
+simulations. A session keeps one ngspice process running in pipe mode and
+simulates every netlist with ``source`` and ``run`` commands written to its
+standard input, so that cost is paid once.
+
+Each command group ends with an ``echo`` of a unique marker, output is read
+until the marker comes back. A process that exits or does not answer in time
+is killed and started again on next use.
+"""
+
+import locale
+import os
+import os.path
+import subprocess
+from threading import Lock, Thread
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from completion_event import CompletionEvent
+from ngspice_process import ExecutionError, Ngspice, ProcessOutput
+from simulation_progress import SimulationProgress
+
+
+class NgspiceSession(object):
+    """Simulates netlists in a persistent ngspice process.
+
+    It has the same interface as ``NgspiceAsync``. Results are always
+    written to a binary rawfile, because ``.print`` tables are only printed
+    in batch mode. Output and rawfile paths are the same as NgspiceAsync
+    ones.
+
+    A session runs one simulation at a time.
+
+    Attributes:
+        end_event: Set when simulation ends.
+        errors: List of ``ExecutionError`` or None.
+        result: (output, "") once simulation ends. ngspice standard error is
+            merged into its standard output, so errors keep their place in it.
+        timeout: Maximum seconds a simulation may run, or None.
+    """
+
+    PING_TIMEOUT = 5.0
+    MARKER = "spicegui-session-marker"
+
+    def __init__(self, timeout=None):
+        """Inits NgspiceSession. ngspice is started on first simulation.
+
+        Args:
+            timeout: Maximum seconds a simulation may run, or None. ngspice
+                is restarted if it does not answer in time.
+        """
+        self.timeout = timeout
+        self.thread = None
+        self.process = None
+        self.result = None
+        self.errors = None
+        self.end_event = CompletionEvent()
+        self.end_event.set()
+        self.progress = SimulationProgress()
+        self._lines = None
+        self._marker_count = 0
+        self._circuit_loaded = False
+        self._lock = Lock()
+        self._encoding = locale.getdefaultlocale()[1] or "utf-8"
+
+    def start(self):
+        """Starts ngspice if it is not running."""
+        with self._lock:
+            if self.process is not None and self.process.poll() is None:
+                return
+            self.process = subprocess.Popen(["ngspice", "-p"], shell=False, stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self._lines = queue.Queue()
+            self._circuit_loaded = False
+            reader = Thread(name="ngspice-session-reader", target=self._read_lines,
+                            args=(self.process, self._lines))
+            reader.daemon = True
+            reader.start()
+        # Startup messages are discarded
+        self._execute(["set noaskquit"], self.PING_TIMEOUT)
+
+    def _read_lines(self, process, lines):
+        def on_line(stream, line):
+            lines.put(line)
+            return True  # Lines are kept by _execute()
+
+        try:
+            ProcessOutput(process, on_line=on_line).read()
+        finally:
+            lines.put(None)
+
+    def _execute(self, commands, timeout, on_line=None):
+        """Runs ngspice commands and returns their output lines.
+
+        Args:
+            commands: List of commands.
+            timeout: Maximum seconds waiting for a line, or None.
+            on_line: Function called with every output line. Lines it
+                returns True for are not returned.
+
+        Raises:
+            ExecutionError: If ngspice exits or does not answer before
+                timeout. It is killed then.
+        """
+        self._marker_count += 1
+        marker = "{0}-{1}".format(self.MARKER, self._marker_count)
+        process, lines = self.process, self._lines
+        try:
+            process.stdin.write("".join(command + "\n" for command in commands + ["echo " + marker])
+                                .encode(self._encoding))
+            process.stdin.flush()
+        except (IOError, OSError):
+            self.close()
+            raise ExecutionError("ngspice session exited")
+
+        output = []
+        while True:
+            try:
+                line = lines.get(timeout=timeout)
+            except queue.Empty:
+                self.close()
+                raise ExecutionError("ngspice did not answer in {0} seconds".format(timeout))
+            if line is None:
+                self.close()
+                raise ExecutionError("ngspice session exited:\n" + "\n".join(output))
+            if line.strip() == marker:
+                return output
+            if on_line is None or not on_line(line):
+                output.append(line)
+
+    def is_alive(self):
+        """Returns True if ngspice is running and answering commands."""
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            self._execute([], self.PING_TIMEOUT)
+            return True
+        except ExecutionError:
+            return False
+
+    def simulate(self, netlist_path, rawfile_path, output_path=None, cwd=None, progress=None):
+        """Simulates netlist_path file and waits for it.
+
+        ngspice is started, or started again if it is not healthy.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: Binary rawfile path.
+            output_path: File ngspice output is written to. Default is
+                ``netlist_path + ".out"``.
+            cwd: Folder relative included files are looked for in. Default
+                is netlist folder.
+            progress: SimulationProgress to update or None.
+
+        Returns:
+            ngspice output text.
+
+        Raises:
+            ExecutionError: If ngspice reported errors, exited or did not
+                answer in time.
+        """
+        if output_path is None:
+            output_path = str(netlist_path) + ".out"
+        if not self.is_alive():
+            self.close()
+            self.start()
+
+        netlist_path = os.path.abspath(netlist_path)
+        if cwd is None:
+            cwd = os.path.dirname(netlist_path)
+        # Previous circuit and results are freed first
+        commands = ["destroy all"]
+        if self._circuit_loaded:
+            commands.append("remcirc")
+        # Relative .include paths are looked for in working folder
+        commands.extend(["cd " + self._quote(os.path.abspath(cwd)),
+                         "source " + self._quote(netlist_path),
+                         "run " + self._quote(os.path.abspath(rawfile_path))])
+        self._circuit_loaded = True
+        on_line = None
+        if progress is not None:
+            progress.reset(Ngspice._transient_stop(netlist_path))
+            on_line = progress.feed_line
+        output = "\n".join(self._execute(commands, self.timeout, on_line))
+        with open(output_path, "w") as f:
+            f.write(output)
+
+        errors = [line for line in output.splitlines() if line.startswith("Error")]
+        if errors:
+            raise ExecutionError("\n".join(errors))
+        return output
+
+    @staticmethod
+    def _quote(path):
+        # Quotes are not removed from every command argument by ngspice
+        if any(c.isspace() for c in path):
+            return '"' + path + '"'
+        return path
+
+    def simulatefile(self, netlist_path, rawfile_path=None, output_path=None):
+        """Simulates asynchronously netlist_path file.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: Binary rawfile path. Default is
+                ``netlist_path + ".raw"``.
+            output_path: Output file path. Default is
+                ``netlist_path + ".out"``.
+        """
+        if rawfile_path is None:
+            rawfile_path = str(netlist_path) + ".raw"
+        self.result = None
+        self.errors = None
+        self.end_event.clear()
+        Ngspice._remove_outputs(netlist_path, rawfile_path, output_path)
+        self.thread = Thread(group=None, name="ngspice-session-thread",
+                             target=self._run_simulation, args=(netlist_path, rawfile_path, output_path))
+        self.thread.start()
+
+    def _run_simulation(self, netlist_path, rawfile_path, output_path):
+        try:
+            self.result = (self.simulate(netlist_path, rawfile_path, output_path, progress=self.progress), "")
+        except ExecutionError as e:
+            self.result = (str(e), "")
+            self.errors = [ExecutionError(line) for line in str(e).splitlines() if line]
+        except (IOError, OSError) as e:
+            self.result = (str(e), "")
+            self.errors = [ExecutionError(str(e))]
+        self.end_event.set()
+
+    def terminate(self):
+        """Stops running simulation.
+
+        ngspice is killed and started again on next simulation.
+        """
+        if not self.end_event.is_set():
+            self.close()
+
+    def close(self):
+        """Stops ngspice."""
+        with self._lock:
+            process, self.process = self.process, None
+        if process is None:
+            return
+        if process.poll() is None:
+            process.kill()  # A hung ngspice would not read a quit command
+        process.wait()
+        try:
+            process.stdin.close()  # Standard output is closed by its reader
+        except (IOError, OSError):
+            pass
@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""In-process ngspice simulation through the ngspice shared library.
+
+Circuits are handed to ``libngspice`` as lines of text and simulated points
+arrive through its callbacks, straight into numpy arrays. No process is
+started, no file is written and no output is parsed.
+
+libngspice keeps global state, so a single simulation runs at a time in a
+process.
+"""
+
+import ctypes
+import ctypes.util
+import os.path
+import re
+from threading import Lock
+
+import numpy
+
+from completion_event import CompletionEvent
+from ngspice_simulation import ExecutionError, Netlist, Ngspice, NgspiceOutput
+from simulation_progress import SimulationProgress
+
+
+class _VecValues(ctypes.Structure):
+    _fields_ = [("name", ctypes.c_char_p),
+                ("creal", ctypes.c_double),
+                ("cimag", ctypes.c_double),
+                ("is_scale", ctypes.c_bool),
+                ("is_complex", ctypes.c_bool)]
+
+
+class _VecValuesAll(ctypes.Structure):
+    _fields_ = [("veccount", ctypes.c_int),
+                ("vecindex", ctypes.c_int),
+                ("vecsa", ctypes.POINTER(ctypes.POINTER(_VecValues)))]
+
+
+class _VecInfo(ctypes.Structure):
+    _fields_ = [("number", ctypes.c_int),
+                ("vecname", ctypes.c_char_p),
+                ("is_real", ctypes.c_bool),
+                ("pdvec", ctypes.c_void_p),
+                ("pdvecscale", ctypes.c_void_p)]
+
+
+class _VecInfoAll(ctypes.Structure):
+    _fields_ = [("name", ctypes.c_char_p),
+                ("title", ctypes.c_char_p),
+                ("date", ctypes.c_char_p),
+                ("type", ctypes.c_char_p),
+                ("veccount", ctypes.c_int),
+                ("vecs", ctypes.POINTER(ctypes.POINTER(_VecInfo)))]
+
+
+_SendChar = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_void_p)
+_SendStat = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_void_p)
+_ControlledExit = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.c_bool, ctypes.c_bool, ctypes.c_int,
+                                   ctypes.c_void_p)
+_SendData = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(_VecValuesAll), ctypes.c_int, ctypes.c_int,
+                             ctypes.c_void_p)
+_SendInitData = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(_VecInfoAll), ctypes.c_int, ctypes.c_void_p)
+_BGThreadRunning = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_bool, ctypes.c_int, ctypes.c_void_p)
+
+
+class _Plot(object):
+    """Points of a plot received from libngspice."""
+
+    INITIAL_CAPACITY = 4096
+
+    def __init__(self, analysis, date, names, complex_values):
+        self.analysis = analysis
+        self.date = date
+        self.names = names
+        self.points = 0
+        self.columns = None  # Column of every vector, known on first point
+        self._data = numpy.empty((self.INITIAL_CAPACITY, len(names)),
+                                 dtype=numpy.complex128 if complex_values else numpy.float64)
+
+    def append(self, values):
+        if self.points == len(self._data):
+            grown = numpy.empty((2 * len(self._data), len(self.names)), dtype=self._data.dtype)
+            grown[:self.points] = self._data[:self.points]
+            self._data = grown
+        self._data[self.points] = values
+        self.points += 1
+
+    def data_lines(self):
+        # Views stay valid when more points are appended
+        table = self._data[:self.points]
+        return [NgspiceOutput.DataLine(name, table[:, i]) for i, name in enumerate(self.names)]
+
+
+class NgspiceShared(object):
+    """Simulates netlists with the ngspice shared library.
+
+    It has the same interface as ``NgspiceAsync``, results are read with
+    ``get_output()`` instead of from output files.
+
+    Attributes:
+        end_event: Set when simulation ends.
+        errors: List of ``ExecutionError`` or None.
+        result: (log, "") once simulation ends, like NgspiceAsync.
+    """
+
+    LIBRARY_NAMES = ["libngspice.so.0", "libngspice.so", "libngspice.dylib", "ngspice.dll"]
+    # Analysis names ngspice prints, by plot name without its number
+    PLOT_ANALYSES = {"tran": "Transient Analysis",
+                     "ac": "AC Analysis",
+                     "dc": "DC transfer characteristic",
+                     "op": "Operating Point",
+                     "noise": "Noise Spectral Density Curves",
+                     "tf": "Transfer Function",
+                     "sens": "Sensitivity Analysis",
+                     "pz": "Pole-Zero Analysis"}
+
+    _library = None
+    _callbacks = None
+    _active = None  # NgspiceShared receiving library callbacks
+    _circuit_loaded = False
+    _capture = None  # List receiving library output when not None
+    _version = None
+    _library_lock = Lock()
+
+    def __init__(self):
+        """Inits NgspiceShared.
+
+        Raises:
+            OSError: If ngspice shared library cannot be loaded.
+        """
+        self._load_library()
+        self.result = None
+        self.errors = None
+        self.end_event = CompletionEvent()
+        self.end_event.set()
+        self.progress = SimulationProgress()
+        self._log = []
+        self._title = None
+        self._plots = []
+        self._lock = Lock()
+        self._updated = False
+
+    @classmethod
+    def available(cls):
+        """Returns True if ngspice shared library can be loaded."""
+        try:
+            cls._load_library()
+            return True
+        except OSError:
+            return False
+
+    @classmethod
+    def _load_library(cls):
+        with cls._library_lock:
+            if cls._library is not None:
+                return
+            names = list(cls.LIBRARY_NAMES)
+            found = ctypes.util.find_library("ngspice")
+            if found is not None:
+                names.insert(0, found)
+            error = None
+            for name in names:
+                try:
+                    library = ctypes.CDLL(name)
+                    break
+                except OSError as e:
+                    error = e
+            else:
+                raise error
+
+            library.ngSpice_Init.argtypes = [_SendChar, _SendStat, _ControlledExit, _SendData, _SendInitData,
+                                             _BGThreadRunning, ctypes.c_void_p]
+            library.ngSpice_Command.argtypes = [ctypes.c_char_p]
+            library.ngSpice_Circ.argtypes = [ctypes.POINTER(ctypes.c_char_p)]
+            library.ngSpice_running.restype = ctypes.c_bool
+
+            # Library calls them from its threads, they must never be freed
+            cls._callbacks = (_SendChar(cls._on_send_char), _SendStat(cls._on_send_stat),
+                              _ControlledExit(cls._on_controlled_exit), _SendData(cls._on_send_data),
+                              _SendInitData(cls._on_send_init_data), _BGThreadRunning(cls._on_bg_thread_running))
+            library.ngSpice_Init(*(cls._callbacks + (None,)))
+            cls._library = library
+
+    @classmethod
+    def version(cls):
+        """Returns ngspice shared library version information.
+
+        Raises:
+            OSError: If ngspice shared library cannot be loaded.
+        """
+        cls._load_library()
+        if cls._version is None:
+            lines = []
+            cls._capture = lines
+            try:
+                cls._library.ngSpice_Command(b"version -s")
+            finally:
+                cls._capture = None
+            cls._version = "\n".join(lines).strip()
+        return cls._version
+
+    def _command(self, command):
+        if self._library.ngSpice_Command(command.encode("utf-8")) != 0:
+            raise ExecutionError("ngspice command failed: " + command)
+
+    def simulatefile(self, netlist_path, rawfile_path=None, output_path=None):
+        """Simulates asynchronously netlist_path file.
+
+        Args:
+            netlist_path: Netlist file path.
+            rawfile_path: Ignored, results are kept in memory.
+            output_path: Ignored, output is returned by ``get_log()``.
+
+        Raises:
+            ExecutionError: If netlist cannot be loaded.
+        """
+        if not self.end_event.is_set() or self._library.ngSpice_running():
+            raise ExecutionError("A simulation is already running")
+
+        with open(netlist_path) as f:
+            netlist = Netlist(f.read())
+        # Library working directory is SpiceGUI's, not netlist's one
+        source = netlist.with_absolute_includes(os.path.dirname(os.path.abspath(netlist_path)))
+        lines = [line.encode("utf-8") for line in source.splitlines()]
+        if not lines or lines[-1].strip().lower() != b".end":
+            lines.append(b".end")
+
+        NgspiceShared._active = self
+        # Free previous circuit and results
+        if NgspiceShared._circuit_loaded:
+            self._command("remcirc")
+        self._command("destroy all")
+
+        self.result = None
+        self.errors = None
+        self._log = []
+        self._title = None
+        self.progress.reset(Ngspice._transient_stop(netlist_path))
+        with self._lock:
+            self._plots = []
+            self._updated = False
+
+        circuit = (ctypes.c_char_p * (len(lines) + 1))(*(lines + [None]))
+        self._library.ngSpice_Circ(circuit)
+        NgspiceShared._circuit_loaded = True
+        errors = [line for line in self._log if line.startswith("Error")]
+        if errors:
+            raise ExecutionError("\n".join(errors))
+
+        self.end_event.clear()
+        self._command("bg_run")
+
+    def terminate(self):
+        """Stops running simulation."""
+        if not self.end_event.is_set():
+            self._command("bg_halt")
+
+    def update(self):
+        """Returns True if points arrived since the last call."""
+        with self._lock:
+            updated, self._updated = self._updated, False
+            return updated
+
+    def get_output(self):
+        """Returns a NgspiceOutput with the points received so far.
+
+        As in ``NgspiceOutput.parse_raw()``, the first supported analysis is
+        selected.
+        """
+        output = NgspiceOutput()
+        with self._lock:
+            plots = [plot for plot in self._plots if plot.points > 0]
+            for plot in plots:
+                output.tables.append(NgspiceOutput.Table(len(output.tables), plot.analysis, plot.date,
+                                                         tuple(plot.names), None, plot.data_lines))
+        output.circuit_name = self._title
+        for table in output.tables:
+            if table.analysis in NgspiceOutput.SUPPORTED_ANALYSES:
+                output.select_analysis(table.analysis)
+                break
+        else:
+            if output.tables:
+                output.select_analysis(output.tables[0].analysis)
+        return output
+
+    def get_log(self):
+        """Returns text ngspice wrote to its standard output and error."""
+        return "\n".join(self._log)
+
+    # Library callbacks. They run in library threads and must not call it.
+
+    @staticmethod
+    def _decode(text):
+        return text.decode("utf-8", "replace") if text is not None else ""
+
+    @classmethod
+    def _on_send_char(cls, text, ident, user_data):
+        line = cls._decode(text)
+        for prefix in ("stdout ", "stderr "):
+            if line.startswith(prefix):
+                line = line[len(prefix):]
+        if cls._capture is not None:
+            cls._capture.append(line)
+        elif cls._active is not None:
+            cls._active._log.append(line)
+        return 0
+
+    @classmethod
+    def _on_send_stat(cls, text, ident, user_data):
+        # Statuses like "tran: 12.3%"
+        self = cls._active
+        if self is not None:
+            self.progress.feed_line(cls._decode(text))
+        return 0
+
+    @classmethod
+    def _on_controlled_exit(cls, status, immediate, quit_exit, ident, user_data):
+        # Library can not be used anymore, it must be loaded again
+        self = cls._active
+        if self is not None:
+            self.errors = [ExecutionError("ngspice exited with status {0}".format(status))]
+            self.end_event.set()
+        return 0
+
+    @classmethod
+    def _on_send_init_data(cls, info, ident, user_data):
+        self = cls._active
+        if self is None:
+            return 0
+        info = info.contents
+        names = []
+        complex_values = False
+        for i in range(info.veccount):
+            vector = info.vecs[i].contents
+            names.append(cls._vector_name(cls._decode(vector.vecname)))
+            complex_values = complex_values or not vector.is_real
+        try:
+            date = NgspiceOutput._parse_ngspice_output_date(cls._decode(info.date))
+        except ValueError:
+            date = None
+        self._title = cls._decode(info.title)
+        with self._lock:
+            self._plots.append(_Plot(cls._plot_analysis(cls._decode(info.name), cls._decode(info.type)),
+                                     date, names, complex_values))
+        return 0
+
+    @classmethod
+    def _on_send_data(cls, values, count, ident, user_data):
+        self = cls._active
+        if self is None or not self._plots:
+            return 0
+        values = values.contents
+        plot = self._plots[-1]
+        vectors = [values.vecsa[i].contents for i in range(values.veccount)]
+        if plot.columns is None:
+            # Vectors may come in another order, scale goes first
+            names = [cls._vector_name(cls._decode(vector.name)) for vector in vectors]
+            order = sorted(range(len(vectors)), key=lambda i: not vectors[i].is_scale)
+            plot.names = [names[i] for i in order]
+            plot.columns = order
+        point = [complex(vectors[i].creal, vectors[i].cimag) if vectors[i].is_complex else vectors[i].creal
+                 for i in plot.columns]
+        with self._lock:
+            plot.append(point)
+            self._updated = True
+        return 0
+
+    @classmethod
+    def _on_bg_thread_running(cls, not_running, ident, user_data):
+        self = cls._active
+        if self is not None and not_running:
+            errors = [ExecutionError(line) for line in self._log if line.startswith("Error")]
+            if errors and self.errors is None:
+                self.errors = errors
+            self.result = (self.get_log(), "")
+            self.end_event.set()
+        return 0
+
+    @classmethod
+    def _plot_analysis(cls, name, type_name):
+        """Returns analysis name of a plot, as in ngspice output.
+
+        Args:
+            name: Plot name, like ``tran1``.
+            type_name: Plot type, used when name is not a known analysis.
+        """
+        analysis = cls.PLOT_ANALYSES.get(re.sub(r"[0-9]+$", "", name).lower())
+        if analysis is not None:
+            return analysis
+        return type_name or name
+
+    @staticmethod
+    def _vector_name(name):
+        """Returns vector name as printed by ngspice.
+
+        Library names node voltages without ``v()``.
+        """
+        if name in ("time", "frequency") or "(" in name or "#" in name or name.endswith("-sweep"):
+            return name
+        return "v({0})".format(name)
+
@@ -18,61 +18,85 @@
 
 from __future__ import print_function
 
-import csv
+import functools
 import locale
+import mmap
+import os
 import os.path
 import re
-import subprocess
 import datetime
+from array import array
 
-from gi.repository import Gio
-from matplotlib.figure import Figure
-from threading import Event, Lock, Thread
+import numpy
 
 import config
+# Re-exported, they used to be defined here
+from ngspice_process import ExecutionError, Gnetlist, Netlist, Ngspice, NgspiceAsync, ProcessOutput
 
 
-class NgspiceOutput():
+class NgspiceOutput(object):
     """Ngspice output management.
 
+    Output is indexed on load but table contents are only parsed when data
+    lines of their analysis are first requested.
+
     Attributes:
-        name: Name.
-        values: Data.
+        circuit_name: Circuit name.
+        tables: List of Table objects, in output order.
+        analysis: Selected analysis.
+        date: Selected analysis date.
+        data_lines: DataLine objects of selected analysis.
         SUPPORTED_ANALYSES: Supported analyses.
     """
 
     SUPPORTED_ANALYSES = ["Transient Analysis", "AC Analysis", "DC transfer characteristic"]
 
-    class DataLine():
+    # Mapped output parsing
+    _NON_DATA_LINE_START = re.compile(b"\n(?![0-9])")
+    MAPPED_CHUNK_SIZE = 4 * 1024 * 1024
+
+    class DataLine(object):
         """Set of values obtained from simulation.
 
         Represents a table column in a ngspice output.
 
         Attributes:
             name: Name.
-            values: Data.
+            values: Data as a float64 ``numpy.ndarray``, or complex128 for
+                complex vectors.
             independent: True if it is an independent data set.
+            magnitude: Name prefix before parentheses or None.
+            absolute: Absolute values, computed on first use.
+            decibels: Absolute values in dB, computed on first use.
+            phase: Phase in radians, computed on first use.
         """
 
+        __slots__ = ("name", "values", "independent", "magnitude", "_derived")
+
         def __init__(self, name, values):
             """Inits DataLine with name and values.
 
             Args:
                 name: Column name.
-                values: Column data.
+                values: Column data. Any sequence or buffer of numbers. Buffers
+                    of doubles, like ``array('d')``, and numpy arrays are used
+                    without copying.
             """
             self.name = name
-            # Cairo limitation. See backend_cairo.py line 142 in matplotlib package.
-            if len(values) > 18980:
-                raise ValueError(_("There are too much data points in simulation."))
-            else:
-                self.values = values
-
             if name in ["Index", "time", "frequency", "v-sweep", "res-sweep", "temp-sweep", "i-sweep"]:
                 self.independent = True
             else:
                 self.independent = False
 
+            values = numpy.asarray(values)
+            if numpy.iscomplexobj(values) and not self.independent:
+                self.values = values
+            else:
+                # Scale of complex plots has a null imaginary part
+                self.values = numpy.asarray(values.real, dtype=numpy.float64)
+            self._derived = {}
+
+            self.magnitude = None
             parentheses_index = self.name.find("(")
             if parentheses_index > 0:
                 self.magnitude = self.name[:parentheses_index]
@@ -132,6 +156,31 @@ class NgspiceOutput():
             else:
                 return "", ""
 
+        @property
+        def is_complex(self):
+            return numpy.iscomplexobj(self.values)
+
+        def _get_derived(self, key, function):
+            """Returns function(values), computed only the first time."""
+            try:
+                return self._derived[key]
+            except KeyError:
+                derived = self._derived[key] = function(self.values)
+                return derived
+
+        @property
+        def absolute(self):
+            return self._get_derived("absolute", numpy.abs)
+
+        @property
+        def decibels(self):
+            with numpy.errstate(divide="ignore"):  # log10(0) is -inf
+                return self._get_derived("decibels", lambda values: 20.0 * numpy.log10(self.absolute))
+
+        @property
+        def phase(self):
+            return self._get_derived("phase", numpy.angle)
+
         def extend(self, other_data_line):
             """Extends DataLine with contents of another one.
 
@@ -141,28 +190,297 @@ class NgspiceOutput():
                 ValueError: If other_data_line has not the same name and magnitude.
             """
             if other_data_line.name == self.name and other_data_line.magnitude == self.magnitude:
-                self.values.extend(other_data_line.values)
+                self.values = numpy.concatenate((self.values, other_data_line.values))
+                self._derived = {}
             else:
                 raise ValueError("Data lines have not the same name nor magnitude.")
 
-    def __init__(self, raw_text):
+    class Table(object):
+        """Index entry of a table in a ngspice output.
+
+        Table content is parsed by loader the first time data_lines is read.
+
+        Attributes:
+            plot: Number of the plot (simulation run) the table belongs to.
+                Wide plots are split by ngspice in several tables.
+            analysis: Analysis name.
+            date: Analysis date. It may be None.
+            headers: Column names.
+            offset: Table position in output.
+        """
+
+        __slots__ = ("plot", "analysis", "date", "headers", "offset", "_loader", "_data_lines")
+
+        def __init__(self, plot, analysis, date, headers, offset, loader):
+            """Inits Table.
+
+            Args:
+                plot: Plot number.
+                analysis: Analysis name.
+                date: Analysis date.
+                headers: Column names.
+                offset: Table position in output.
+                loader: Callable without arguments returning table DataLine list.
+            """
+            self.plot = plot
+            self.analysis = analysis
+            self.date = date
+            self.headers = headers
+            self.offset = offset
+            self._loader = loader
+            self._data_lines = None
+
+        @property
+        def data_lines(self):
+            """DataLine list of table. Table is parsed on first access."""
+            if self._data_lines is None:
+                self._data_lines = self._loader()
+                self._loader = None
+            return self._data_lines
+
+        @property
+        def loaded(self):
+            """True if table content has been parsed."""
+            return self._data_lines is not None
+
+    def __init__(self, raw_text=None):
         """Inits NgspiceOutput with ngspice output text.
 
         Args:
-            raw_text: Ngspice output text.
+            raw_text: Ngspice output text. If it is None, nothing is parsed.
         """
         self.circuit_name = None
-        self._parse(raw_text)
+        self.analysis = None
+        self.date = None
+        self.tables = []
+        self._plot = None
+        self._data_lines = None
+        self._read_lines = None
+        self._buffer = None  # Mapped output file
+        if raw_text is not None:
+            self._read_lines = functools.partial(self._split_lines, raw_text)
+            self._parse(self._read_lines(0))
 
     @classmethod
     def parse_file(cls, ngspice_result_file):
         """Inits NgspiceOutput with ngspice output file path.
 
+        File is memory mapped. Table headers, page breaks and separators are
+        located by scanning the mapped buffer and table rows are converted in
+        chunks, so resident memory is bounded by parsed data size, not by text
+        size. Tables are parsed on demand.
+
         Args:
             ngspice_result_file: Ngspice output file path.
         """
-        with open(ngspice_result_file) as f:
-            return cls(f.read())
+        output = cls()
+        with open(ngspice_result_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                output._parse(iter(()))  # Raises "no circuit" error
+            output._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        output._read_lines = functools.partial(cls._read_mapped_lines, output._buffer)
+        output._parse(output._read_lines(0))
+        return output
+
+    @classmethod
+    def parse_raw(cls, ngspice_raw_file):
+        """Inits NgspiceOutput with ngspice binary rawfile path.
+
+        Rawfile is memory mapped and DataLine values are numpy views of its
+        binary sections, so only headers are actually read on load. Every plot
+        in the file is indexed in ``tables`` and the first supported one is
+        selected.
+
+        Args:
+            ngspice_raw_file: Ngspice binary rawfile path (``ngspice -r``).
+
+        Raises:
+            ValueError: If file is not a binary rawfile.
+            ExecutionError: If file has no plots.
+        """
+        output = cls()
+        with open(ngspice_raw_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ExecutionError(_("No simulations were done."))
+            raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        position = 0
+        while position < len(raw):
+            position = output._parse_raw_plot(raw, position)
+
+        for table in output.tables:
+            if table.analysis in cls.SUPPORTED_ANALYSES:
+                output.select_analysis(table.analysis)
+                break
+        else:
+            output.select_analysis(output.tables[0].analysis)
+        return output
+
+    def _parse_raw_plot(self, raw, position):
+        """Indexes a rawfile plot starting at position.
+
+        Args:
+            raw: Rawfile content as a buffer.
+            position: Plot header offset.
+
+        Returns:
+            Offset of next plot header.
+
+        Raises:
+            ValueError: If plot is not a binary one.
+        """
+        binary_pos = raw.find(b"Binary:\n", position)
+        if binary_pos < 0:
+            raise ValueError("PARSING ERROR: Only binary rawfiles are supported")
+
+        fields, names, dtype, date = self._parse_raw_header(raw[position:binary_pos])
+        variables_count = len(names)
+        points_count = int(fields["No. Points"])
+
+        if self.circuit_name is None:
+            self.circuit_name = fields.get("Title")
+
+        data_pos = binary_pos + len(b"Binary:\n")
+        loader = functools.partial(self._load_raw_table, raw, data_pos, dtype, points_count, names)
+        self.tables.append(NgspiceOutput.Table(len(self.tables), fields.get("Plotname"), date, tuple(names),
+                                               data_pos, loader))
+
+        return data_pos + dtype.itemsize * variables_count * points_count
+
+    @staticmethod
+    def _parse_raw_header(header):
+        """Parses a rawfile plot header.
+
+        Args:
+            header: Header bytes, without the trailing ``Binary:`` line.
+
+        Returns:
+            (fields, variable names, point dtype, date). fields maps header
+            keys to their values. date is None if it can not be parsed.
+        """
+        fields = {}
+        names = []
+        in_variables = False
+        for line in header.decode("utf-8", "replace").splitlines():
+            if in_variables and line[:1].isspace():
+                # Variable description: index, name, type and optional parameters
+                names.append(line.split()[1])
+            else:
+                key, sep, value = line.partition(":")
+                fields[key.strip()] = value.strip()
+                in_variables = key.strip() == "Variables"
+
+        if len(names) != int(fields["No. Variables"]):
+            raise ValueError("PARSING ERROR: Variable count mismatch")
+        if "complex" in fields.get("Flags", "").split():
+            dtype = numpy.dtype(numpy.complex128)
+        else:
+            dtype = numpy.dtype(numpy.float64)
+
+        try:
+            date = NgspiceOutput._parse_ngspice_output_date(fields.get("Date", ""))
+        except ValueError:
+            date = None
+        return fields, names, dtype, date
+
+    @staticmethod
+    def _load_raw_table(raw, offset, dtype, points_count, names):
+        """Returns DataLine list of a rawfile plot as views of raw."""
+        table = numpy.frombuffer(raw, dtype=dtype, count=len(names) * points_count, offset=offset)
+        table = table.reshape(points_count, len(names))
+
+        data_lines = []
+        for i, name in enumerate(names):
+            if i == 0:
+                # Scale of complex plots has a null imaginary part
+                data_line = NgspiceOutput.DataLine(name, table[:, 0].real)
+                data_line.independent = True
+            else:
+                data_line = NgspiceOutput.DataLine(name, table[:, i])
+            data_lines.append(data_line)
+        return data_lines
+
+    @staticmethod
+    def _split_lines(raw_text, offset=0):
+        """Yields (offset, line) for raw_text lines from offset on.
+
+        Lines are yielded one by one without building a list of them.
+        """
+        end = raw_text.find("\n", offset)
+        while end >= 0:
+            yield offset, raw_text[offset:end].rstrip("\r")
+            offset = end + 1
+            end = raw_text.find("\n", offset)
+        yield offset, raw_text[offset:]
+
+    @staticmethod
+    def _read_mapped_lines(buf, offset=0):
+        """Yields (offset, line) for buf lines not starting with a digit.
+
+        Table rows are skipped by the regular expression engine, so they are
+        never copied out of buf. Offset must be the start of a line.
+        """
+        encoding = locale.getpreferredencoding()
+        start = offset if not buf[offset:offset + 1].isdigit() else None
+        end = offset
+        while end < len(buf):
+            if start is None:
+                match = NgspiceOutput._NON_DATA_LINE_START.search(buf, end)
+                if match is None:
+                    return
+                start = match.start() + 1
+            end = buf.find(b"\n", start)
+            if end < 0:
+                end = len(buf)
+            yield start, buf[start:end].rstrip(b"\r").decode(encoding, "replace")
+            start = None
+
+    @property
+    def analyses(self):
+        """List of analyses in output, in order."""
+        analyses = []
+        for table in self.tables:
+            if table.analysis not in analyses:
+                analyses.append(table.analysis)
+        return analyses
+
+    @property
+    def data_lines(self):
+        """DataLine list of selected analysis.
+
+        Data lines of every table of the selected plot are joined. Tables are
+        parsed on first access.
+        """
+        if self._data_lines is None and self._plot is not None:
+            joined_tables = []
+            for table in self.tables:
+                if table.plot != self._plot:
+                    continue
+                if not joined_tables:
+                    joined_tables.extend(table.data_lines)  # Include first table
+                else:
+                    # Discard independent data lines because they were just included.
+                    joined_tables.extend([d for d in table.data_lines if not d.independent])
+            self._data_lines = joined_tables
+        return self._data_lines
+
+    def select_analysis(self, analysis):
+        """Selects first plot of an analysis.
+
+        Args:
+            analysis: Analysis name, one of ``analyses``.
+
+        Raises:
+            ValueError: If there is no such analysis in output.
+        """
+        for table in self.tables:
+            if table.analysis == analysis:
+                self.analysis = table.analysis
+                self.date = table.date
+                self._plot = table.plot
+                self._data_lines = None
+                return
+        raise ValueError("There is no {0} in output".format(analysis))
 
     @staticmethod
     def _parse_ngspice_output_date(raw_date):
@@ -192,97 +510,54 @@ class NgspiceOutput():
 
         return datetime.datetime(int(year), int(months[month]), int(day), int(hour), int(minute), int(second))
 
-    def _parse(self, raw_text):
-        """Ngspice simulation output parser.
+    @staticmethod
+    def _parse_analysis_line(analysis_line):
+        """Parses a table analysis line.
+
+        Returns:
+            (analysis, date)
+        """
+        analysis_line = analysis_line.strip()
+        analysis_sep_index = analysis_line.find("  ")
+        analysis = analysis_line[:analysis_sep_index]
+        date = NgspiceOutput._parse_ngspice_output_date(analysis_line[analysis_sep_index + 2:].strip())
+        return analysis, date
+
+    def _parse(self, lines):
+        """Ngspice simulation output indexer.
 
          1. Find "Circuit: 'circuit name'
          2. Keep iterating until an space--striped line is 'circuit name'
-         3. Enter table parser
-          3.1. it is already implemented on stable version
+         3. Read table headers and add it to tables
          4. If not EOF, goto 2.
 
+        Lines are read in a single pass. Table rows are skipped without being
+        parsed, their values are read by Table loader when required.
+
         Remarks:
          - Initial transient solutions are not parsed
          - Works for *tran*, *ac* (no complex values) and *dc*
-         - "No. of Data Rows" value is not used
-         - GUI can only handle one analysis, but parser could be extended
-           to support more
+
+        Args:
+            lines: Iterable of (offset, line) tuples. Lines have no line
+                terminators and offsets must be accepted by ``_read_lines``.
 
          Raises:
              ValueError:
              ExecutionError:
         """
-
-        def table_parser(table_start_pos):
-            """
-            Parses a ngspice output table handling page breaks.
-
-            Returns:
-                (analysis, date, data_lines, table_end_pos)
-            """
-
-            table_content = file_content[table_start_pos:]
-
-            # table_content[0] is circuit name
-
-            # table_content[1] is analysis and date
-            # extract data from it
-            analysis_line = table_content[1].strip()
-            analysis_sep_index = analysis_line.find("  ")
-            analysis = analysis_line[:analysis_sep_index]
-            date = NgspiceOutput._parse_ngspice_output_date(analysis_line[analysis_sep_index + 2:].strip())
-
-            # table_content[2] is a line of dashes
-
-            # table_content[3] contains column headers
-            columns_headers_line = table_content[3]
-            headers = tuple(filter(None, columns_headers_line.strip().split(" ")))
-
-            # table_content[4] is a line of dashes
-
-            # from table_content[5] onwards, there is data
-            table_sep = '\f'
-            table_data = table_content[5:]
-            l = 0
-            tuple_values = []
-
-            while l < len(table_data):
-                row = table_data[l]
-                if row != table_sep and row != '':
-                    splitted = row.strip().split("\t")
-                    if splitted:
-                        if splitted[0].isdigit():  # It's an Index row item
-                            tuple_values.append(tuple(filter(None, splitted)))
-                        else:
-                            raise ValueError("PARSING ERROR: Line has not digits")
-                else:
-                    if table_data[l + 2].startswith('-----'):
-                        # new page header detected
-                        l += 2  # skip it
-                    else:
-                        # table ended
-                        break
-                l += 1
-
-            # Simulation data is given as tuples and it need to be converted to lists
-            list_values = self._transpose_table(tuple_values)
-            data_lines = []
-
-            # Finally, DataLine objects are created from list data
-            for i in range(len(headers)):
-                if headers[i] != "Index":  # "Index" data-line is discarded because it's not useful
-                    data_lines.append(NgspiceOutput.DataLine(headers[i], list_values[i]))
-
-            return analysis, date, data_lines, l
-
-        file_content = raw_text.split("\n")
-        tables = []  # List of (analysis, date, data_lines)
-
-        joined_tables = []
+        lines = iter(lines)
+        data_rows = None  # Last "No. of Data Rows" value
+        new_plot = True
+        plot = -1
 
         self.circuit_name = None
-        for i in range(len(file_content)):
-            stripped = file_content[i].strip()
+        self.tables = []
+        for offset, line in lines:
+            if line[:1].isdigit():
+                continue  # Table row
+
+            stripped = line.strip()
 
             if stripped.startswith("Circuit: "):
                 circuit_name = stripped[len("Circuit: "):]
@@ -294,40 +569,297 @@ class NgspiceOutput():
                 if not stripped.startswith("Error: Library ") and not stripped.endswith(" couldn't be loaded!"):
                     raise ExecutionError(stripped)
 
+            elif stripped.startswith("No. of Data Rows"):
+                data_rows = int(stripped[stripped.find(":") + 1:])
+                new_plot = True
+
             elif self.circuit_name is not None:
                 if stripped.startswith(self.circuit_name):
                     # table found!
-                    tables.append(table_parser(i))
-                    break  # TODO remove this when multiple table support is implemented
+                    analysis, date = self._parse_analysis_line(next(lines)[1])
+                    next(lines)  # a line of dashes
+                    headers = tuple(next(lines)[1].split())
+
+                    last = self.tables[-1] if self.tables else None
+                    if new_plot or last.analysis != analysis:
+                        plot += 1
+                        new_plot = False
+                    elif last.plot == plot and last.headers == headers:
+                        continue  # Page of last table
+
+                    loader = functools.partial(self._load_table, offset, data_rows)
+                    self.tables.append(NgspiceOutput.Table(plot, analysis, date, headers, offset, loader))
 
         if self.circuit_name is None:
             raise ValueError("circuit_name is None")
 
-        if not tables:
+        if not self.tables:
             raise ExecutionError(_("No simulations were done."))
         else:
-            self.analysis = tables[0][0]  # analysis
-            self.date = tables[0][1]  # date
-            joined_tables = tables[0][2]  # Include first table
-            for table in tables[1:]:  # Include dependent data lines of other tables
-                # Process one type of simulation only.
-                if table[0] == self.analysis:
-                    # Discard independent data lines because they were just included.
-                    filtered = [d for d in table[2] if not d.independent]
-                    if filtered is not None:
-                        joined_tables.extend(filtered)
-            self.data_lines = joined_tables  # datalines
-
-    def _transpose_table(self, table):
-        """Returns a list of columns in table formed by rows"""
-        transposed = []
-        for item in table[0]:
-            transposed.append([])
-
-        for row in table:
-            for i in range(len(row)):
-                transposed[i].append(row[i])
-        return transposed
+            self.select_analysis(self.tables[0].analysis)
+
+    def _load_table(self, offset, data_rows):
+        """Parses the table found at offset.
+
+        Args:
+            offset: Table circuit name line offset.
+            data_rows: Expected number of rows.
+
+        Returns:
+            DataLine list.
+        """
+        if self._buffer is not None:
+            return self._parse_mapped_table(offset, data_rows)
+        lines = (line for line_offset, line in self._read_lines(offset))
+        next(lines)  # circuit name
+        return self._parse_table(lines, data_rows)
+
+    def _parse_table(self, lines, data_rows=None):
+        """Parses a ngspice output table handling page breaks.
+
+        Table circuit name line must be already consumed from lines. Values
+        are converted and stored in place, row by row, so no intermediate
+        string table is built.
+
+        Args:
+            lines: Iterator of ngspice output lines.
+            data_rows: Expected number of rows, used to preallocate columns.
+                If it is None, columns grow as rows are read.
+
+        Returns:
+            DataLine list.
+
+        Raises:
+            ValueError: If a table row cannot be parsed.
+        """
+        # First line is analysis and date
+        analysis, date = self._parse_analysis_line(next(lines))
+
+        next(lines)  # a line of dashes
+        headers = tuple(next(lines).split())
+        next(lines)  # a line of dashes
+
+        # One buffer per value, complex values take two. "Index" column is not
+        # stored because it's not useful. Layout is known on the first row.
+        layout = None
+        columns = None
+        values_count = 0
+        capacity = data_rows or 0
+        rows = 0
+        page_break = False  # A page break is being skipped
+        for row in lines:
+            splitted = row.replace(",", ", ").split()
+            if splitted and splitted[0].isdigit():  # It's an Index row item
+                page_break = False
+                if layout is None:
+                    layout = self._parse_row_layout(splitted, headers)
+                    values_count = sum(layout) + 1
+                    if data_rows:
+                        columns = [array('d', [0.0]) * data_rows for _ in range(1, values_count)]
+                    else:
+                        columns = [array('d') for _ in range(1, values_count)]
+                if len(splitted) != values_count:
+                    raise ValueError("PARSING ERROR: Line has not {0} columns".format(len(headers)))
+                if rows < capacity:
+                    for column, value in zip(columns, splitted[1:]):
+                        column[rows] = float(value.rstrip(","))
+                else:
+                    for column, value in zip(columns, splitted[1:]):
+                        column.append(float(value.rstrip(",")))
+                rows += 1
+            elif row.strip() == '':
+                # '\f' and blank lines separate pages
+                page_break = True
+            elif page_break and (row.strip().startswith('-----') or tuple(splitted) == headers or
+                                 row.strip().startswith(analysis) or row.strip().startswith(self.circuit_name)):
+                pass  # new page header, skip it
+            elif page_break:
+                break  # table ended
+            else:
+                raise ValueError("PARSING ERROR: Line has not digits")
+
+        if layout is None:
+            layout = [1] * (len(headers) - 1)
+            columns = [array('d') for _ in range(1, len(headers))]
+        # Buffers are handed to numpy as they are, it uses their memory directly
+        return self._make_data_lines(headers, layout, [numpy.asarray(column)[:rows] for column in columns])
+
+    @staticmethod
+    def _parse_row_layout(splitted, headers):
+        """Finds which columns of a table are complex.
+
+        Complex values are printed as ``real, imaginary`` pairs.
+
+        Args:
+            splitted: Tokens of the first table row, with commas kept at the
+                end of real parts.
+            headers: Table headers, ``Index`` included.
+
+        Returns:
+            List with the number of values of each column but ``Index``: 2 for
+            complex columns, 1 for the others.
+
+        Raises:
+            ValueError: If row does not match headers.
+        """
+        layout = []
+        i = 1
+        for header in headers[1:]:
+            if i < len(splitted) and splitted[i].endswith(","):
+                layout.append(2)
+                i += 2
+            else:
+                layout.append(1)
+                i += 1
+        if i != len(splitted):
+            raise ValueError("PARSING ERROR: Line has not {0} columns".format(len(headers)))
+        return layout
+
+    @staticmethod
+    def _make_data_lines(headers, layout, columns):
+        """Makes DataLine list from table values.
+
+        Args:
+            headers: Table headers, ``Index`` included.
+            layout: Number of values of each column as returned by
+                ``_parse_row_layout()``.
+            columns: One float64 array per value, ``Index`` excluded.
+
+        Returns:
+            DataLine list.
+        """
+        data_lines = []
+        values = iter(columns)
+        for header, count in zip(headers[1:], layout):
+            if count == 2:
+                real, imaginary = next(values), next(values)
+                column = numpy.empty(len(real), dtype=numpy.complex128)
+                column.real = real
+                column.imag = imaginary
+            else:
+                column = next(values)
+            data_lines.append(NgspiceOutput.DataLine(header, column))
+        return data_lines
+
+    def _parse_mapped_table(self, offset, data_rows=None):
+        """Parses a table of a mapped ngspice output handling page breaks.
+
+        Rows between page breaks are converted in chunks with numpy, straight
+        from the mapped buffer, and stored in a preallocated array.
+
+        Args:
+            offset: Table circuit name line offset.
+            data_rows: Expected number of rows, used to preallocate columns.
+                If it is None, columns grow as rows are read.
+
+        Returns:
+            DataLine list.
+
+        Raises:
+            ValueError: If a table row cannot be parsed.
+        """
+        buf = self._buffer
+        lines = self._read_mapped_lines(buf, offset)
+        next(lines)  # circuit name
+        analysis, date = self._parse_analysis_line(next(lines)[1])
+        next(lines)  # a line of dashes
+        headers = tuple(next(lines)[1].split())
+        dashes_offset = next(lines)[0]
+
+        start = buf.find(b"\n", dashes_offset) + 1 or None
+
+        # Layout is read from the first row, complex values take two columns
+        layout = [1] * (len(headers) - 1)
+        complex_values = False
+        if start is not None and buf[start:start + 1].isdigit():
+            row_end = buf.find(b"\n", start)
+            first_row = buf[start:row_end if row_end >= 0 else len(buf)]
+            complex_values = b"," in first_row
+            if complex_values:
+                layout = self._parse_row_layout(first_row.decode("ascii", "replace").replace(",", ", ").split(),
+                                                headers)
+
+        # One row per value. "Index" column is not stored because it's not useful
+        columns_count = sum(layout) + 1
+        columns = numpy.empty((columns_count - 1, data_rows or 1024))
+        rows = 0
+
+        while start is not None and start < len(buf):
+            match = self._NON_DATA_LINE_START.search(buf, start)
+            end = match.start() + 1 if match is not None else len(buf)
+            for chunk in self._convert_mapped_rows(start, end, columns_count, complex_values):
+                if rows + len(chunk) > columns.shape[1]:
+                    grown = numpy.empty((columns_count - 1, max(2 * columns.shape[1], rows + len(chunk))))
+                    grown[:, :rows] = columns[:, :rows]
+                    columns = grown
+                columns[:, rows:rows + len(chunk)] = chunk[:, 1:].T
+                rows += len(chunk)
+            start = self._skip_mapped_page_break(end, analysis, headers)
+
+        return self._make_data_lines(headers, layout, [column[:rows] for column in columns])
+
+    def _convert_mapped_rows(self, start, end, columns_count, complex_values=False):
+        """Yields 2D arrays with table rows of mapped buffer between start and end.
+
+        Rows are converted in chunks of about ``MAPPED_CHUNK_SIZE`` bytes.
+        If complex_values is True, commas between real and imaginary parts
+        are replaced before conversion.
+
+        Raises:
+            ValueError: If a row cannot be parsed.
+        """
+        buf = self._buffer
+        while start < end:
+            stop = end
+            if end - start > self.MAPPED_CHUNK_SIZE:
+                stop = buf.rfind(b"\n", start, start + self.MAPPED_CHUNK_SIZE) + 1 or end
+            text = buf[start:stop]
+            if complex_values:
+                text = text.replace(b",", b" ")
+            try:
+                values = numpy.fromstring(text, dtype=numpy.float64, sep=" ")
+            except ValueError:
+                raise ValueError("PARSING ERROR: Line has not digits")
+            if len(values) % columns_count != 0:
+                raise ValueError("PARSING ERROR: Line has not {0} columns".format(columns_count))
+            yield values.reshape(-1, columns_count)
+            start = stop
+
+    def _skip_mapped_page_break(self, offset, analysis, headers):
+        """Skips a page break of a mapped table.
+
+        Args:
+            offset: Offset of the first line after table rows.
+            analysis: Table analysis name.
+            headers: Table column names.
+
+        Returns:
+            Offset of first row of next page or None if table ended.
+
+        Raises:
+            ValueError: If table has an unexpected line.
+        """
+        buf = self._buffer
+        page_break = False
+        for line_offset, line in self._read_mapped_lines(buf, offset):
+            stripped = line.strip()
+            if stripped == '':
+                # '\f' and blank lines separate pages
+                page_break = True
+            elif page_break and (stripped.startswith('-----') or tuple(stripped.split()) == headers or
+                                 stripped.startswith(analysis) or stripped.startswith(self.circuit_name)):
+                pass  # new page header, skip it
+            elif page_break:
+                return None  # table ended
+            else:
+                raise ValueError("PARSING ERROR: Line has not digits")
+
+            line_end = buf.find(b"\n", line_offset)
+            if line_end < 0:
+                return None
+            if buf[line_end + 1:line_end + 2].isdigit():
+                return line_end + 1
+        return None
 
     def get_figure(self):
         """Creates a Figure representing simulation data output.
@@ -337,10 +869,14 @@ class NgspiceOutput():
         Returns:
             A ``matplotlib.figure.Figure`` object.
         """
+        # Imported here, so simulations can run without GTK and matplotlib
+        from gi.repository import Gio
+        from matplotlib.figure import Figure
+        import decimation
+
         settings = Gio.Settings.new(config.GSETTINGS_BASE_KEY)
 
         f = Figure(figsize=(16, 7), dpi=100)
-        a = f.add_subplot(111)
         indep_data_line = None
         dep_data_lines = []
 
@@ -349,8 +885,44 @@ class NgspiceOutput():
                 indep_data_line = data_line
             else:
                 dep_data_lines.append(data_line)
+
+        # Complex vectors are shown as Bode plots: magnitude above, phase below
+        bode = any(line.is_complex for line in dep_data_lines)
+        if bode:
+            a = f.add_subplot(211)
+            phase_axes = f.add_subplot(212, sharex=a)
+            all_axes = [a, phase_axes]
+        else:
+            a = f.add_subplot(111)
+            all_axes = [a]
+
+        traces = []
         for line in dep_data_lines:
-            a.plot(indep_data_line.values, line.values, label=line.name)
+            if line.is_complex:
+                traces.append((a, line.name, line.decibels))
+                traces.append((phase_axes, line.name, line.phase))
+            else:
+                traces.append((a, line.name, line.values))
+
+        # Traces are decimated to plot width. Cairo cannot draw more than
+        # 18980 points per line (see backend_cairo.py in matplotlib package)
+        # and drawing more points than pixels is useless anyway.
+        width = f.get_figwidth() * f.dpi
+        decimated_lines = []
+        for axes, name, values in traces:
+            decimator = decimation.MinMaxDecimator(indep_data_line.values, values)
+            plot_line, = axes.plot(*decimator.decimate(width=width), label=name)
+            decimated_lines.append((axes, plot_line, decimator))
+
+        def on_xlim_changed(axes):
+            """Decimates traces again for the new x range."""
+            xmin, xmax = axes.get_xlim()
+            for line_axes, plot_line, decimator in decimated_lines:
+                if line_axes is axes:
+                    plot_line.set_data(*decimator.decimate(xmin, xmax, axes.bbox.width))
+
+        for axes in all_axes:
+            axes.callbacks.connect('xlim_changed', on_xlim_changed)
 
         # Decorations
         if settings.get_boolean("show-legend"):
@@ -361,186 +933,224 @@ class NgspiceOutput():
         # Set x axis
         x_axe_magnitude, x_axe_unit = indep_data_line.get_magnitude_and_unit()
         if x_axe_magnitude and x_axe_unit:
-            a.set_xlabel(x_axe_magnitude + " [" + x_axe_unit + "]")
+            all_axes[-1].set_xlabel(x_axe_magnitude + " [" + x_axe_unit + "]")
             if x_axe_unit == "Hz":
                 a.set_xscale("log")
 
         # Set y axis
         y_axe_magnitude, y_axe_unit = dep_data_lines[0].get_magnitude_and_unit()
-        if y_axe_magnitude and y_axe_unit:
+        if bode:
+            a.set_ylabel((y_axe_magnitude or "Magnitude") + " [dB]")
+            phase_axes.set_ylabel("Phase [rad]")
+        elif y_axe_magnitude and y_axe_unit:
             a.set_ylabel(y_axe_magnitude + " [" + y_axe_unit + "]")
             if self.analysis == "AC Analysis" and y_axe_unit == "V":
                 a.set_yscale("log")
 
         # Set grids
         if settings.get_boolean("show-grids"):
-            a.grid(b=True, which='major', color='0.65', linestyle='-')
-            a.grid(b=True, which='minor', color='0.9', linestyle='-')
+            for axes in all_axes:
+                axes.grid(b=True, which='major', color='0.65', linestyle='-')
+                axes.grid(b=True, which='minor', color='0.9', linestyle='-')
 
         f.subplots_adjust(left=0.11, bottom=0.150, right=0.9, top=0.90, wspace=0.2, hspace=0.2)
-        a.autoscale(enable=None, axis=u'y', tight=False)
+        for axes in all_axes:
+            axes.autoscale(enable=None, axis=u'y', tight=False)
 
         return f
 
-    def save_csv(self, file_path):
+    def save_csv(self, file_path, columns=None, xmin=None, xmax=None):
         """Saves simulation data to csv file.
 
+        Rows are written in blocks, see ``data_export.export()``.
+
         Args:
             file_path: Output file path.
+            columns: Names of saved data lines or None to save every one.
+            xmin: Lower limit of independent values or None.
+            xmax: Upper limit of independent values or None.
         """
-        with open(file_path, 'wb') as csvfile:
-            writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        import data_export
 
-            # column headers
-            row = []
-            for line in self.data_lines:
-                row.append(line.name)
-            writer.writerow(row)
+        data_export.export(file_path, self.data_lines, "csv", columns, xmin, xmax)
 
-            # content
-            if self.data_lines is not None:
-                for row_i in xrange(len(self.data_lines[0].values)):  # assume all data lines have the same length
-                    row = []
-                    for line in self.data_lines:
-                        row.append(line.values[row_i])
-                    writer.writerow(row)
 
+class RawfileTail(object):
+    """Incremental reader of a binary rawfile ngspice is still writing.
 
-class Ngspice():
-    @classmethod
-    def simulatefile(cls, netlist_path):
-        """Launches ngspice simulation o netlist file.
+    In batch mode, ngspice appends every simulated point to the rawfile as
+    soon as it is computed and only fills in ``No. Points`` header field when
+    the plot ends. Each ``update()`` call reads the points appended since the
+    previous one into growing arrays, so results can be shown while the
+    simulation runs.
+
+    Attributes:
+        path: Rawfile path.
+        plots: List of ``RawfileTail.Plot``, the last one may be incomplete.
+    """
+
+    INITIAL_CAPACITY = 4096
+
+    class Plot(object):
+        """Points of a rawfile plot read so far."""
+
+        __slots__ = ("name", "date", "names", "dtype", "data_offset", "points_count_offset", "points_count",
+                     "points", "_data")
+
+        def __init__(self, name, date, names, dtype, data_offset, points_count_offset):
+            self.name = name
+            self.date = date
+            self.names = names
+            self.dtype = dtype
+            self.data_offset = data_offset
+            self.points_count_offset = points_count_offset
+            self.points_count = None  # Unknown until ngspice ends the plot
+            self.points = 0
+            self._data = numpy.empty((RawfileTail.INITIAL_CAPACITY, len(names)), dtype=dtype)
+
+        @property
+        def point_size(self):
+            return self.dtype.itemsize * len(self.names)
+
+        @property
+        def complete(self):
+            return self.points_count is not None and self.points >= self.points_count
+
+        def append(self, block):
+            """Appends points from a bytes block holding whole points."""
+            new_points = numpy.frombuffer(block, dtype=self.dtype).reshape(-1, len(self.names))
+            needed = self.points + len(new_points)
+            if needed > len(self._data):
+                grown = numpy.empty((max(needed, 2 * len(self._data)), len(self.names)), dtype=self.dtype)
+                grown[:self.points] = self._data[:self.points]
+                self._data = grown
+            self._data[self.points:needed] = new_points
+            self.points = needed
+
+        def data_lines(self):
+            """Returns DataLine list of the points read so far.
+
+            Values are views, so they stay valid when more points are appended.
+            """
+            table = self._data[:self.points]
+            data_lines = []
+            for i, name in enumerate(self.names):
+                if i == 0:
+                    data_line = NgspiceOutput.DataLine(name, table[:, 0].real)
+                    data_line.independent = True
+                else:
+                    data_line = NgspiceOutput.DataLine(name, table[:, i])
+                data_lines.append(data_line)
+            return data_lines
+
+    def __init__(self, path):
+        """Inits RawfileTail.
 
         Args:
-            netlist_path: Netlist file path.
+            path: Rawfile path. It does not need to exist yet.
         """
-        process = subprocess.Popen(["ngspice", "-b", "-o", str(netlist_path) + ".out", str(netlist_path)], shell=False,
-                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        encoding = locale.getdefaultlocale()[1]
-        stdout_b, stderr_b = process.communicate()
-        stdout, stderr = stdout_b.decode(encoding), stderr_b.decode(encoding)
-
-        if stderr:
-            stderr_l = stderr.split("\n")
-            error_lines = ""
-            for line in stderr_l:
-                if line.startswith("Error:"):
-                    if len(error_lines) > 0:
-                        error_lines += "\n"
-                    error_lines += line
-            if error_lines != "":
-                raise Exception(error_lines)
-
-
-class NgspiceAsync():
-    def __init__(self):
-        """Inits NgspiceAsync."""
-        self.thread = None
-        self.result = None
-        self.errors = None
-        self.end_event = Event()
-        self._lock_result = Lock()
-        self._lock_errors = Lock()
-
-    def simulatefile(self, netlist_path):
-        """
-        Simulate asyncrhonously netlist_path file with ngspice.
+        self.path = path
+        self.circuit_name = None
+        self.plots = []
+        self._file = None
+        self._position = 0  # Offset of next plot header
 
-        Args:
-            netlist_path: Netlist file path.
+    def close(self):
+        """Closes rawfile."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def update(self):
+        """Reads points appended to the rawfile since the last call.
 
         Returns:
-            None.
+            True if new points or plots were read.
 
-            Sets self.result with (``stout``, ``stderr``).
-            Sets self.errors with a list of ``ExecutionError`` if ``stderr`` is not void.
-        """
-        self.result = None
-        self.errors = None
-        self.end_event.clear()
-        self.thread = Thread(group=None, name="ngspice-thread",
-                             target=self._run_simulation, args=(netlist_path,))
-        self.thread.start()
-
-    def _run_simulation(self, netlist_path):
-        self.process = subprocess.Popen(["ngspice", "-b", "-o",
-                                         str(netlist_path) + ".out",
-                                         str(netlist_path)],
-                                        shell=False,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE)
-
-        encoding = locale.getdefaultlocale()[1]
-        stdout_b, stderr_b = self.process.communicate()
-        stdout, stderr = stdout_b.decode(encoding), stderr_b.decode(encoding)
-        with self._lock_result:
-            self.result = (stdout, stderr)
-        if stderr:
-            if "Error:" in stderr:
-                errors = [ExecutionError(err) for err in stderr.splitlines() if err]
-                with self._lock_errors:
-                    self.errors = errors
-        self.end_event.set()
-
-    def terminate(self):
-        """Kills executing ngspice process.
-
-        Calls ``terminate()`` method of ``subprocess.Popen``.
+        Raises:
+            ValueError: If rawfile is not a binary one.
         """
-        if self.process is not None:
-            if self.process.poll() is None:
-                self.process.terminate()
-
+        if self._file is None:
+            try:
+                self._file = open(self.path, "rb")
+            except (IOError, OSError):
+                return False  # ngspice has not created it yet
+
+        updated = False
+        while True:
+            plot = self.plots[-1] if self.plots and not self.plots[-1].complete else None
+            if plot is None:
+                plot = self._read_header()
+                if plot is None:
+                    return updated
+                self.plots.append(plot)
+                updated = True
+
+            if plot.points_count is None:
+                self._file.seek(plot.points_count_offset)
+                try:
+                    points_count = int(self._file.readline().strip() or 0)
+                except ValueError:
+                    points_count = 0
+                if points_count > 0:
+                    plot.points_count = points_count
+
+            self._file.seek(plot.data_offset + plot.points * plot.point_size)
+            if plot.points_count is not None:
+                block = self._file.read((plot.points_count - plot.points) * plot.point_size)
+            else:
+                block = self._file.read()
+            whole_points = len(block) // plot.point_size
+            if whole_points > 0:
+                plot.append(block[:whole_points * plot.point_size])
+                updated = True
 
-class ExecutionError(Exception):
-    """Execution of process failed."""
-    pass
+            if not plot.complete:
+                return updated
+            self._position = plot.data_offset + plot.points * plot.point_size
 
+    def _read_header(self):
+        """Reads plot header at current position.
 
-class Gnetlist():
-    @classmethod
-    def create_netlist_file(cls, schematic_path, netlist_path):
-        """Creates a spice netlist file from a gschem file with spice-sdb backend.
+        Returns:
+            A new Plot or None if header is not completely written yet.
+        """
+        self._file.seek(self._position)
+        header = self._file.read(64 * 1024)
+        binary_pos = header.find(b"Binary:\n")
+        if binary_pos < 0:
+            if b"Values:\n" in header:
+                raise ValueError("PARSING ERROR: Only binary rawfiles are supported")
+            return None
+        points_pos = header.find(b"No. Points:", 0, binary_pos)
+        if points_pos < 0:
+            raise ValueError("PARSING ERROR: Rawfile without No. Points field")
+
+        fields, names, dtype, date = NgspiceOutput._parse_raw_header(header[:binary_pos])
+        if self.circuit_name is None:
+            self.circuit_name = fields.get("Title")
+        return RawfileTail.Plot(fields.get("Plotname"), date, names, dtype,
+                                self._position + binary_pos + len(b"Binary:\n"),
+                                self._position + points_pos + len(b"No. Points:"))
 
-        Args:
-            schematic_path: Gschem file path.
-            netlist_path: Netlist file path.
+    def get_output(self):
+        """Returns a NgspiceOutput holding the points read so far.
 
-        Raises:
-            ExecutionError: When gnetlist process writes on stderr.
+        As in ``NgspiceOutput.parse_raw()``, the first supported analysis is
+        selected. Plots without points are left out.
         """
-        process = subprocess.Popen(["gnetlist", "-g", "spice-sdb", "-o", str(netlist_path), "--", str(schematic_path)],
-                                   shell=False, cwd=os.path.dirname(netlist_path), stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
-
-        encoding = locale.getdefaultlocale()[1]
-        stdout_b, stderr_b = process.communicate()
-        stdout, stderr = stdout_b.decode(encoding), stderr_b.decode(encoding)
-        if stderr:
-            stderr_l = stderr.split("\n")
-            error_lines = ""
-            for line in stderr_l:
-                if line.startswith("ERROR:"):
-                    if len(error_lines) > 0:
-                        error_lines += "\n"
-                    error_lines += line
-            if error_lines != "":
-                raise ExecutionError(error_lines)
-
-
-class Netlist(object):
-    def __init__(self, source):
-        self.source = source
-
-    def get_title(self):
-        match = re.search("^\.title (?P<title>.*)$", self.source, flags=re.MULTILINE | re.IGNORECASE)
-        if match:
-            return match.group("title").strip()
+        output = NgspiceOutput()
+        output.circuit_name = self.circuit_name
+        for plot in self.plots:
+            if plot.points > 0:
+                output.tables.append(NgspiceOutput.Table(len(output.tables), plot.name, plot.date,
+                                                         tuple(plot.names), plot.data_offset,
+                                                         plot.data_lines))
+        for table in output.tables:
+            if table.analysis in NgspiceOutput.SUPPORTED_ANALYSES:
+                output.select_analysis(table.analysis)
+                break
         else:
-            title = str(self.source[0:self.source.find("\n")])
-            if len(title) > 0:
-                if title.startswith("*"):
-                    return title[1:].strip()
-                else:
-                    return title.strip()
+            if output.tables:
+                output.select_analysis(output.tables[0].analysis)
+        return output
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Parameter sweeps and Monte Carlo runs of a netlist."""
+
+import itertools
+import os
+import os.path
+import shutil
+import tempfile
+
+import numpy
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import run_directory
+from ngspice_simulation import Netlist
+from simulation_scheduler import SimulationScheduler
+
+
+class Uniform(object):
+    """Uniform distribution between low and high."""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, random_state, size):
+        return random_state.uniform(self.low, self.high, size)
+
+
+class Normal(object):
+    """Normal distribution with mean and standard deviation sigma."""
+
+    def __init__(self, mean, sigma):
+        self.mean = mean
+        self.sigma = sigma
+
+    def sample(self, random_state, size):
+        return random_state.normal(self.mean, self.sigma, size)
+
+
+class Tolerance(Normal):
+    """Normal distribution of a nominal value with a tolerance.
+
+    Tolerance is taken as three standard deviations, so 99.7% of values are
+    inside ``nominal * (1 ± tolerance)``.
+    """
+
+    def __init__(self, nominal, tolerance):
+        Normal.__init__(self, nominal, abs(nominal) * tolerance / 3.0)
+
+
+def linear_range(start, stop, points):
+    """Returns points values evenly spaced from start to stop."""
+    return numpy.linspace(start, stop, points)
+
+
+def log_range(start, stop, points):
+    """Returns points values evenly spaced in logarithmic scale from start to stop."""
+    return numpy.logspace(numpy.log10(start), numpy.log10(stop), points)
+
+
+class SweepResult(object):
+    """Aggregated results of a ParameterSweep.
+
+    Attributes:
+        parameters: Parameter names.
+        parameter_values: (runs × parameters) array with the values used in
+            every run.
+        signals: Names of aggregated signals.
+        scale: Independent values of the first finished run or None if no run
+            has finished yet.
+        data: (runs × points × signals) array, None until the first run
+            finishes. Rows of runs that did not finish are NaN.
+        completed: Boolean array, True for runs already aggregated.
+        errors: Dictionary mapping run index to the exception of failed runs.
+    """
+
+    def __init__(self, parameters, parameter_values, signals=None):
+        self.parameters = list(parameters)
+        self.parameter_values = parameter_values
+        self.signals = list(signals) if signals is not None else None
+        self.scale = None
+        self.data = None
+        self.completed = numpy.zeros(len(parameter_values), dtype=bool)
+        self.errors = {}
+
+    @property
+    def runs(self):
+        return len(self.parameter_values)
+
+    def add(self, run, output):
+        """Stores results of a run.
+
+        The first stored run fixes scale and signals. Runs with a different
+        scale, like transient runs with other time steps, are interpolated to
+        it.
+
+        Args:
+            run: Run index.
+            output: NgspiceOutput of the run.
+
+        Raises:
+            ValueError: If output lacks a signal.
+        """
+        data_lines = output.data_lines
+        scale = None
+        by_name = {}
+        for data_line in data_lines:
+            if data_line.independent and scale is None:
+                scale = data_line.values
+            else:
+                by_name[data_line.name] = data_line.values
+
+        if self.data is None:
+            if self.signals is None:
+                self.signals = [data_line.name for data_line in data_lines if not data_line.independent]
+            complex_values = any(numpy.iscomplexobj(by_name.get(name, 0.0)) for name in self.signals)
+            dtype = numpy.complex128 if complex_values else numpy.float64
+            self.scale = numpy.array(scale, dtype=numpy.float64)
+            self.data = numpy.empty((self.runs, len(self.scale), len(self.signals)), dtype=dtype)
+            self.data.fill(numpy.nan)
+
+        same_scale = len(scale) == len(self.scale) and numpy.array_equal(scale, self.scale)
+        for i, name in enumerate(self.signals):
+            if name not in by_name:
+                raise ValueError("Run {0} has no signal named {1}".format(run, name))
+            values = by_name[name]
+            if same_scale:
+                self.data[run, :, i] = values
+            elif numpy.iscomplexobj(values):
+                self.data[run, :, i] = (numpy.interp(self.scale, scale, values.real) +
+                                        1j * numpy.interp(self.scale, scale, values.imag))
+            else:
+                self.data[run, :, i] = numpy.interp(self.scale, scale, values)
+        self.completed[run] = True
+
+    def get_signal(self, name):
+        """Returns (runs × points) array of a signal."""
+        return self.data[:, :, self.signals.index(name)]
+
+
+class ParameterSweep(object):
+    """Simulates variants of a netlist with other ``.param`` values.
+
+    Parameters given as sequences are swept over every combination of their
+    values. Parameters given as distributions (``Uniform``, ``Normal``,
+    ``Tolerance`` or any object with a ``sample(random_state, size)``
+    method) are drawn ``runs`` times for each combination, for Monte Carlo
+    analysis.
+
+    Netlist variants are built in memory and written to a temporary file only
+    while they run. Results of each run are added to a SweepResult as soon as
+    it ends and its files are removed, so disk and memory use does not grow
+    with the number of runs besides the aggregated array.
+
+    Attributes:
+        netlist_path: Netlist file path.
+        parameters: Dictionary mapping parameter names to sequences of values
+            or distributions.
+        runs: Monte Carlo runs per sweep point.
+        seed: Random seed, so Monte Carlo runs can be repeated.
+        signals: Names of aggregated signals or None for every one.
+        analysis: Analysis whose results are aggregated or None for the
+            first one.
+    """
+
+    def __init__(self, netlist_path, parameters, runs=1, seed=None, signals=None, analysis=None):
+        self.netlist_path = netlist_path
+        self.parameters = parameters
+        self.runs = runs
+        self.seed = seed
+        self.signals = signals
+        self.analysis = analysis
+        self._cancelled = False
+
+    def get_parameter_values(self):
+        """Returns (parameter names, (runs × parameters) array of values)."""
+        names = sorted(self.parameters)
+        swept = [name for name in names if not hasattr(self.parameters[name], "sample")]
+        random = [name for name in names if hasattr(self.parameters[name], "sample")]
+        grid = list(itertools.product(*[list(self.parameters[name]) for name in swept]))
+        repeat = self.runs if random else 1
+
+        values = numpy.empty((len(grid) * repeat, len(names)))
+        for column, name in enumerate(names):
+            if name in swept:
+                values[:, column] = numpy.repeat([point[swept.index(name)] for point in grid], repeat)
+        random_state = numpy.random.RandomState(self.seed)
+        for name in random:
+            values[:, names.index(name)] = self.parameters[name].sample(random_state, len(values))
+        return names, values
+
+    def get_variants(self, names=None, values=None):
+        """Yields (run index, netlist source) of every run.
+
+        Args:
+            names: Parameter names, as returned by ``get_parameter_values()``.
+            values: (runs × parameters) array of values. If names or values
+                are None, they are drawn again, which gives other random
+                values unless seed is set.
+        """
+        with open(self.netlist_path) as f:
+            netlist = Netlist(f.read())
+        if names is None or values is None:
+            names, values = self.get_parameter_values()
+        for run, row in enumerate(values):
+            yield run, netlist.set_parameters(dict(zip(names, row)))
+
+    def cancel(self):
+        """Stops submitting runs and cancels the running ones."""
+        self._cancelled = True
+
+    def run(self, scheduler=None, progress=None):
+        """Runs every variant and aggregates results.
+
+        Args:
+            scheduler: SimulationScheduler to run variants on. If it is None,
+                one with a worker per processor is used.
+            progress: Function called with (result, finished runs) after
+                each run.
+
+        Returns:
+            SweepResult. Runs not done because of cancel() are left NaN.
+        """
+        own_scheduler = scheduler is None
+        if own_scheduler:
+            scheduler = SimulationScheduler()
+        names, values = self.get_parameter_values()
+        result = SweepResult(names, values, self.signals)
+        cwd = os.path.dirname(os.path.abspath(self.netlist_path))
+        variants_dir = tempfile.mkdtemp(prefix="run-{0}-sweep-".format(os.getpid()),
+                                        dir=run_directory.get_runtime_dir())
+        self._cancelled = False
+
+        # Random values are drawn once, so runs use the reported ones
+        variants = self.get_variants(names, values)
+        completed = queue.Queue()
+        in_flight = {}
+        finished = 0
+        try:
+            while True:
+                # Keep workers busy without writing every variant at once
+                while not self._cancelled and len(in_flight) < 2 * scheduler.workers:
+                    try:
+                        run, source = next(variants)
+                    except StopIteration:
+                        break
+                    path = os.path.join(variants_dir, "run-{0}.cir".format(run))
+                    with open(path, "w") as f:
+                        f.write(source)
+                    job = scheduler.submit(path, cwd=cwd)
+                    in_flight[job] = (run, path)
+                    job.add_done_callback(completed.put)
+                if not in_flight:
+                    break
+                if self._cancelled:
+                    for job in in_flight:
+                        job.cancel()
+
+                job = completed.get()
+                run, path = in_flight.pop(job)
+                try:
+                    output = job.get_output()
+                    if self.analysis is not None:
+                        output.select_analysis(self.analysis)
+                    result.add(run, output)
+                except Exception as e:
+                    result.errors[run] = e
+                finally:
+                    job.remove_outputs()
+                    os.remove(path)
+                finished += 1
+                if progress is not None:
+                    progress(result, finished)
+        finally:
+            for job in in_flight:
+                job.cancel()
+            if own_scheduler:
+                scheduler.shutdown(cancel=True)
+            shutil.rmtree(variants_dir, ignore_errors=True)
+        return result
@@ -79,6 +79,78 @@ class Preferences(object):
         # If checkbox is toggled
         show_grids_checkbutton.connect('toggled', self.on_show_grids_checkbutton_toggled, settings)
 
+        ## Binary rawfile setting
+        binary_rawfile_checkbutton = self.builder.get_object('binary_rawfile_checkbutton')
+        binary_rawfile_checkbutton.set_active(settings.get_boolean("binary-rawfile"))
+        # If setting is changed externally
+        settings.connect("changed::binary-rawfile", self.on_binary_rawfile_setting_changed, binary_rawfile_checkbutton)
+        # If checkbox is toggled
+        binary_rawfile_checkbutton.connect('toggled', self.on_binary_rawfile_checkbutton_toggled, settings)
+
+        ## Shared library setting
+        shared_library_checkbutton = self.builder.get_object('shared_library_checkbutton')
+        shared_library_checkbutton.set_active(settings.get_boolean("shared-library"))
+        # If setting is changed externally
+        settings.connect("changed::shared-library", self.on_shared_library_setting_changed, shared_library_checkbutton)
+        # If checkbox is toggled
+        shared_library_checkbutton.connect('toggled', self.on_shared_library_checkbutton_toggled, settings)
+
+        ## Persistent session setting
+        persistent_session_checkbutton = self.builder.get_object('persistent_session_checkbutton')
+        persistent_session_checkbutton.set_active(settings.get_boolean("persistent-session"))
+        # If setting is changed externally
+        settings.connect("changed::persistent-session", self.on_persistent_session_setting_changed, persistent_session_checkbutton)
+        # If checkbox is toggled
+        persistent_session_checkbutton.connect('toggled', self.on_persistent_session_checkbutton_toggled, settings)
+
+        ## Result cache size setting
+        result_cache_size_spinbutton = self.builder.get_object('result_cache_size_spinbutton')
+        result_cache_size_spinbutton.set_value(settings.get_int("result-cache-size"))
+        # If setting is changed externally
+        settings.connect("changed::result-cache-size", self.on_result_cache_size_setting_changed, result_cache_size_spinbutton)
+        # If value is changed
+        result_cache_size_spinbutton.connect('value-changed', self.on_result_cache_size_spinbutton_value_changed, settings)
+
+        ## Kept runs setting
+        kept_runs_spinbutton = self.builder.get_object('kept_runs_spinbutton')
+        kept_runs_spinbutton.set_value(settings.get_int("kept-runs"))
+        # If setting is changed externally
+        settings.connect("changed::kept-runs", self.on_kept_runs_setting_changed, kept_runs_spinbutton)
+        # If value is changed
+        kept_runs_spinbutton.connect('value-changed', self.on_kept_runs_spinbutton_value_changed, settings)
+
+        ## Persist results setting
+        persist_results_checkbutton = self.builder.get_object('persist_results_checkbutton')
+        persist_results_checkbutton.set_active(settings.get_boolean("persist-results"))
+        # If setting is changed externally
+        settings.connect("changed::persist-results", self.on_persist_results_setting_changed, persist_results_checkbutton)
+        # If checkbox is toggled
+        persist_results_checkbutton.connect('toggled', self.on_persist_results_checkbutton_toggled, settings)
+
+        ## CPU time limit setting
+        cpu_time_limit_spinbutton = self.builder.get_object('cpu_time_limit_spinbutton')
+        cpu_time_limit_spinbutton.set_value(settings.get_int("cpu-time-limit"))
+        # If setting is changed externally
+        settings.connect("changed::cpu-time-limit", self.on_cpu_time_limit_setting_changed, cpu_time_limit_spinbutton)
+        # If value is changed
+        cpu_time_limit_spinbutton.connect('value-changed', self.on_cpu_time_limit_spinbutton_value_changed, settings)
+
+        ## Wall clock time limit setting
+        wall_time_limit_spinbutton = self.builder.get_object('wall_time_limit_spinbutton')
+        wall_time_limit_spinbutton.set_value(settings.get_int("wall-time-limit"))
+        # If setting is changed externally
+        settings.connect("changed::wall-time-limit", self.on_wall_time_limit_setting_changed, wall_time_limit_spinbutton)
+        # If value is changed
+        wall_time_limit_spinbutton.connect('value-changed', self.on_wall_time_limit_spinbutton_value_changed, settings)
+
+        ## Memory limit setting
+        memory_limit_spinbutton = self.builder.get_object('memory_limit_spinbutton')
+        memory_limit_spinbutton.set_value(settings.get_int("memory-limit"))
+        # If setting is changed externally
+        settings.connect("changed::memory-limit", self.on_memory_limit_setting_changed, memory_limit_spinbutton)
+        # If value is changed
+        memory_limit_spinbutton.connect('value-changed', self.on_memory_limit_spinbutton_value_changed, settings)
+
         # Show window
         window.connect_after('destroy', self.on_window_destroy)
         window.show_all()
@@ -115,6 +187,60 @@ class Preferences(object):
     def on_show_grids_checkbutton_toggled(self, button, settings):
         settings.set_boolean("show-grids", button.get_active())
 
+    def on_binary_rawfile_setting_changed(self, settings, key, check_button):
+        check_button.set_active(settings.get_boolean("binary-rawfile"))
+
+    def on_binary_rawfile_checkbutton_toggled(self, button, settings):
+        settings.set_boolean("binary-rawfile", button.get_active())
+
+    def on_shared_library_setting_changed(self, settings, key, check_button):
+        check_button.set_active(settings.get_boolean("shared-library"))
+
+    def on_shared_library_checkbutton_toggled(self, button, settings):
+        settings.set_boolean("shared-library", button.get_active())
+
+    def on_persistent_session_setting_changed(self, settings, key, check_button):
+        check_button.set_active(settings.get_boolean("persistent-session"))
+
+    def on_persistent_session_checkbutton_toggled(self, button, settings):
+        settings.set_boolean("persistent-session", button.get_active())
+
+    def on_result_cache_size_setting_changed(self, settings, key, spin_button):
+        spin_button.set_value(settings.get_int("result-cache-size"))
+
+    def on_result_cache_size_spinbutton_value_changed(self, spin_button, settings):
+        settings.set_int("result-cache-size", spin_button.get_value_as_int())
+
+    def on_kept_runs_setting_changed(self, settings, key, spin_button):
+        spin_button.set_value(settings.get_int("kept-runs"))
+
+    def on_kept_runs_spinbutton_value_changed(self, spin_button, settings):
+        settings.set_int("kept-runs", spin_button.get_value_as_int())
+
+    def on_persist_results_setting_changed(self, settings, key, check_button):
+        check_button.set_active(settings.get_boolean("persist-results"))
+
+    def on_persist_results_checkbutton_toggled(self, button, settings):
+        settings.set_boolean("persist-results", button.get_active())
+
+    def on_cpu_time_limit_setting_changed(self, settings, key, spin_button):
+        spin_button.set_value(settings.get_int("cpu-time-limit"))
+
+    def on_cpu_time_limit_spinbutton_value_changed(self, spin_button, settings):
+        settings.set_int("cpu-time-limit", spin_button.get_value_as_int())
+
+    def on_wall_time_limit_setting_changed(self, settings, key, spin_button):
+        spin_button.set_value(settings.get_int("wall-time-limit"))
+
+    def on_wall_time_limit_spinbutton_value_changed(self, spin_button, settings):
+        settings.set_int("wall-time-limit", spin_button.get_value_as_int())
+
+    def on_memory_limit_setting_changed(self, settings, key, spin_button):
+        spin_button.set_value(settings.get_int("memory-limit"))
+
+    def on_memory_limit_spinbutton_value_changed(self, spin_button, settings):
+        settings.set_int("memory-limit", spin_button.get_value_as_int())
+
     def on_window_destroy(self, widget, data=None):
         Gtk.main_quit()
 
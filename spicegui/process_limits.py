@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Resource limits of ngspice processes and reports of how they ended.
+
+A transient analysis that does not converge or a huge ``.print`` list can
+make ngspice run for hours or take all memory. Processes started by a
+ProcessSupervisor get CPU time and address space limits, set with
+``setrlimit()`` before ngspice starts, and a watchdog thread kills their
+process group once their wall clock time is over.
+"""
+
+import errno
+import os
+import signal
+import subprocess
+import sys
+import timeit
+from threading import Event, Lock, Thread
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class ResourceLimits(object):
+    """Limits of a process. None means no limit.
+
+    Attributes:
+        cpu_time: Maximum CPU seconds.
+        wall_time: Maximum wall clock seconds.
+        memory: Maximum address space bytes.
+    """
+
+    # Seconds between SIGXCPU and SIGKILL, so ngspice may exit cleanly
+    CPU_GRACE = 2
+
+    def __init__(self, cpu_time=None, wall_time=None, memory=None):
+        """Inits ResourceLimits.
+
+        Args:
+            cpu_time: Maximum CPU seconds or None.
+            wall_time: Maximum wall clock seconds or None.
+            memory: Maximum address space bytes or None.
+        """
+        self.cpu_time = cpu_time
+        self.wall_time = wall_time
+        self.memory = memory
+
+    def __repr__(self):
+        return "ResourceLimits(cpu_time={0!r}, wall_time={1!r}, memory={2!r})".format(
+            self.cpu_time, self.wall_time, self.memory)
+
+    def popen_kwargs(self):
+        """Returns keyword arguments of ``subprocess.Popen`` applying limits.
+
+        Child process starts a new session, so the process group can be
+        killed with everything ngspice starts. Running Python code in the
+        child of a threaded process may deadlock it, so a ``preexec_fn`` is
+        only passed to set CPU time and memory limits, or on Python 2, which
+        has no ``start_new_session``.
+        """
+        if os.name != "posix":
+            return {}
+        if sys.version_info >= (3, 2):
+            return {"start_new_session": True, "preexec_fn": self.preexec_fn()}
+        return {"preexec_fn": self.preexec_fn(new_session=True)}
+
+    def preexec_fn(self, new_session=False):
+        """Returns function run in the child process before ngspice.
+
+        It sets CPU time and memory limits.
+
+        Args:
+            new_session: If True, it also starts a new session.
+
+        Returns:
+            Function or None if there is nothing to do, or child processes
+            cannot run Python code before executing.
+        """
+        if os.name != "posix":
+            return None
+        cpu_time = int(self.cpu_time) if self.cpu_time else None
+        memory = int(self.memory) if self.memory else None
+        if not new_session and (resource is None or (cpu_time is None and memory is None)):
+            return None
+
+        def set_limits():
+            if new_session:
+                os.setsid()
+            if resource is not None:
+                if cpu_time is not None:
+                    resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + self.CPU_GRACE))
+                if memory is not None:
+                    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+        return set_limits
+
+
+class RunReport(object):
+    """Why a process stopped and resources it used.
+
+    Attributes:
+        stop_reason: One of ``EXITED``, ``FATAL_ERROR``, ``CANCELLED``,
+            ``WALL_TIME``, ``CPU_TIME``, ``MEMORY`` and ``SIGNALED``.
+        returncode: Process return code, negative signal number if it was
+            killed, or None if it is unknown.
+        wall_time: Wall clock seconds it ran.
+        user_time: User CPU seconds or None if they are unknown.
+        system_time: System CPU seconds or None if they are unknown.
+        max_rss: Peak resident memory bytes or None if it is unknown.
+    """
+
+    EXITED = "exited"
+    FATAL_ERROR = "fatal-error"
+    CANCELLED = "cancelled"
+    WALL_TIME = "wall-time"
+    CPU_TIME = "cpu-time"
+    MEMORY = "memory"
+    SIGNALED = "signaled"
+
+    # Reasons a process was stopped by a limit
+    LIMITS = (WALL_TIME, CPU_TIME, MEMORY)
+
+    def __init__(self, stop_reason, returncode=None, wall_time=None, user_time=None, system_time=None,
+                 max_rss=None):
+        self.stop_reason = stop_reason
+        self.returncode = returncode
+        self.wall_time = wall_time
+        self.user_time = user_time
+        self.system_time = system_time
+        self.max_rss = max_rss
+
+    def __repr__(self):
+        return "<RunReport {0} returncode={1}>".format(self.stop_reason, self.returncode)
+
+    @property
+    def limit_exceeded(self):
+        return self.stop_reason in self.LIMITS
+
+    def describe(self, limits=None):
+        """Returns a sentence telling why process stopped."""
+        if self.stop_reason == self.WALL_TIME:
+            limit = " of {0} s".format(limits.wall_time) if limits is not None else ""
+            return "ngspice was stopped: wall clock time limit{0} exceeded".format(limit)
+        if self.stop_reason == self.CPU_TIME:
+            limit = " of {0} s".format(limits.cpu_time) if limits is not None else ""
+            return "ngspice was stopped: CPU time limit{0} exceeded".format(limit)
+        if self.stop_reason == self.MEMORY:
+            limit = " of {0} MiB".format(limits.memory // (1024 * 1024)) if limits is not None else ""
+            return "ngspice was stopped: memory limit{0} exceeded".format(limit)
+        if self.stop_reason == self.SIGNALED:
+            return "ngspice was killed by signal {0}".format(-self.returncode)
+        if self.stop_reason == self.CANCELLED:
+            return "ngspice was cancelled"
+        if self.stop_reason == self.FATAL_ERROR:
+            return "ngspice was stopped after a fatal error"
+        return "ngspice exited with code {0}".format(self.returncode)
+
+    def as_dict(self):
+        """Returns report as a dictionary, for JSON summaries."""
+        return {"stop_reason": self.stop_reason,
+                "returncode": self.returncode,
+                "wall_time": self.wall_time,
+                "user_time": self.user_time,
+                "system_time": self.system_time,
+                "max_rss": self.max_rss}
+
+
+def kill_group(process):
+    """Kills process and its process group, if it is still running."""
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass  # Already gone
+
+
+class Watchdog(object):
+    """Kills process group of a process running longer than a timeout.
+
+    Attributes:
+        expired: True if process was killed by the watchdog.
+    """
+
+    def __init__(self, process, timeout):
+        """Inits Watchdog and starts watching if timeout is not None."""
+        self.process = process
+        self.timeout = timeout
+        self.expired = False
+        self._stopped = Event()
+        if timeout is not None:
+            thread = Thread(name="ngspice-watchdog", target=self._watch)
+            thread.daemon = True
+            thread.start()
+
+    def _watch(self):
+        self._stopped.wait(self.timeout)
+        if not self._stopped.is_set():
+            self.expired = True
+            kill_group(self.process)
+
+    def stop(self):
+        """Stops watching, process is not killed anymore."""
+        self._stopped.set()
+
+
+class ProcessSupervisor(object):
+    """Starts a process with resource limits and reports how it ended.
+
+    ``wait()`` reaps the process with ``wait4()``, where available, to get
+    its resource usage. It can be passed to ``ProcessOutput`` instead of
+    ``Popen.wait()``.
+
+    Attributes:
+        limits: ResourceLimits of the process.
+        process: ``subprocess.Popen`` once started.
+        report: RunReport once process ended.
+    """
+
+    def __init__(self, limits=None):
+        """Inits ProcessSupervisor.
+
+        Args:
+            limits: ResourceLimits. Default is no limits.
+        """
+        self.limits = limits if limits is not None else ResourceLimits()
+        self.process = None
+        self.report = None
+        self._watchdog = None
+        self._rusage = None
+        self._start_time = None
+        self._end_time = None
+        self._cancelled = False
+        self._lock = Lock()
+
+    def popen(self, command, **kwargs):
+        """Starts command with ``subprocess.Popen`` and returns it.
+
+        Keyword arguments are passed to ``subprocess.Popen``.
+        """
+        self._start_time = timeit.default_timer()
+        kwargs.update(self.limits.popen_kwargs())
+        process = subprocess.Popen(command, **kwargs)
+        self._watchdog = Watchdog(process, self.limits.wall_time)
+        with self._lock:
+            self.process = process
+            if self._cancelled:
+                kill_group(process)
+        return process
+
+    def wait(self):
+        """Waits for process to end and returns its return code."""
+        process = self.process
+        if process.returncode is None and hasattr(os, "wait4"):
+            try:
+                while True:
+                    try:
+                        pid, status, self._rusage = os.wait4(process.pid, 0)
+                        break
+                    except OSError as e:
+                        if e.errno != errno.EINTR:
+                            raise
+                if os.WIFSIGNALED(status):
+                    process.returncode = -os.WTERMSIG(status)
+                else:
+                    process.returncode = os.WEXITSTATUS(status)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                # Reaped by a Popen.poll() from another thread
+        returncode = process.wait()
+        self._end_time = timeit.default_timer()
+        self._watchdog.stop()
+        return returncode
+
+    def cancel(self):
+        """Kills process group. Report tells it was cancelled."""
+        with self._lock:
+            self._cancelled = True
+            if self.process is not None:
+                kill_group(self.process)
+
+    def finish(self, fatal_error=None, errors=()):
+        """Makes report of an ended process.
+
+        Args:
+            fatal_error: Fatal error the process was stopped for or None.
+            errors: Error lines of the process. Memory allocation errors
+                tell a memory limit was hit.
+
+        Returns:
+            RunReport, also kept in ``report``.
+        """
+        if self._end_time is None:
+            self._end_time = timeit.default_timer()
+        self.report = make_report(self.process.returncode, self._end_time - self._start_time, self.limits,
+                                  self._rusage, self._watchdog is not None and self._watchdog.expired,
+                                  self._cancelled, fatal_error, errors)
+        return self.report
+
+
+def make_report(returncode, wall_time, limits, rusage=None, expired=False, cancelled=False, fatal_error=None,
+                errors=()):
+    """Tells why a process stopped.
+
+    Args:
+        returncode: Process return code.
+        wall_time: Wall clock seconds it ran.
+        limits: ResourceLimits of the process.
+        rusage: ``resource.struct_rusage`` of the process or None.
+        expired: True if wall clock time limit was exceeded.
+        cancelled: True if process was cancelled.
+        fatal_error: Fatal error the process was stopped for or None.
+        errors: Error lines of the process. Memory allocation errors tell a
+            memory limit was hit.
+
+    Returns:
+        RunReport.
+    """
+    usage = {}
+    if rusage is not None:
+        # Linux reports KiB, macOS bytes
+        scale = 1 if sys.platform == "darwin" else 1024
+        usage = {"user_time": rusage.ru_utime,
+                 "system_time": rusage.ru_stime,
+                 "max_rss": rusage.ru_maxrss * scale}
+    cpu_time = (usage["user_time"] + usage["system_time"]) if usage else None
+
+    if expired:
+        reason = RunReport.WALL_TIME
+    elif cancelled:
+        reason = RunReport.CANCELLED
+    elif limits.cpu_time and (returncode == -getattr(signal, "SIGXCPU", 0) or
+                              (returncode == -signal.SIGKILL and cpu_time is not None and
+                               cpu_time >= limits.cpu_time)):
+        reason = RunReport.CPU_TIME
+    elif limits.memory and returncode != 0 and (
+            returncode in (-signal.SIGSEGV, -signal.SIGABRT) or
+            any("memory" in line.lower() or "alloc" in line.lower() for line in errors)):
+        reason = RunReport.MEMORY
+    elif fatal_error is not None:
+        reason = RunReport.FATAL_ERROR
+    elif returncode is not None and returncode < 0:
+        reason = RunReport.SIGNALED
+    else:
+        reason = RunReport.EXITED
+    return RunReport(reason, returncode, wall_time, **usage)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""On-disk cache of parsed simulation results."""
+
+import datetime
+import functools
+import hashlib
+import json
+import os
+import os.path
+import re
+import shutil
+import tempfile
+
+import numpy
+
+import config
+import netlist_dependencies
+from ngspice_simulation import NgspiceOutput
+
+
+class ResultCache(object):
+    """Parsed simulation results stored on disk.
+
+    Every entry is a folder named after its key, holding one ``.npy`` file per
+    data line, an ``index.json`` file describing tables and a copy of ngspice
+    output. Arrays are memory mapped on load, so a hit costs about the same
+    whatever the result size is.
+
+    Entries are evicted in least recently used order when cache size exceeds
+    ``max_size``.
+
+    Keys only depend on file contents, so results of netlists using random
+    values would be the ones of their first run. Callers should check
+    ``uses_randomness()`` before using the cache.
+
+    Attributes:
+        path: Cache folder path.
+        max_size: Maximum cache size in bytes.
+    """
+
+    INDEX_FILE = "index.json"
+    OUTPUT_FILE = "output.out"
+    DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+    # Random functions and sources, and seed settings
+    RANDOM_PATTERN = re.compile(br"\b(?:a?gauss|a?unif|sgauss|sunif|rnd|poisson|exponential|trnoise|trrandom)\s*\("
+                                br"|^[ \t]*\.options?\b[^\n]*\bseed\b|\bsetseed\b", flags=re.MULTILINE | re.IGNORECASE)
+
+    _randomness = {}  # File digest to whether file uses random values
+
+    def __init__(self, path=None, max_size=256 * 1024 * 1024):
+        """Inits ResultCache.
+
+        Args:
+            path: Cache folder path. If it is None, ``results`` folder inside
+                user cache folder is used.
+            max_size: Maximum cache size in bytes.
+        """
+        self.path = path if path is not None else os.path.join(config.get_cache_path(), "results")
+        self.max_size = max_size
+
+    @staticmethod
+    def key(netlist_path, ngspice_version, *options):
+        """Computes cache key of a netlist simulation.
+
+        Key depends on the contents of netlist, of every file it includes, of
+        ngspice version and of simulation options.
+
+        Args:
+            netlist_path: Netlist file path.
+            ngspice_version: Ngspice version string.
+            options: Other values results depend on.
+
+        Returns:
+            Hexadecimal key string.
+        """
+        return ResultCache.key_from_digests(netlist_dependencies.get_digests(netlist_path), ngspice_version,
+                                            *options)
+
+    @staticmethod
+    def key_from_digests(digests, ngspice_version, *options):
+        """Computes cache key of a netlist simulation from file digests.
+
+        Args:
+            digests: List of (path, digest) of netlist and its dependencies,
+                as returned by ``DependencyGraph.get_digests()``.
+            ngspice_version: Ngspice version string.
+            options: Other values results depend on.
+
+        Returns:
+            Hexadecimal key string, the same ``key()`` returns.
+        """
+        digest = hashlib.sha256()
+        digest.update(repr((ngspice_version,) + options).encode("utf-8"))
+        for path, file_digest in digests:
+            digest.update(b"\0" + os.path.abspath(path).encode("utf-8") + b"\0")
+            digest.update((file_digest or "missing").encode("ascii"))
+        return digest.hexdigest()
+
+    @classmethod
+    def uses_randomness(cls, digests):
+        """Tells whether results may differ between runs of a netlist.
+
+        Args:
+            digests: List of (path, digest) of netlist and its dependencies,
+                as returned by ``DependencyGraph.get_digests()``.
+
+        Returns:
+            True if netlist or a file it depends on uses random functions
+            (``gauss()``, ``agauss()``, ``unif()``...), random sources
+            (``trnoise``, ``trrandom``) or sets a seed.
+        """
+        for path, file_digest in digests:
+            random = cls._randomness.get(file_digest) if file_digest else None
+            if random is None:
+                try:
+                    with open(path, "rb") as f:
+                        random = cls.RANDOM_PATTERN.search(f.read()) is not None
+                except (IOError, OSError):
+                    random = False
+                if file_digest:
+                    cls._randomness[file_digest] = random
+            if random:
+                return True
+        return False
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key):
+        """Gets cached results.
+
+        Args:
+            key: Cache key.
+
+        Returns:
+            ``(NgspiceOutput, output_file_path)`` or None if key is not cached.
+        """
+        entry_path = self._entry_path(key)
+        index_path = os.path.join(entry_path, self.INDEX_FILE)
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        os.utime(index_path, None)  # Mark as recently used
+
+        output = NgspiceOutput()
+        output.circuit_name = index["circuit_name"]
+        for table in index["tables"]:
+            if table["date"] is not None:
+                date = datetime.datetime.strptime(table["date"], self.DATE_FORMAT)
+            else:
+                date = None
+            loader = functools.partial(self._load_table, entry_path, table["columns"])
+            output.tables.append(NgspiceOutput.Table(table["plot"], table["analysis"], date,
+                                                     tuple(table["headers"]), None, loader))
+        output.select_analysis(index["analysis"])
+        return output, os.path.join(entry_path, self.OUTPUT_FILE)
+
+    @staticmethod
+    def _load_table(entry_path, columns):
+        """Returns DataLine list of a cached table.
+
+        Args:
+            entry_path: Cache entry folder path.
+            columns: List of (name, independent, file name).
+        """
+        data_lines = []
+        for name, independent, file_name in columns:
+            values = numpy.load(os.path.join(entry_path, file_name), mmap_mode="r")
+            data_line = NgspiceOutput.DataLine(name, values)
+            data_line.independent = independent
+            data_lines.append(data_line)
+        return data_lines
+
+    def put(self, key, output, output_file=None):
+        """Stores results.
+
+        Every table of output is parsed if it was not before.
+
+        Args:
+            key: Cache key.
+            output: NgspiceOutput object.
+            output_file: Ngspice output file path or None.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        temp_path = tempfile.mkdtemp(prefix=".tmp-", dir=self.path)
+        try:
+            tables = []
+            for table_i, table in enumerate(output.tables):
+                columns = []
+                for column_i, data_line in enumerate(table.data_lines):
+                    file_name = "{0}-{1}.npy".format(table_i, column_i)
+                    numpy.save(os.path.join(temp_path, file_name), data_line.values)
+                    columns.append((data_line.name, data_line.independent, file_name))
+                tables.append({"plot": table.plot,
+                               "analysis": table.analysis,
+                               "date": table.date.strftime(self.DATE_FORMAT) if table.date is not None else None,
+                               "headers": list(table.headers),
+                               "columns": columns})
+
+            if output_file is not None:
+                shutil.copyfile(output_file, os.path.join(temp_path, self.OUTPUT_FILE))
+
+            with open(os.path.join(temp_path, self.INDEX_FILE), "w") as f:
+                json.dump({"circuit_name": output.circuit_name,
+                           "analysis": output.analysis,
+                           "tables": tables}, f)
+
+            entry_path = self._entry_path(key)
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+            os.rename(temp_path, entry_path)
+        except:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+
+        self.evict()
+
+    @staticmethod
+    def _folder_size(path):
+        size = 0
+        for file_name in os.listdir(path):
+            size += os.path.getsize(os.path.join(path, file_name))
+        return size
+
+    def evict(self):
+        """Removes least recently used entries until cache fits in max_size."""
+        entries = []
+        for key in os.listdir(self.path):
+            entry_path = self._entry_path(key)
+            index_path = os.path.join(entry_path, self.INDEX_FILE)
+            if key.startswith(".") or not os.path.exists(index_path):
+                continue  # Entry being written
+            entries.append((os.path.getmtime(index_path), self._folder_size(entry_path), entry_path))
+
+        size = sum(entry[1] for entry in entries)
+        for last_use, entry_size, entry_path in sorted(entries):
+            if size <= self.max_size:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            size -= entry_size
+
+    def clear(self):
+        """Removes every cache entry."""
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Folders of their own for the output files of every simulation run.
+
+Runs never write next to the netlist, so windows and batch jobs simulating
+the same netlist at the same time do not overwrite each other's results.
+Folders are created in memory backed file systems when there is one.
+"""
+
+import errno
+import getpass
+import os
+import os.path
+import shutil
+import tempfile
+from threading import Lock
+
+# Folders tried in order, None entries are skipped
+RUNTIME_DIR_CANDIDATES = ("/dev/shm", os.environ.get("XDG_RUNTIME_DIR"), tempfile.gettempdir())
+
+_runtime_dir = None
+_runtime_dir_lock = Lock()
+
+
+def get_runtime_dir():
+    """Returns folder run directories are created in.
+
+    It is a ``spicegui-<user>`` folder only the user can access, in the first
+    writable folder of ``RUNTIME_DIR_CANDIDATES``: ``/dev/shm``,
+    ``$XDG_RUNTIME_DIR`` and then the system temporary folder.
+    """
+    global _runtime_dir
+    with _runtime_dir_lock:
+        if _runtime_dir is None:
+            for candidate in RUNTIME_DIR_CANDIDATES:
+                if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK | os.X_OK):
+                    path = os.path.join(candidate, "spicegui-" + getpass.getuser())
+                    try:
+                        os.mkdir(path, 0o700)
+                    except OSError as e:
+                        if e.errno != errno.EEXIST:
+                            continue
+                    # Shared folders may hold one made by somebody else
+                    if not hasattr(os, "getuid") or os.stat(path).st_uid == os.getuid():
+                        _runtime_dir = path
+                        break
+            else:
+                raise IOError("No writable folder for simulation outputs")
+        return _runtime_dir
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def remove_orphans(parent=None):
+    """Removes run directories left by processes that are not running.
+
+    Memory backed folders are only emptied on reboot otherwise.
+
+    Args:
+        parent: Folder holding run directories. Default is
+            ``get_runtime_dir()``.
+    """
+    if parent is None:
+        parent = get_runtime_dir()
+    for name in os.listdir(parent):
+        fields = name.split("-")
+        if len(fields) < 3 or fields[0] != "run" or not fields[1].isdigit():
+            continue
+        if int(fields[1]) != os.getpid() and not _pid_exists(int(fields[1])):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+class RunDirectory(object):
+    """Folder holding output files of a single simulation run.
+
+    Attributes:
+        netlist_path: Absolute path of simulated netlist.
+        path: Run folder path.
+        output_path: ngspice output file path.
+        rawfile_path: ngspice binary rawfile path.
+    """
+
+    def __init__(self, netlist_path, parent=None):
+        """Inits RunDirectory and creates its folder.
+
+        Args:
+            netlist_path: Netlist file path.
+            parent: Folder the run folder is created in. Default is
+                ``get_runtime_dir()``.
+        """
+        self.netlist_path = os.path.abspath(netlist_path)
+        if parent is None:
+            parent = get_runtime_dir()
+        # Process id tells remove_orphans() whether folder is still in use
+        self.path = tempfile.mkdtemp(prefix="run-{0}-".format(os.getpid()), dir=parent)
+        name = os.path.basename(self.netlist_path)
+        self.output_path = os.path.join(self.path, name + ".out")
+        self.rawfile_path = os.path.join(self.path, name + ".raw")
+
+    def persist(self, dest_dir=None):
+        """Copies output files next to the netlist.
+
+        Files are named ``netlist_path + ".out"`` and ``netlist_path +
+        ".raw"``, like ngspice outputs used to be. Each one is written to a
+        temporary file first and renamed, so previous files that are still
+        open or mapped remain valid.
+
+        Args:
+            dest_dir: Destination folder. Default is netlist folder.
+
+        Returns:
+            List of written file paths.
+        """
+        if dest_dir is None:
+            dest_dir = os.path.dirname(self.netlist_path)
+        name = os.path.basename(self.netlist_path)
+        written = []
+        for source in (self.output_path, self.rawfile_path):
+            if not os.path.exists(source):
+                continue
+            dest = os.path.join(dest_dir, name + os.path.splitext(source)[1])
+            fd, temp_path = tempfile.mkstemp(prefix="." + name + "-", dir=dest_dir)
+            try:
+                with os.fdopen(fd, "wb") as f, open(source, "rb") as s:
+                    shutil.copyfileobj(s, f)
+                os.rename(temp_path, dest)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            written.append(dest)
+        return written
+
+    def remove(self):
+        """Removes run folder and its files."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class RunHistory(object):
+    """Last run directories of a window or a batch, the older ones removed.
+
+    Attributes:
+        keep: Number of run directories kept.
+    """
+
+    def __init__(self, keep=1):
+        """Inits RunHistory.
+
+        Args:
+            keep: Number of run directories kept, at least 1.
+        """
+        self.keep = keep
+        self.runs = []
+
+    def add(self, run):
+        """Adds run as the newest one and removes those beyond keep."""
+        self.runs.append(run)
+        while len(self.runs) > max(self.keep, 1):
+            self.runs.pop(0).remove()
+
+    @property
+    def last(self):
+        """Newest run directory or None."""
+        return self.runs[-1] if self.runs else None
+
+    def clear(self):
+        """Removes every run directory."""
+        while self.runs:
+            self.runs.pop().remove()
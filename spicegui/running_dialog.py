@@ -18,26 +18,53 @@
 
 from __future__ import print_function
 
+from threading import Lock
+
 from gi.repository import Gtk, GObject
 
 
 class RunningDialog(Gtk.Dialog):
 
-    def __init__(self, parent, event):
+    UPDATE_INTERVAL = 100 # Milliseconds between progress bar updates
+
+    def __init__(self, parent, event, title=None, text=None, progress=None, simulation_progress=None):
+        """Inits RunningDialog.
+
+        Args:
+            parent: Parent window.
+            event: CompletionEvent set when the task ends. Dialog emits
+                response 1 as soon as it is set.
+            title: Dialog title. Default is "Simulation".
+            text: Progress bar text. Default is "Running ngspice…".
+            progress: Function returning the done fraction of the task. If it
+                is None, progress bar pulses.
+            simulation_progress: SimulationProgress of the task. Progress
+                bar shows its fraction and time left once they are known.
+        """
+        if title is None:
+            title = _("Simulation")
+        if text is None:
+            text = _(u"Running ngspice…")
         if Gtk.check_version(3, 12, 0) is None: # Use header bar
-            Gtk.Dialog.__init__(self, _("Simulation"), parent, 
+            Gtk.Dialog.__init__(self, title, parent, 
                                 Gtk.DialogFlags.MODAL | 
                                 Gtk.DialogFlags.DESTROY_WITH_PARENT,
                                 (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL), 
                                 use_header_bar=True)
             self.get_header_bar().set_show_close_button(False)
         else: # Do not use header bar
-            Gtk.Dialog.__init__(self, _("Simulation"), parent, 
+            Gtk.Dialog.__init__(self, title, parent, 
                     Gtk.DialogFlags.MODAL | 
                     Gtk.DialogFlags.DESTROY_WITH_PARENT,
                     (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL))
         
         self.event = event
+        self.progress = progress
+        self.simulation_progress = simulation_progress
+        self.text = text
+        self._progress_pending = False
+        self._progress_lock = Lock()
+        self._destroyed = False
         
         self.set_default_size(150, 100)
         self.props.resizable = False 
@@ -46,7 +73,7 @@ class RunningDialog(Gtk.Dialog):
         self.progress_bar = Gtk.ProgressBar()
         self.progress_bar.activity_mode = True
         self.progress_bar.pulse()
-        self.progress_bar.set_text(_(u"Running ngspice…"))
+        self.progress_bar.set_text(text)
         self.progress_bar.set_show_text(True)
         
         self.hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
@@ -62,25 +89,83 @@ class RunningDialog(Gtk.Dialog):
         box = self.get_content_area()
         box.add(self.hbox)
         
-        self.timeout_id = GObject.timeout_add(50, self.on_timeout, None)
-        
+        # Progress bar is animated until simulation progress is known, end of
+        # task is notified by the event
+        self.timeout_id = GObject.timeout_add(self.UPDATE_INTERVAL, self.on_timeout, None)
+        self.event.add_callback(self.on_event_set)
+        if self.simulation_progress is not None:
+            self.simulation_progress.add_callback(self.on_simulation_progress)
+        # Event may have been set before the main loop runs the dialog
+        GObject.idle_add(self.on_event_idle)
+        self.connect("destroy", self.on_destroy)
+
         self.show_all()
-        
+
     def on_timeout(self, user_data):
-        """
-        Update value in the progress bar.
-        
-        If simulation event is set, dialog emits response 1
-        """
-        self.progress_bar.pulse()
-        if self.event.is_set(): # if thread finished
-            self.response(1) # 1 is an application-defined response type
+        """Updates value in the progress bar."""
+        if self.progress is not None:
+            self.progress_bar.set_fraction(self.progress())
+        elif self.simulation_progress is None or self.simulation_progress.fraction is None:
+            self.progress_bar.pulse()
+        else:
+            # Progress updates took over
+            self.timeout_id = None
+            return False
         return True
 
+    def _remove_timeout(self):
+        if self.timeout_id is not None:
+            GObject.source_remove(self.timeout_id)
+            self.timeout_id = None
+
+    def on_simulation_progress(self, simulation_progress):
+        # Called from the thread reading simulation output, often
+        with self._progress_lock:
+            if self._progress_pending:
+                return
+            self._progress_pending = True
+        GObject.idle_add(self.on_simulation_progress_idle)
+
+    def on_simulation_progress_idle(self):
+        """Shows simulation fraction and time left."""
+        with self._progress_lock:
+            self._progress_pending = False
+        if self._destroyed:
+            return False
+        fraction = self.simulation_progress.fraction
+        eta = self.simulation_progress.eta
+        if fraction is not None:
+            # No more pulses, progress bar changes with every update
+            self._remove_timeout()
+            self.progress_bar.set_fraction(fraction)
+            if eta is not None:
+                self.progress_bar.set_text(_(u"{0} {1:.0f}%, {2:.0f} s left").format(self.text, 100 * fraction, eta))
+            else:
+                self.progress_bar.set_text(u"{0} {1:.0f}%".format(self.text, 100 * fraction))
+        return False
+
+    def on_event_set(self):
+        # Called from the thread setting the event
+        GObject.idle_add(self.on_event_idle)
+
+    def on_event_idle(self):
+        """Emits response 1 if task ended."""
+        if not self._destroyed and self.event.is_set():
+            self._remove_timeout()
+            self.response(1) # 1 is an application-defined response type
+        return False
+
+    def on_destroy(self, widget):
+        self.event.remove_callback(self.on_event_set)
+        if self.simulation_progress is not None:
+            self.simulation_progress.remove_callback(self.on_simulation_progress)
+        self._destroyed = True
+        self._remove_timeout()
+
 
 if __name__ == "__main__":
-    from multiprocessing import Event
-    event_test = Event()
+    from completion_event import CompletionEvent
+    event_test = CompletionEvent()
     win = Gtk.Window()
     dialog = RunningDialog(win, event_test)
     dialog.run()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Progress of running simulations, parsed from ngspice output."""
+
+import re
+import timeit
+from threading import Lock
+
+
+class SimulationProgress(object):
+    """Progress and estimated time left of a running simulation.
+
+    ngspice prints ``Reference value : <time>`` while a transient analysis
+    runs, which is turned into a fraction of the ``.tran`` stop time. The
+    shared library reports ``tran: 12.3%`` statuses instead. Lines are fed
+    with ``feed_line()`` and subscribers are called on every change.
+
+    Attributes:
+        tstop: Transient analysis stop time or None if it is unknown.
+        fraction: Simulated fraction, from 0 to 1, or None if it is unknown.
+        eta: Estimated seconds left or None if they are unknown.
+        elapsed: Seconds since simulation started.
+    """
+
+    REFERENCE_PATTERN = re.compile(r"Reference value\s*:\s*([-+0-9.eE]+)")
+    PERCENT_PATTERN = re.compile(r"^\s*(\w+)\s*:\s*([0-9.]+)\s*%")
+
+    def __init__(self, tstop=None):
+        """Inits SimulationProgress.
+
+        Args:
+            tstop: Transient analysis stop time, in seconds, or None.
+        """
+        self._callbacks = []
+        self._lock = Lock()
+        self.reset(tstop)
+
+    def reset(self, tstop=None):
+        """Starts following a new simulation.
+
+        Args:
+            tstop: Transient analysis stop time, in seconds, or None.
+        """
+        self.tstop = tstop
+        self.fraction = None
+        self.eta = None
+        self._start = timeit.default_timer()
+        self._first = None  # (time, fraction) of first progress report
+
+    @property
+    def elapsed(self):
+        return timeit.default_timer() - self._start
+
+    def add_callback(self, callback):
+        """Calls callback(progress) on every progress change.
+
+        Callbacks run in the thread reading ngspice output. GUI code should
+        hand work over to the main loop.
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def feed_line(self, line):
+        """Parses a line of ngspice output.
+
+        Returns:
+            True if line is a progress report.
+        """
+        match = self.PERCENT_PATTERN.match(line)
+        if match is not None:
+            if match.group(1).lower() == "tran":
+                self.update(float(match.group(2)) / 100.0)
+            return True
+        match = self.REFERENCE_PATTERN.search(line)
+        if match is not None:
+            if self.tstop:
+                try:
+                    self.update(float(match.group(1)) / self.tstop)
+                except ValueError:
+                    pass
+            return True
+        return False
+
+    def update(self, fraction):
+        """Sets simulated fraction and estimates time left from the rate
+        observed since the first report.
+        """
+        now = timeit.default_timer()
+        self.fraction = min(max(fraction, 0.0), 1.0)
+        if self._first is None or self.fraction < self._first[1]:
+            # New analysis starts again from zero
+            self._first = (now, self.fraction)
+            self.eta = None
+        elif self.fraction > self._first[1]:
+            rate = (self.fraction - self._first[1]) / (now - self._first[0])
+            self.eta = (1.0 - self.fraction) / rate if rate > 0 else None
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback(self)
+
+    def __str__(self):
+        if self.fraction is None:
+            return "{0:.0f} s".format(self.elapsed)
+        if self.eta is None:
+            return "{0:.0f}%".format(100 * self.fraction)
+        return "{0:.0f}%, {1:.0f} s left".format(100 * self.fraction, self.eta)
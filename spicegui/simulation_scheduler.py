@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Parallel ngspice simulation of many netlists."""
+
+import multiprocessing
+import os
+import os.path
+import shutil
+import subprocess
+import tempfile
+from threading import Condition, Lock, Thread
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import run_directory
+from ngspice_session import NgspiceSession
+from ngspice_process import ExecutionError, Ngspice, ProcessOutput
+from process_limits import ProcessSupervisor
+from simulation_progress import SimulationProgress
+
+
+class JobCancelled(Exception):
+    """Simulation job was cancelled."""
+    pass
+
+
+class SimulationJob(object):
+    """Simulation of a netlist run by a SimulationScheduler.
+
+    Jobs work as futures: their state can be polled, waited for or followed
+    with callbacks.
+
+    Attributes:
+        netlist_path: Netlist file path.
+        output_path: Path of ngspice output file, in a folder of its own.
+        rawfile_path: Path of binary rawfile or None if it is not written.
+        state: One of ``PENDING``, ``RUNNING``, ``DONE``, ``FAILED`` and
+            ``CANCELLED``.
+        stdout: ngspice standard output once job ended.
+        stderr: ngspice standard error once job ended.
+        progress: SimulationProgress of the running job.
+        limits: ResourceLimits of ngspice or None.
+        report: RunReport telling how ngspice ended and resources it used,
+            or None if job did not start its own ngspice process.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, netlist_path, output_dir, binary_rawfile=False, cwd=None, limits=None):
+        """Inits SimulationJob.
+
+        Args:
+            netlist_path: Netlist file path.
+            output_dir: Folder output files are written to.
+            binary_rawfile: If True, a binary rawfile is also written.
+            cwd: Folder ngspice runs in. Default is netlist folder.
+            limits: ResourceLimits of ngspice or None. They do not apply to
+                persistent sessions.
+        """
+        self.netlist_path = netlist_path
+        self.cwd = cwd if cwd is not None else os.path.dirname(os.path.abspath(netlist_path))
+        self.output_path = os.path.join(output_dir, "output.out")
+        self.rawfile_path = os.path.join(output_dir, "output.raw") if binary_rawfile else None
+        self.state = self.PENDING
+        self.stdout = None
+        self.stderr = None
+        self.progress = SimulationProgress()
+        self.limits = limits
+        self.report = None
+        self._error = None
+        self._supervisor = None
+        self._session = None
+        self._callbacks = []
+        self._condition = Condition(Lock())
+
+    def __repr__(self):
+        return "<SimulationJob {0} {1}>".format(self.netlist_path, self.state)
+
+    def done(self):
+        """Returns True if job ended, whatever the way."""
+        with self._condition:
+            return self.state in (self.DONE, self.FAILED, self.CANCELLED)
+
+    def cancelled(self):
+        with self._condition:
+            return self.state == self.CANCELLED
+
+    def running(self):
+        with self._condition:
+            return self.state == self.RUNNING
+
+    def cancel(self):
+        """Cancels job.
+
+        Pending jobs never run. Running jobs have their ngspice process
+        terminated, persistent sessions are started again by their next job.
+
+        Returns:
+            False if job had already ended, True otherwise.
+        """
+        with self._condition:
+            if self.state == self.PENDING:
+                self.state = self.CANCELLED
+                self._error = JobCancelled()
+            elif self.state == self.RUNNING:
+                self._error = JobCancelled()
+                if self._supervisor is not None:
+                    self._supervisor.cancel()
+                elif self._session is not None:
+                    self._session.close()
+                return True  # Worker ends the job when process exits
+            else:
+                return False
+        self._finish()
+        return True
+
+    def wait(self, timeout=None):
+        """Waits for job to end.
+
+        Returns:
+            True if job ended, False on timeout.
+        """
+        with self._condition:
+            if self.state not in (self.DONE, self.FAILED, self.CANCELLED):
+                self._condition.wait(timeout)
+            return self.state in (self.DONE, self.FAILED, self.CANCELLED)
+
+    def exception(self, timeout=None):
+        """Returns error of a failed or cancelled job, or None.
+
+        Waits for job to end.
+
+        Raises:
+            RuntimeError: On timeout.
+        """
+        if not self.wait(timeout):
+            raise RuntimeError("Timeout waiting for simulation job")
+        return self._error
+
+    def result(self, timeout=None):
+        """Returns ngspice output file path.
+
+        Waits for job to end.
+
+        Raises:
+            ExecutionError: If ngspice reported errors.
+            JobCancelled: If job was cancelled.
+            RuntimeError: On timeout.
+        """
+        error = self.exception(timeout)
+        if error is not None:
+            raise error
+        return self.output_path
+
+    def get_output(self, timeout=None):
+        """Returns parsed results as a NgspiceOutput.
+
+        Rawfile is used when it was written. Waits for job to end.
+        """
+        # Imported here, running simulations does not need numpy
+        from ngspice_simulation import NgspiceOutput
+
+        self.result(timeout)
+        if self.rawfile_path is not None:
+            return NgspiceOutput.parse_raw(self.rawfile_path)
+        return NgspiceOutput.parse_file(self.output_path)
+
+    def add_done_callback(self, callback):
+        """Calls callback(job) when job ends.
+
+        Callbacks are called from worker threads, or right now if job already
+        ended. GUI code should hand work over to the main loop.
+        """
+        with self._condition:
+            if self.state not in (self.DONE, self.FAILED, self.CANCELLED):
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    @property
+    def output_dir(self):
+        """Folder of job output files."""
+        return os.path.dirname(self.output_path)
+
+    def remove_outputs(self):
+        """Removes job output folder."""
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def _start(self):
+        """Marks job as running. Returns False if it was cancelled."""
+        with self._condition:
+            if self.state != self.PENDING:
+                return False
+            self.state = self.RUNNING
+            return True
+
+    def _run(self, session=None):
+        """Runs ngspice and waits for it. Called by worker threads.
+
+        Args:
+            session: NgspiceSession of worker or None to start ngspice.
+        """
+        try:
+            with self._condition:
+                if self._error is None:
+                    if session is not None:
+                        self._session = session
+                    else:
+                        self._supervisor = ProcessSupervisor(self.limits)
+                        self._supervisor.popen(
+                            Ngspice._command(os.path.abspath(self.netlist_path), self.rawfile_path, self.output_path),
+                            shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            cwd=self.cwd)
+            if self._session is not None:
+                self.stdout = session.simulate(self.netlist_path, self.rawfile_path, self.output_path, self.cwd,
+                                               self.progress)
+                self.stderr = ""
+            elif self._supervisor is not None:
+                self.progress.reset(Ngspice._transient_stop(self.netlist_path))
+                output = ProcessOutput(self._supervisor.process, "Error:", Ngspice.FATAL_ERRORS,
+                                       on_line=lambda stream, line: self.progress.feed_line(line),
+                                       wait=self._supervisor.wait)
+                self.stdout, self.stderr = output.read()
+                self.report = self._supervisor.finish(output.fatal_error, output.errors)
+                if self._error is None and self.report.limit_exceeded:
+                    self._error = ExecutionError(self.report.describe(self.limits))
+                if self._error is None and output.errors:
+                    self._error = ExecutionError("\n".join(output.errors))
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+
+        with self._condition:
+            if isinstance(self._error, JobCancelled):
+                self.state = self.CANCELLED
+            elif self._error is not None:
+                self.state = self.FAILED
+            else:
+                self.state = self.DONE
+        self._finish()
+
+    def _finish(self):
+        with self._condition:
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notify_all()
+        for callback in callbacks:
+            callback(self)
+
+
+class SimulationScheduler(object):
+    """Runs ngspice simulations on a bounded pool of worker threads.
+
+    Every worker drives one ngspice process at a time, so at most ``workers``
+    simulations run together. With persistent sessions, every worker keeps
+    its ngspice process running between jobs, which saves its start-up time
+    on small circuits. Every job writes its outputs to a temporary
+    folder of its own, so the same netlist can be simulated more than once
+    at the same time.
+
+    Attributes:
+        workers: Maximum number of simultaneous simulations.
+        work_dir: Folder holding job output folders.
+        binary_rawfile: If True, jobs also write a binary rawfile.
+        persistent_sessions: If True, workers simulate in NgspiceSession.
+        limits: ResourceLimits of every job or None.
+    """
+
+    def __init__(self, workers=None, work_dir=None, binary_rawfile=False, persistent_sessions=False,
+                 limits=None):
+        """Inits SimulationScheduler and starts its workers.
+
+        Args:
+            workers: Maximum number of simultaneous simulations. Default is
+                the number of processors.
+            work_dir: Folder holding job output folders. Default is
+                ``run_directory.get_runtime_dir()``, in memory when possible.
+            binary_rawfile: If True, jobs also write a binary rawfile. It is
+                always written with persistent sessions.
+            persistent_sessions: If True, every worker keeps an ngspice
+                process running between jobs.
+            limits: ResourceLimits of every job or None. A job running away
+                is stopped without stopping the others.
+        """
+        if workers is None:
+            try:
+                workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                workers = 1
+        if workers < 1:
+            raise ValueError("workers must be positive")
+        self.workers = workers
+        self.work_dir = work_dir
+        self.binary_rawfile = binary_rawfile or persistent_sessions
+        self.persistent_sessions = persistent_sessions
+        self.limits = limits
+        self._queue = queue.Queue()
+        self._jobs = []
+        self._lock = Lock()
+        self._shutdown = False
+        self._threads = []
+        for i in range(workers):
+            thread = Thread(name="ngspice-worker-{0}".format(i), target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        session = NgspiceSession() if self.persistent_sessions else None
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                if job._start():
+                    job._run(session)
+        finally:
+            if session is not None:
+                session.close()
+
+    def submit(self, netlist_path, cwd=None):
+        """Schedules simulation of a netlist.
+
+        Args:
+            netlist_path: Netlist file path.
+            cwd: Folder ngspice runs in, relative included files are looked
+                for there. Default is netlist folder.
+
+        Returns:
+            SimulationJob.
+
+        Raises:
+            RuntimeError: If scheduler was shut down.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit jobs after shutdown")
+            # Process id lets run_directory.remove_orphans() clean up after crashes
+            output_dir = tempfile.mkdtemp(prefix="run-{0}-job-".format(os.getpid()),
+                                          dir=self.work_dir if self.work_dir is not None
+                                          else run_directory.get_runtime_dir())
+            job = SimulationJob(netlist_path, output_dir, self.binary_rawfile, cwd, self.limits)
+            self._jobs.append(job)
+            self._queue.put(job)
+        return job
+
+    def map(self, netlist_paths):
+        """Schedules simulation of many netlists.
+
+        Returns:
+            List of SimulationJob in the same order.
+        """
+        return [self.submit(netlist_path) for netlist_path in netlist_paths]
+
+    @property
+    def jobs(self):
+        """List of every submitted job."""
+        with self._lock:
+            return list(self._jobs)
+
+    def as_completed(self, jobs=None, timeout=None):
+        """Yields jobs as they end, in completion order.
+
+        Args:
+            jobs: Jobs to wait for. Default is every submitted job.
+            timeout: Maximum seconds waiting for the next job, or None.
+
+        Raises:
+            RuntimeError: On timeout.
+        """
+        if jobs is None:
+            jobs = self.jobs
+        completed = queue.Queue()
+        for job in jobs:
+            job.add_done_callback(completed.put)
+        for i in range(len(jobs)):
+            try:
+                yield completed.get(timeout=timeout)
+            except queue.Empty:
+                raise RuntimeError("Timeout waiting for simulation jobs")
+
+    def cancel_all(self):
+        """Cancels every job not ended yet."""
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self, wait=True, cancel=False):
+        """Stops workers once queued jobs end.
+
+        Args:
+            wait: If True, waits for workers to stop.
+            cancel: If True, jobs not ended yet are cancelled first.
+        """
+        with self._lock:
+            self._shutdown = True
+        if cancel:
+            self.cancel_all()
+        for thread in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True, cancel=exc_type is not None)
+        return False
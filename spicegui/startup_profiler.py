@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# SpiceGUI
+# Copyright (C) 2014-2015 Rafael Bailón-Ruiz <rafaelbailon@ieee.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Start-up time breakdown.
+
+Run SpiceGUI with ``SPICEGUI_PROFILE_STARTUP=1`` to print, once the first
+window is drawn, how long imports and every start-up phase took. With
+``SPICEGUI_PROFILE_STARTUP=exit`` the application also quits then, which is
+what ``benchmarks/startup.py`` uses.
+
+Functions of this module do nothing unless ``enable()`` was called, so marks
+can stay in start-up code.
+"""
+
+from __future__ import print_function
+
+import sys
+import threading
+import timeit
+
+try:
+    import builtins
+except ImportError:  # Python 2
+    import __builtin__ as builtins
+
+ENVIRONMENT_VARIABLE = "SPICEGUI_PROFILE_STARTUP"
+
+
+class StartupProfiler(object):
+    """Times imports and named start-up phases.
+
+    Imports are timed by replacing ``__import__``. Only imports of the main
+    thread loading new modules are recorded, with the time of the modules
+    they import included.
+
+    Attributes:
+        imports: List of (depth, module name, seconds) in import order.
+        marks: List of (phase name, seconds since previous mark).
+    """
+
+    def __init__(self):
+        self.imports = []
+        self.marks = []
+        self.start_time = timeit.default_timer()
+        self._last_mark = self.start_time
+        self._depth = 0
+        self._original_import = None
+        self._main_thread = threading.current_thread()
+
+    def install(self):
+        """Starts timing imports."""
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        """Stops timing imports."""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, *args, **kwargs):
+        if threading.current_thread() is not self._main_thread:
+            return self._original_import(name, *args, **kwargs)
+        module_count = len(sys.modules)
+        index = len(self.imports)
+        self.imports.append(None)  # Placeholder, so nested imports come after
+        self._depth += 1
+        start = timeit.default_timer()
+        try:
+            return self._original_import(name, *args, **kwargs)
+        finally:
+            elapsed = timeit.default_timer() - start
+            self._depth -= 1
+            if len(sys.modules) > module_count:
+                if not name:  # from . import module
+                    fromlist = args[2] if len(args) > 2 else kwargs.get("fromlist")
+                    name = "." + ", .".join(fromlist or ())
+                self.imports[index] = (self._depth, name, elapsed)
+            else:
+                # Nothing was loaded, neither by nested imports
+                del self.imports[index:]
+
+    def mark(self, name):
+        """Ends phase name, which started at the previous mark."""
+        now = timeit.default_timer()
+        self.marks.append((name, now - self._last_mark))
+        self._last_mark = now
+
+    @property
+    def elapsed(self):
+        """Seconds from profiler creation to last mark."""
+        return self._last_mark - self.start_time
+
+    def report(self, min_time=0.001, file=None):
+        """Prints import times and phase times.
+
+        Args:
+            min_time: Imports taking fewer seconds are not listed.
+            file: Text stream. Default is ``sys.stderr``.
+        """
+        if file is None:
+            file = sys.stderr
+        print("Start-up took {0:.1f} ms".format(self.elapsed * 1000), file=file)
+        print("Phases:", file=file)
+        for name, seconds in self.marks:
+            print("{0:>10.1f} ms  {1}".format(seconds * 1000, name), file=file)
+        top_level = sum(seconds for depth, name, seconds in self.imports if depth == 0)
+        print("Imports ({0:.1f} ms, including nested ones):".format(top_level * 1000), file=file)
+        for depth, name, seconds in self.imports:
+            if seconds >= min_time:
+                print("{0:>10.1f} ms  {1}{2}".format(seconds * 1000, "  " * depth, name), file=file)
+
+
+_profiler = None
+_exit_when_done = False
+
+
+def enable(exit_when_done=False):
+    """Starts profiling start-up.
+
+    Args:
+        exit_when_done: If True, application quits once the first window is
+            drawn.
+    """
+    global _profiler, _exit_when_done
+    if _profiler is None:
+        _profiler = StartupProfiler()
+        _profiler.install()
+    _exit_when_done = exit_when_done
+
+
+def mark(name):
+    """Ends start-up phase name, if profiling is enabled."""
+    if _profiler is not None:
+        _profiler.mark(name)
+
+
+def watch_window(window):
+    """Finishes profiling when window is drawn for the first time.
+
+    Args:
+        window: Gtk.Window of the application.
+    """
+    if _profiler is None:
+        return
+
+    def on_draw(widget, context):
+        window.disconnect(handler)
+        finish(window.get_application())
+        return False
+
+    handler = window.connect_after("draw", on_draw)
+
+
+def finish(application=None):
+    """Prints start-up report and stops profiling.
+
+    Args:
+        application: Gtk.Application quit if profiling was enabled with
+            exit_when_done.
+    """
+    global _profiler
+    if _profiler is None:
+        return
+    profiler, _profiler = _profiler, None
+    profiler.mark("first frame")
+    profiler.uninstall()
+    profiler.report()
+    if _exit_when_done and application is not None:
+        from gi.repository import GObject
+
+        GObject.idle_add(application.quit)